@@ -23,3 +23,24 @@ bind = app_config.host + ':' + str(app_config.port)
 # os.cpu_count(): Return the number of CPUs in the system.
 workers = len(os.sched_getaffinity(0)) * 2
 threads = 4
+
+# Share the worker and thread counts with the workers, which can size their
+# database connection pools from them. See DB_POOL_SIZING_MODE in PostgresDBConfig.
+os.environ["GUNICORN_WORKERS"] = str(workers)
+os.environ["GUNICORN_THREADS"] = str(threads)
+
+
+def post_worker_init(worker):
+    # Open database connections once the worker has loaded the app, so that the
+    # first requests after a deploy don't wait for them. See DB_POOL_WARM_UP_CONNECTIONS.
+    # Imported here so that the master process doesn't load the app to read its config.
+    from flask import Flask
+
+    import src.adapters.db as db
+    import src.adapters.db.flask_db as flask_db
+
+    if not isinstance(worker.wsgi, Flask):
+        return
+    db_client = flask_db.get_db(worker.wsgi)
+    if isinstance(db_client, db.PostgresDBClient):
+        db_client.warm_up_pool()
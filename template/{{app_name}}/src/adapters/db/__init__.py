@@ -20,13 +20,37 @@ Usage:
         session.query(...)
         with session.begin():
             session.add(...)
+
+    # Read-only usage, which uses a read replica if DB_REPLICA_HOSTS is configured,
+    # or the primary if no replica is within DB_REPLICA_MAX_LAG_SECONDS
+    with db_client.get_session(read_only=True) as session:
+        session.query(...)
+
+    # asyncio usage
+    async_db_client = db.AsyncPostgresDBClient()
+
+    async with async_db_client.get_session() as session:
+        await session.execute(...)
+        async with session.begin():
+            session.add(...)
 """
 
 # Re-export for convenience
+from src.adapters.db.async_client import AsyncConnection, AsyncDBClient, AsyncSession
 from src.adapters.db.client import Connection, DBClient, Session
+from src.adapters.db.clients.async_postgres_client import AsyncPostgresDBClient
 from src.adapters.db.clients.postgres_client import PostgresDBClient
 
 # Do not import flask_db here, because this module is not dependent on any specific framework.
 # Code can choose to use this module on its own or with the flask_db module depending on needs.
 
-__all__ = ["Connection", "DBClient", "Session", "PostgresDBClient"]
+__all__ = [
+    "AsyncConnection",
+    "AsyncDBClient",
+    "AsyncSession",
+    "AsyncPostgresDBClient",
+    "Connection",
+    "DBClient",
+    "Session",
+    "PostgresDBClient",
+]
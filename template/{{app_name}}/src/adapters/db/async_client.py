@@ -0,0 +1,109 @@
+"""
+This module contains the AsyncDBClient class, which is used to manage database
+connections from asyncio code.
+
+It is the asyncio counterpart of DBClient, returning AsyncConnection and
+AsyncSession objects that are used with await.
+
+For usage information look at the package docstring in __init__.py
+"""
+import abc
+import logging
+from typing import Any
+
+import sqlalchemy.pool as pool
+from sqlalchemy.ext import asyncio as sqlalchemy_asyncio
+
+from src.adapters.db.client import set_local_statement_timeout
+from src.adapters.db.pool_metrics import PoolMetrics
+
+# Re-export the AsyncConnection type that is returned by the get_connection() method
+# to be used for type hints.
+AsyncConnection = sqlalchemy_asyncio.AsyncConnection
+
+# Re-export the AsyncSession type that is returned by the get_session() method
+# to be used for type hints.
+AsyncSession = sqlalchemy_asyncio.AsyncSession
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncDBClient(abc.ABC, metaclass=abc.ABCMeta):
+    """Asyncio database connection manager.
+
+    This class is used to manage database connections for asyncio code.
+    It has methods for getting a new connection or session object.
+
+    A derived class must initialize _engine in the __init__ function.
+    """
+
+    _engine: sqlalchemy_asyncio.AsyncEngine
+    _pool_metrics: PoolMetrics | None = None
+
+    @abc.abstractmethod
+    async def check_db_connection(self) -> None:
+        raise NotImplementedError()
+
+    def get_connection(self) -> AsyncConnection:
+        """Return a new database connection object.
+
+        Use the connection to execute SQL queries without using the ORM.
+
+        Usage:
+            async with db.get_connection() as conn:
+                await conn.execute(...)
+        """
+        return self._engine.connect()
+
+    def get_session(self, statement_timeout_ms: int | None = None) -> AsyncSession:
+        """Return a new session object.
+
+        In general, only one session object should be created per request or task.
+        A session must not be shared between concurrent tasks.
+
+        The session checks out a connection only when it first runs a query.
+
+        If statement_timeout_ms is set, it overrides the statement timeout for
+        each transaction of the session.
+
+        Example:
+            async with db.get_session() as session:
+                async with session.begin():
+                    session.add(...)
+                # session is automatically committed here
+                # or rolled back if an exception is raised
+        """
+        db_session = AsyncSession(bind=self._engine, expire_on_commit=False)
+        if statement_timeout_ms is not None:
+            set_local_statement_timeout(db_session.sync_session, statement_timeout_ms)
+        return db_session
+
+    def has_connection_pool(self) -> bool:
+        """Return whether connections are kept in a pool between sessions."""
+        return not isinstance(self._engine.pool, pool.NullPool)
+
+    async def dispose(self) -> None:
+        """Close the pooled connections.
+
+        Call this before the event loop the connections were made in is closed.
+        """
+        await self._engine.dispose()
+
+    def pool_stats(self) -> dict[str, Any]:
+        """Return a snapshot of the usage of the connection pool.
+
+        See DBClient.pool_stats
+        """
+        conn_pool = self._engine.pool
+        stats: dict[str, Any] = {"status": conn_pool.status()}
+        if isinstance(conn_pool, pool.QueuePool):
+            stats |= {
+                "size": conn_pool.size(),
+                "checked_in": conn_pool.checkedin(),
+                "checked_out": conn_pool.checkedout(),
+                "overflow": conn_pool.overflow(),
+                "timeout_seconds": conn_pool.timeout(),
+            }
+        if self._pool_metrics is not None:
+            stats |= self._pool_metrics.snapshot()
+        return stats
@@ -5,10 +5,15 @@ For usage information look at the package docstring in __init__.py
 """
 import abc
 import logging
+from typing import Any, Callable
 
 import sqlalchemy
+import sqlalchemy.pool as pool
 from sqlalchemy.orm import session
 
+from src.adapters.db.pool_metrics import PoolMetrics
+from src.adapters.db.replicas import ReplicaRouter
+
 # Re-export the Connection type that is returned by the get_connection() method
 # to be used for type hints.
 Connection = sqlalchemy.engine.Connection
@@ -26,31 +31,48 @@ class DBClient(abc.ABC, metaclass=abc.ABCMeta):
     This class is used to manage database connections for the Flask app.
     It has methods for getting a new connection or session object.
 
-    A derived class must initialize _engine in the __init__ function
+    A derived class must initialize _engine in the __init__ function, and
+    can initialize _replica_router to route read-only work to read replicas.
     """
 
     _engine: sqlalchemy.engine.Engine
+    _pool_metrics: PoolMetrics | None = None
+    _replica_router: ReplicaRouter | None = None
 
     @abc.abstractmethod
     def check_db_connection(self) -> None:
         raise NotImplementedError()
 
-    def get_connection(self) -> Connection:
+    def get_connection(self, read_only: bool = False) -> Connection:
         """Return a new database connection object.
 
         Use the connection to execute SQL queries without using the ORM.
 
+        If read_only is True, the connection may be to a read replica.
+
         Usage:
             with db.get_connection() as conn:
                 conn.execute(...)
         """
-        return self._engine.connect()
+        return self._get_engine(read_only).connect()
 
-    def get_session(self) -> Session:
+    def get_session(
+        self, read_only: bool = False, statement_timeout_ms: int | None = None
+    ) -> Session:
         """Return a new session object.
 
         In general, only one session object should be created per request.
 
+        The session checks out a connection only when it first runs a query,
+        so creating a session that ends up unused costs no connection.
+
+        If read_only is True, the session may be bound to a read replica, so
+        it must only be used for queries that do not write. The replica is
+        also chosen when the session first needs a connection.
+
+        If statement_timeout_ms is set, it overrides the statement timeout for
+        each transaction of the session.
+
         If you want to automatically commit or rollback the session, use
         the session.begin() context manager.
         See https://docs.sqlalchemy.org/en/13/orm/session_basics.html#when-do-i-construct-a-session-when-do-i-commit-it-and-when-do-i-close-it
@@ -62,4 +84,72 @@ class DBClient(abc.ABC, metaclass=abc.ABCMeta):
                 # session is automatically committed here
                 # or rolled back if an exception is raised
         """
-        return Session(bind=self._engine, expire_on_commit=False, autocommit=False)
+        db_session: Session
+        if read_only and self._replica_router is not None:
+            db_session = LazyBindSession(
+                lambda: self._get_engine(read_only=True), expire_on_commit=False, autocommit=False
+            )
+        else:
+            db_session = Session(bind=self._engine, expire_on_commit=False, autocommit=False)
+
+        if statement_timeout_ms is not None:
+            set_local_statement_timeout(db_session, statement_timeout_ms)
+        return db_session
+
+    def _get_engine(self, read_only: bool) -> sqlalchemy.engine.Engine:
+        if read_only and self._replica_router is not None:
+            return self._replica_router.get_engine() or self._engine
+        return self._engine
+
+    def pool_stats(self) -> dict[str, Any]:
+        """Return a snapshot of the usage of the connection pool.
+
+        Includes the current state of the pool, and the counters and histograms
+        of the pool metrics if the derived class collects them.
+
+        Example:
+            db.pool_stats()["checked_out"]
+        """
+        conn_pool = self._engine.pool
+        stats: dict[str, Any] = {"status": conn_pool.status()}
+        if isinstance(conn_pool, pool.QueuePool):
+            stats |= {
+                "size": conn_pool.size(),
+                "checked_in": conn_pool.checkedin(),
+                "checked_out": conn_pool.checkedout(),
+                # Negative until the pool has opened pool_size connections
+                "overflow": conn_pool.overflow(),
+                "timeout_seconds": conn_pool.timeout(),
+            }
+        if self._pool_metrics is not None:
+            stats |= self._pool_metrics.snapshot()
+        if self._replica_router is not None:
+            stats["replicas"] = self._replica_router.stats()
+        return stats
+
+
+def set_local_statement_timeout(db_session: Session, statement_timeout_ms: int) -> None:
+    """Set the statement timeout at the start of each transaction of a session."""
+    statement = f"SET LOCAL statement_timeout = {int(statement_timeout_ms)}"
+
+    def after_begin(db_session: Session, transaction: Any, connection: Connection) -> None:
+        connection.exec_driver_sql(statement)
+
+    sqlalchemy.event.listen(db_session, "after_begin", after_begin)
+
+
+class LazyBindSession(Session):
+    """Session that chooses the engine to bind to when it first needs a connection.
+
+    Used for read-only sessions, so that choosing a replica, which may check
+    its replication lag, is skipped when the session is never used.
+    """
+
+    def __init__(self, get_engine: Callable[[], sqlalchemy.engine.Engine], **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self._get_engine = get_engine
+
+    def get_bind(self, *args: Any, **kwargs: Any) -> sqlalchemy.engine.Engine | Connection:
+        if self.bind is None:
+            self.bind = self._get_engine()
+        return super().get_bind(*args, **kwargs)
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+from typing import Any
+
+import psycopg
+import sqlalchemy.pool as pool
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+import src.adapters.db.query_stats as query_stats
+from src.adapters.db.async_client import AsyncDBClient
+from src.adapters.db.clients.postgres_client import (
+    get_connection_parameters,
+    get_pool_parameters,
+    get_server_settings,
+    set_server_settings_per_transaction,
+    verify_ssl,
+)
+from src.adapters.db.clients.postgres_config import PostgresDBConfig, get_db_config
+from src.adapters.db.pool_metrics import PoolMetrics, TimedAsyncAdaptedQueuePool
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncPostgresDBClient(AsyncDBClient):
+    """
+    An implementation of an AsyncDBClient for connecting to a Postgres DB
+    as configured by parameters passed in from the db_config
+
+    Connections are made the same way as by PostgresDBClient, including IAM
+    auth tokens, the search_path and the pool settings, using the asyncio
+    API of psycopg.
+
+    As the connection can't be checked from __init__, DB_CHECK_CONNECTION_ON_INIT
+    is ignored, await check_db_connection() instead.
+
+    Pooled connections belong to the event loop they were made in, so a
+    client that is used from more than one event loop, such as in Flask async
+    views, which run each request in a new event loop, must be created with
+    null_pool=True. null_pool overrides DB_NULL_POOL when it is set.
+    """
+
+    def __init__(
+        self, db_config: PostgresDBConfig | None = None, null_pool: bool | None = None
+    ) -> None:
+        if not db_config:
+            db_config = get_db_config()
+        if null_pool is not None:
+            db_config = db_config.model_copy(update={"null_pool": null_pool})
+        if db_config.replica_hosts:
+            logger.warning("async db client does not use read replicas, ignoring them")
+        self._pool_metrics = PoolMetrics()
+        self._engine = self._configure_engine(db_config, self._pool_metrics)
+
+    def _configure_engine(
+        self, db_config: PostgresDBConfig, pool_metrics: PoolMetrics
+    ) -> AsyncEngine:
+        # As for PostgresDBClient, the connection parameters are computed for
+        # each connection, so that a fresh IAM auth token can be used.
+        # Getting a new token may create a boto3 client and resolve AWS
+        # credentials over the network, and waits on the token cache's lock,
+        # so it is done in a thread to not block the event loop.
+        async def get_conn() -> Any:
+            connection_parameters = await asyncio.to_thread(get_connection_parameters, db_config)
+            return await psycopg.AsyncConnection.connect(**connection_parameters)
+
+        pool_arguments: dict[str, Any]
+        if db_config.null_pool:
+            pool_arguments = dict(poolclass=pool.NullPool, pool_pre_ping=db_config.pool_pre_ping)
+        else:
+            pool_parameters = get_pool_parameters(db_config)
+            pool_arguments = dict(
+                poolclass=TimedAsyncAdaptedQueuePool,
+                pool_size=pool_parameters["pool_size"],
+                max_overflow=pool_parameters["max_overflow"],
+                pool_timeout=pool_parameters["timeout"],
+                pool_recycle=pool_parameters["recycle"],
+                pool_pre_ping=pool_parameters["pre_ping"],
+            )
+
+        # The URL only needs to specify the dialect, since async_creator
+        # makes the actual connections.
+        engine = create_async_engine(
+            "postgresql+psycopg://",
+            async_creator=get_conn,
+            hide_parameters=db_config.hide_sql_parameter_logs,
+            **pool_arguments,
+        )
+
+        # Event listeners are added to the sync engine that the AsyncEngine proxies
+        conn_pool = engine.sync_engine.pool
+        if isinstance(conn_pool, TimedAsyncAdaptedQueuePool):
+            conn_pool.pool_metrics = pool_metrics
+        pool_metrics.listen(conn_pool)
+
+        if db_config.pgbouncer_transaction_mode:
+            set_server_settings_per_transaction(engine.sync_engine, get_server_settings(db_config))
+
+        query_stats.listen(engine.sync_engine)
+
+        return engine
+
+    async def check_db_connection(self) -> None:
+        async with self.get_connection() as conn:
+            raw_connection = await conn.get_raw_connection()
+            conn_info = raw_connection.driver_connection.info  # type: ignore
+
+            logger.info(
+                "connected to postgres db",
+                extra={
+                    "dbname": conn_info.dbname,
+                    "user": conn_info.user,
+                    "host": conn_info.host,
+                    "port": conn_info.port,
+                    "options": conn_info.options,
+                    "dsn_parameters": conn_info.dsn,
+                    "protocol_version": conn_info.pgconn.protocol_version,
+                    "server_version": conn_info.server_version,
+                },
+            )
+            verify_ssl(conn_info)
@@ -1,13 +1,26 @@
+import itertools
 import logging
-from typing import Any
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable
 
 import boto3
 import psycopg
 import sqlalchemy
 import sqlalchemy.pool as pool
 
+import src.adapters.db.query_stats as query_stats
 from src.adapters.db.client import DBClient
-from src.adapters.db.clients.postgres_config import PostgresDBConfig, get_db_config
+from src.adapters.db.clients.postgres_config import (
+    PoolSizingMode,
+    PostgresDBConfig,
+    get_db_config,
+)
+from src.adapters.db.pool_metrics import PoolMetrics, TimedQueuePool
+from src.adapters.db.replicas import Replica, ReplicaRouter
 
 logger = logging.getLogger(__name__)
 
@@ -21,12 +34,36 @@ class PostgresDBClient(DBClient):
     def __init__(self, db_config: PostgresDBConfig | None = None) -> None:
         if not db_config:
             db_config = get_db_config()
-        self._engine = self._configure_engine(db_config)
+        self._db_config = db_config
+        self._pool_metrics = PoolMetrics()
+        self._engine = self._configure_engine(db_config, self._pool_metrics)
+
+        replica_hosts = [
+            host.strip() for host in db_config.replica_hosts.split(",") if host.strip()
+        ]
+        if replica_hosts:
+            replicas = [
+                Replica(
+                    host,
+                    self._configure_engine(
+                        db_config.model_copy(update={"host": host}), PoolMetrics()
+                    ),
+                )
+                for host in replica_hosts
+            ]
+            self._replica_router = ReplicaRouter(
+                replicas,
+                balancing=db_config.replica_balancing,
+                max_lag_seconds=db_config.replica_max_lag_seconds,
+                lag_check_interval_seconds=db_config.replica_lag_check_interval_seconds,
+            )
 
         if db_config.check_connection_on_init:
             self.check_db_connection()
 
-    def _configure_engine(self, db_config: PostgresDBConfig) -> sqlalchemy.engine.Engine:
+    def _configure_engine(
+        self, db_config: PostgresDBConfig, pool_metrics: PoolMetrics
+    ) -> sqlalchemy.engine.Engine:
         # We want to be able to control the connection parameters for each
         # connection because for IAM authentication with RDS, short-lived tokens are
         # used as the password, and so we potentially need to generate a fresh token
@@ -37,13 +74,20 @@ class PostgresDBClient(DBClient):
         def get_conn() -> Any:
             return psycopg.connect(**get_connection_parameters(db_config))
 
-        conn_pool = pool.QueuePool(get_conn, max_overflow=10, pool_size=20)
+        conn_pool: pool.Pool
+        if db_config.null_pool:
+            conn_pool = pool.NullPool(get_conn, pre_ping=db_config.pool_pre_ping)
+        else:
+            conn_pool = TimedQueuePool(
+                get_conn, pool_metrics=pool_metrics, **get_pool_parameters(db_config)
+            )
+        pool_metrics.listen(conn_pool)
 
         # The URL only needs to specify the dialect, since the connection pool
         # handles the actual connections.
         #
         # (a SQLAlchemy Engine represents a Dialect+Pool)
-        return sqlalchemy.create_engine(
+        engine = sqlalchemy.create_engine(
             "postgresql+psycopg://",
             pool=conn_pool,
             hide_parameters=db_config.hide_sql_parameter_logs,
@@ -51,6 +95,13 @@ class PostgresDBClient(DBClient):
             # json_serializer=lambda o: json.dumps(o, default=pydantic.json.pydantic_encoder),
         )
 
+        if db_config.pgbouncer_transaction_mode:
+            set_server_settings_per_transaction(engine, get_server_settings(db_config))
+
+        query_stats.listen(engine)
+
+        return engine
+
     def check_db_connection(self) -> None:
         with self.get_connection() as conn:
             conn_info = conn.connection.dbapi_connection.info  # type: ignore
@@ -74,12 +125,103 @@ class PostgresDBClient(DBClient):
             # if check_migrations_current:
             #     have_all_migrations_run(engine)
 
+    def warm_up_pool(self, connection_count: int | None = None) -> int:
+        """Open connections of the pools in parallel, and return how many were opened.
+
+        Opens DB_POOL_WARM_UP_CONNECTIONS connections unless connection_count is
+        given, at most the pool size, in the pool of the primary and in the pool
+        of each read replica, so that the first requests of a new process reuse
+        them instead of waiting for connection setup. Connections that fail to
+        open are logged rather than raised, as requests can still open them.
+
+        Called when a gunicorn worker starts, see gunicorn.conf.py
+        """
+        if connection_count is None:
+            connection_count = self._db_config.pool_warm_up_connections
+
+        pools = [(self._db_config, self._engine)]
+        if self._replica_router is not None:
+            pools += [
+                (self._db_config.model_copy(update={"host": replica.name}), replica.engine)
+                for replica in self._replica_router.replicas
+            ]
+
+        # Warm up the pools at the same time, so that replicas do not add to
+        # the time it takes for a worker to start
+        with ThreadPoolExecutor(max_workers=len(pools)) as executor:
+            futures = [
+                executor.submit(warm_up_engine_pool, db_config, engine, connection_count)
+                for db_config, engine in pools
+            ]
+            return sum(future.result() for future in futures)
+
     def get_raw_connection(self) -> sqlalchemy.PoolProxiedConnection:
         # For low-level operations not supported by SQLAlchemy.
         # Unless you specifically need this, you should use get_connection().
         return self._engine.raw_connection()
 
 
+def warm_up_engine_pool(
+    db_config: PostgresDBConfig, engine: sqlalchemy.engine.Engine, connection_count: int
+) -> int:
+    """Open connection_count connections of the pool of an engine in parallel,
+    at most the pool size, and return how many were opened.
+
+    see PostgresDBClient.warm_up_pool
+    """
+    conn_pool = engine.pool
+    if not isinstance(conn_pool, pool.QueuePool):
+        logger.info(
+            "db connection pool warm-up skipped, connections are not pooled",
+            extra={"db.host": db_config.host},
+        )
+        return 0
+    connection_count = min(connection_count, conn_pool.size())
+    if connection_count <= 0:
+        return 0
+
+    start_time = time.monotonic()
+    # Get an IAM auth token once, rather than once for each connection
+    try:
+        get_connection_parameters(db_config)
+    except Exception:
+        logger.exception(
+            "failed to get db connection parameters during pool warm-up",
+            extra={"db.host": db_config.host},
+        )
+        return 0
+
+    # Hold every connection until all are open, so that each thread opens
+    # a new connection instead of checking out one opened by another thread
+    connections: list[sqlalchemy.PoolProxiedConnection] = []
+    failure_count = 0
+    with ThreadPoolExecutor(max_workers=connection_count) as executor:
+        futures = [executor.submit(engine.raw_connection) for _ in range(connection_count)]
+        for future in futures:
+            try:
+                connections.append(future.result())
+            except Exception:
+                failure_count += 1
+                logger.exception(
+                    "failed to open db connection during pool warm-up",
+                    extra={"db.host": db_config.host},
+                )
+
+    for connection in connections:
+        connection.close()
+
+    logger.info(
+        "warmed up db connection pool",
+        extra={
+            "db.host": db_config.host,
+            "db.warm_up_connections": len(connections),
+            "db.warm_up_failures": failure_count,
+            "db.warm_up_time_ms": round((time.monotonic() - start_time) * 1000, 3),
+        },
+    )
+    return len(connections)
+
+
 def get_connection_parameters(db_config: PostgresDBConfig) -> dict[str, Any]:
     connect_args: dict[str, Any] = {}
 
@@ -87,25 +229,105 @@ def get_connection_parameters(db_config: PostgresDBConfig) -> dict[str, Any]:
         assert (
             db_config.aws_region is not None
         ), "AWS region needs to be configured for DB IAM auth if DB password is not configured"
-        password = generate_iam_auth_token(
+        password = iam_auth_token_cache.get_token(
             db_config.aws_region, db_config.host, db_config.port, db_config.username
         )
     else:
         password = db_config.password
 
+    if db_config.pgbouncer_transaction_mode:
+        # PgBouncer rejects the options startup parameter, so the server settings
+        # are set for each transaction instead, see set_server_settings_per_transaction.
+        # Consecutive transactions may run on different server connections, so
+        # server-side prepared statements can't be used.
+        connect_args["prepare_threshold"] = None
+    else:
+        connect_args["options"] = " ".join(
+            f"-c {name}={value}" for name, value in get_server_settings(db_config).items()
+        )
+
     return dict(
         host=db_config.host,
         dbname=db_config.name,
         user=db_config.username,
         password=password,
         port=db_config.port,
-        options=f"-c search_path={db_config.db_schema}",
         connect_timeout=10,
         sslmode=db_config.ssl_mode,
         **connect_args,
     )
 
 
+def get_server_settings(db_config: PostgresDBConfig) -> dict[str, str]:
+    """Get the Postgres settings to apply to each connection or transaction."""
+    settings = {"search_path": db_config.db_schema}
+    if db_config.statement_timeout_ms is not None:
+        settings["statement_timeout"] = str(db_config.statement_timeout_ms)
+    if db_config.idle_in_transaction_session_timeout_ms is not None:
+        settings["idle_in_transaction_session_timeout"] = str(
+            db_config.idle_in_transaction_session_timeout_ms
+        )
+    return settings
+
+
+def set_server_settings_per_transaction(
+    engine: sqlalchemy.engine.Engine, settings: dict[str, str]
+) -> None:
+    """Apply Postgres settings at the start of each transaction of an engine.
+
+    This only applies to connections from get_connection() and get_session().
+    Raw connections from get_raw_connection() need to set the search_path
+    themselves, or qualify table names with the schema.
+    """
+    # set_config with is_local true is equivalent to SET LOCAL
+    statement = "SELECT " + ", ".join(["set_config(%s, %s, true)"] * len(settings))
+    parameters = tuple(itertools.chain.from_iterable(settings.items()))
+
+    def set_server_settings(conn: sqlalchemy.Connection) -> None:
+        conn.exec_driver_sql(statement, parameters)
+
+    sqlalchemy.event.listen(engine, "begin", set_server_settings)
+
+
+def get_pool_parameters(db_config: PostgresDBConfig) -> dict[str, Any]:
+    """Get the QueuePool arguments for the pool settings of a database config.
+
+    With the gunicorn pool sizing mode, each worker keeps one connection for
+    each of its threads, as each thread handles one request at a time. If
+    max_connections is configured, it is split evenly between the workers,
+    with any connections left over after one per thread allowed as overflow.
+    The total number of connections of a server is then bounded by
+    max_connections, or otherwise by the number of workers times threads.
+    """
+    pool_size = db_config.pool_size
+    max_overflow = db_config.pool_max_overflow
+
+    if db_config.pool_sizing_mode == PoolSizingMode.GUNICORN:
+        if db_config.gunicorn_workers is None or db_config.gunicorn_threads is None:
+            logger.warning(
+                "gunicorn worker and thread counts are not set, using the configured pool size"
+            )
+        else:
+            pool_size = db_config.gunicorn_threads
+            max_overflow = 0
+            if db_config.max_connections is not None:
+                connections_per_worker = max(
+                    db_config.max_connections // db_config.gunicorn_workers, 1
+                )
+                pool_size = min(pool_size, connections_per_worker)
+                max_overflow = connections_per_worker - pool_size
+
+    pool_parameters = dict(
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        timeout=db_config.pool_timeout,
+        recycle=db_config.pool_recycle,
+        pre_ping=db_config.pool_pre_ping,
+    )
+    logger.info("configured db connection pool", extra=pool_parameters)
+    return pool_parameters
+
+
 def generate_iam_auth_token(aws_region: str, host: str, port: int, user: str) -> str:
     logger.info(
         "generating db iam auth token",
@@ -116,13 +338,94 @@ def generate_iam_auth_token(aws_region: str, host: str, port: int, user: str) ->
             "port": port,
         },
     )
-    client = boto3.client("rds", region_name=aws_region)
+    client = get_rds_client(aws_region)
     token = client.generate_db_auth_token(
         DBHostname=host, Port=port, DBUsername=user, Region=aws_region
     )
     return token
 
 
+_rds_clients: dict[tuple[int, str], Any] = {}
+_rds_clients_lock = threading.Lock()
+
+
+def get_rds_client(aws_region: str) -> Any:
+    """Get the RDS client of this process for a region.
+
+    Clients are not shared with forked processes, such as gunicorn workers.
+    """
+    key = (os.getpid(), aws_region)
+    with _rds_clients_lock:
+        if key not in _rds_clients:
+            _rds_clients[key] = boto3.client("rds", region_name=aws_region)
+        return _rds_clients[key]
+
+
+# IAM auth tokens are valid for 15 minutes. A cached token is refreshed in the
+# background once it is older than IAM_AUTH_TOKEN_REFRESH_SECONDS, and is no
+# longer used once it is older than IAM_AUTH_TOKEN_EXPIRY_SECONDS.
+IAM_AUTH_TOKEN_REFRESH_SECONDS = 10 * 60
+IAM_AUTH_TOKEN_EXPIRY_SECONDS = 14 * 60
+
+
+@dataclass
+class _CachedToken:
+    token: str
+    created_at: float
+    refreshing: bool = False
+
+
+class IamAuthTokenCache:
+    """Cache of IAM auth tokens for each (region, host, port, user)."""
+
+    def __init__(
+        self,
+        generate_token: Callable[[str, str, int, str], str] = generate_iam_auth_token,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._generate_token = generate_token
+        self._clock = clock
+        self._tokens: dict[tuple[str, str, int, str], _CachedToken] = {}
+        self._lock = threading.Lock()
+
+    def get_token(self, aws_region: str, host: str, port: int, user: str) -> str:
+        key = (aws_region, host, port, user)
+        with self._lock:
+            cached_token = self._tokens.get(key)
+            if cached_token is not None:
+                age = self._clock() - cached_token.created_at
+                if age < IAM_AUTH_TOKEN_REFRESH_SECONDS:
+                    return cached_token.token
+                if age < IAM_AUTH_TOKEN_EXPIRY_SECONDS:
+                    if not cached_token.refreshing:
+                        cached_token.refreshing = True
+                        threading.Thread(
+                            target=self._refresh_token, args=(key,), daemon=True
+                        ).start()
+                    return cached_token.token
+
+        # Generate a token while holding no lock, as several threads generating
+        # a token for the same key is harmless
+        return self._refresh_token(key)
+
+    def _refresh_token(self, key: tuple[str, str, int, str]) -> str:
+        try:
+            token = self._generate_token(*key)
+        except Exception:
+            with self._lock:
+                if key in self._tokens:
+                    self._tokens[key].refreshing = False
+            logger.exception("failed to generate db iam auth token")
+            raise
+
+        with self._lock:
+            self._tokens[key] = _CachedToken(token, self._clock())
+        return token
+
+
+iam_auth_token_cache = IamAuthTokenCache()
+
+
 def verify_ssl(connection_info: Any) -> None:
     """Verify that the database connection is encrypted and log a warning if not."""
     if connection_info.pgconn.ssl_in_use:
@@ -1,13 +1,23 @@
 import logging
+from enum import StrEnum
 from typing import Optional
 
 from pydantic import Field
 
+from src.adapters.db.replicas import ReplicaBalancing
 from src.util.env_config import PydanticBaseEnvConfig
 
 logger = logging.getLogger(__name__)
 
 
+class PoolSizingMode(StrEnum):
+    # Use the configured pool size and max overflow
+    FIXED = "fixed"
+    # Derive the pool size and max overflow from the gunicorn worker and
+    # thread counts, see get_pool_parameters
+    GUNICORN = "gunicorn"
+
+
 class PostgresDBConfig(PydanticBaseEnvConfig):
     check_connection_on_init: bool = Field(True, alias="DB_CHECK_CONNECTION_ON_INIT")
     aws_region: Optional[str] = Field(None, alias="AWS_REGION")
@@ -19,6 +29,53 @@ class PostgresDBConfig(PydanticBaseEnvConfig):
     port: int = Field(5432, alias="DB_PORT")
     hide_sql_parameter_logs: bool = Field(True, alias="HIDE_SQL_PARAMETER_LOGS")
     ssl_mode: str = Field("require", alias="DB_SSL_MODE")
+    # Default limits in milliseconds on how long a statement can run and how long a
+    # transaction can sit idle, or None for the server defaults. Routes can set a
+    # different statement timeout with flask_db.with_db_session(statement_timeout_ms=...)
+    statement_timeout_ms: Optional[int] = Field(None, alias="DB_STATEMENT_TIMEOUT_MS")
+    idle_in_transaction_session_timeout_ms: Optional[int] = Field(
+        None, alias="DB_IDLE_IN_TRANSACTION_SESSION_TIMEOUT_MS"
+    )
+
+    # Whether the database is reached through PgBouncer in transaction pooling mode,
+    # which disables prepared statements and sets the search_path per transaction
+    pgbouncer_transaction_mode: bool = Field(False, alias="DB_PGBOUNCER_TRANSACTION_MODE")
+    # Whether to open a new connection for each checkout rather than keep a pool,
+    # such as when PgBouncer does the pooling. The pool size settings are then ignored.
+    null_pool: bool = Field(False, alias="DB_NULL_POOL")
+
+    # Connection pool settings, see https://docs.sqlalchemy.org/en/20/core/pooling.html
+    pool_sizing_mode: PoolSizingMode = Field(PoolSizingMode.FIXED, alias="DB_POOL_SIZING_MODE")
+    pool_size: int = Field(20, alias="DB_POOL_SIZE")
+    pool_max_overflow: int = Field(10, alias="DB_POOL_MAX_OVERFLOW")
+    # Seconds to wait for a connection from the pool before giving up
+    pool_timeout: float = Field(30, alias="DB_POOL_TIMEOUT")
+    # Seconds after which a connection is replaced, or -1 to never replace connections
+    pool_recycle: int = Field(-1, alias="DB_POOL_RECYCLE")
+    # Whether to test each connection before checking it out of the pool
+    pool_pre_ping: bool = Field(False, alias="DB_POOL_PRE_PING")
+    # Connections to open in parallel when a gunicorn worker starts, in the pool of
+    # the primary and of each replica, so that the first requests don't wait for
+    # connection setup, see warm_up_pool. At most the pool size are kept open.
+    pool_warm_up_connections: int = Field(0, alias="DB_POOL_WARM_UP_CONNECTIONS")
+    # The most connections that all gunicorn workers of one server may open,
+    # with the gunicorn pool sizing mode. Set to the database max_connections
+    # divided by the number of servers, less a margin for other clients.
+    max_connections: Optional[int] = Field(None, alias="DB_MAX_CONNECTIONS")
+    # Comma separated hosts of read replicas for read-only sessions and connections.
+    # The replicas use the same name, port, credentials and pool settings as the primary.
+    replica_hosts: str = Field("", alias="DB_REPLICA_HOSTS")
+    replica_balancing: ReplicaBalancing = Field(
+        ReplicaBalancing.ROUND_ROBIN, alias="DB_REPLICA_BALANCING"
+    )
+    # Replicas lagging the primary by more than this are not used, or None to not check lag
+    replica_max_lag_seconds: Optional[float] = Field(30, alias="DB_REPLICA_MAX_LAG_SECONDS")
+    replica_lag_check_interval_seconds: float = Field(
+        5, alias="DB_REPLICA_LAG_CHECK_INTERVAL_SECONDS"
+    )
+    # Set by gunicorn.conf.py when running under gunicorn
+    gunicorn_workers: Optional[int] = Field(None, alias="GUNICORN_WORKERS")
+    gunicorn_threads: Optional[int] = Field(None, alias="GUNICORN_THREADS")
 
 
 def get_db_config() -> PostgresDBConfig:
@@ -34,6 +91,14 @@ def get_db_config() -> PostgresDBConfig:
             "db_schema": db_config.db_schema,
             "port": db_config.port,
             "hide_sql_parameter_logs": db_config.hide_sql_parameter_logs,
+            "statement_timeout_ms": db_config.statement_timeout_ms,
+            "idle_in_transaction_session_timeout_ms": (
+                db_config.idle_in_transaction_session_timeout_ms
+            ),
+            "pgbouncer_transaction_mode": db_config.pgbouncer_transaction_mode,
+            "null_pool": db_config.null_pool,
+            "pool_sizing_mode": db_config.pool_sizing_mode,
+            "replica_hosts": db_config.replica_hosts,
         },
     )
 
@@ -38,20 +38,40 @@ Example:
         db_client = flask_db.get_db(current_app)
         # db_client.get_connection() or db_client.get_session()
 """
+import contextlib
+import logging
 from functools import wraps
-from typing import Callable, Concatenate, ParamSpec, TypeVar
-
-from flask import Flask, current_app
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Concatenate,
+    Coroutine,
+    Iterator,
+    ParamSpec,
+    TypeVar,
+)
+
+import psycopg.errors
+import sqlalchemy
+from flask import Flask, Response, current_app
+from werkzeug.exceptions import GatewayTimeout, ServiceUnavailable
 
 import src.adapters.db as db
+import src.adapters.db.query_stats as query_stats
+import src.logging.flask_logger as flask_logger
+from src.adapters.db.async_client import AsyncDBClient
 from src.adapters.db.client import DBClient
 
+logger = logging.getLogger(__name__)
+
 _FLASK_EXTENSION_KEY_PREFIX = "db"
+_QUERY_STATS_EXTENSION_KEY = "db_query_stats"
 _DEFAULT_CLIENT_NAME = "default"
 
 
 def register_db_client(
-    db_client: DBClient, app: Flask, client_name: str = _DEFAULT_CLIENT_NAME
+    db_client: DBClient | AsyncDBClient, app: Flask, client_name: str = _DEFAULT_CLIENT_NAME
 ) -> None:
     """Initialize the Flask app.
 
@@ -61,11 +81,38 @@ def register_db_client(
     If you use multiple DB clients, you can differentiate them by
     specifying a client_name.
 
+    Also adds the number and duration of the queries of each request to
+    the request logs, see src.adapters.db.query_stats.
+
+    Flask runs each async view in a new event loop, so an AsyncDBClient must
+    not pool connections, which can't be shared between event loops. Raises
+    ValueError if it does.
+
     see get_db
     """
+    if isinstance(db_client, AsyncDBClient) and db_client.has_connection_pool():
+        raise ValueError(
+            "async db clients used by Flask must not pool connections, "
+            "create them with null_pool=True"
+        )
+
     flask_extension_key = f"{_FLASK_EXTENSION_KEY_PREFIX}{client_name}"
     app.extensions[flask_extension_key] = db_client
 
+    # Query stats cover every DB client, so only register the handlers once
+    if _QUERY_STATS_EXTENSION_KEY not in app.extensions:
+        app.extensions[_QUERY_STATS_EXTENSION_KEY] = True
+        repeated_statement_warning_threshold = (
+            query_stats.QueryStatsConfig().repeated_statement_warning_threshold
+        )
+
+        def start_query_stats() -> None:
+            query_stats.start_query_stats(repeated_statement_warning_threshold)
+
+        app.before_request(start_query_stats)
+        app.after_request(_log_query_stats)
+        app.teardown_request(_stop_query_stats)
+
 
 def get_db(app: Flask, client_name: str = _DEFAULT_CLIENT_NAME) -> DBClient:
     """Get the database connection for the given Flask app.
@@ -86,12 +133,25 @@ def get_db(app: Flask, client_name: str = _DEFAULT_CLIENT_NAME) -> DBClient:
     return app.extensions[flask_extension_key]
 
 
+def get_async_db(app: Flask, client_name: str = _DEFAULT_CLIENT_NAME) -> AsyncDBClient:
+    """Get the async database client for the given Flask app.
+
+    see get_db
+    """
+    db_client = app.extensions[f"{_FLASK_EXTENSION_KEY_PREFIX}{client_name}"]
+    assert isinstance(db_client, AsyncDBClient), f"db client {client_name} is not async"
+    return db_client
+
+
 P = ParamSpec("P")
 T = TypeVar("T")
 
 
 def with_db_session(
-    *, client_name: str = _DEFAULT_CLIENT_NAME
+    *,
+    client_name: str = _DEFAULT_CLIENT_NAME,
+    read_only: bool = False,
+    statement_timeout_ms: int | None = None,
 ) -> Callable[[Callable[Concatenate[db.Session, P], T]], Callable[P, T]]:
     """Decorator for functions that need a database session.
 
@@ -99,6 +159,15 @@ def with_db_session(
     as the first positional argument. A transaction is not started automatically.
     To start a transaction use db_session.begin()
 
+    With read_only=True, the session may be bound to a read replica if the
+    database client has any, so use it only for functions that do not write.
+
+    With statement_timeout_ms, statements of the session are cancelled after
+    that many milliseconds instead of after the configured DB_STATEMENT_TIMEOUT_MS.
+    A cancelled statement is reported as a 504 Gateway Timeout, and a closed
+    idle transaction or a timeout waiting for a pooled connection as a
+    503 Service Unavailable.
+
     Usage:
         @with_db_session()
         def foo(db_session: db.Session):
@@ -111,14 +180,114 @@ def with_db_session(
         @with_db_session(client_name="legacy_db")
         def fiz(db_session: db.Session, x, y, z):
             ...
+
+        @with_db_session(read_only=True, statement_timeout_ms=5000)
+        def buzz(db_session: db.Session):
+            ...
     """
 
     def decorator(f: Callable[Concatenate[db.Session, P], T]) -> Callable[P, T]:
         @wraps(f)
         def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
-            with get_db(current_app, client_name=client_name).get_session() as session:
-                return f(session, *args, **kwargs)
+            db_client = get_db(current_app, client_name=client_name)
+            with handle_db_timeouts(statement_timeout_ms):
+                with db_client.get_session(
+                    read_only=read_only, statement_timeout_ms=statement_timeout_ms
+                ) as session:
+                    return f(session, *args, **kwargs)
 
         return wrapper
 
     return decorator
+
+
+def with_async_db_session(
+    *,
+    client_name: str = _DEFAULT_CLIENT_NAME,
+    statement_timeout_ms: int | None = None,
+) -> Callable[
+    [Callable[Concatenate[db.AsyncSession, P], Awaitable[T]]], Callable[P, Coroutine[Any, Any, T]]
+]:
+    """Decorator for async functions that need an async database session.
+
+    The async counterpart of with_db_session, for async view functions, which
+    Flask runs with asgiref in a new event loop for each request. The client
+    must be an AsyncDBClient registered with register_db_client, which does
+    not pool connections, so each session makes its own connection. Timeouts
+    are reported the same way as by with_db_session.
+
+    Usage:
+        flask_db.register_db_client(
+            db.AsyncPostgresDBClient(null_pool=True), app, client_name="async"
+        )
+
+        @app.route("/foo")
+        @with_async_db_session(client_name="async")
+        async def foo(db_session: db.AsyncSession):
+            async with db_session.begin():
+                ...
+    """
+
+    def decorator(
+        f: Callable[Concatenate[db.AsyncSession, P], Awaitable[T]]
+    ) -> Callable[P, Coroutine[Any, Any, T]]:
+        @wraps(f)
+        async def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
+            db_client = get_async_db(current_app, client_name=client_name)
+            with handle_db_timeouts(statement_timeout_ms):
+                async with db_client.get_session(
+                    statement_timeout_ms=statement_timeout_ms
+                ) as session:
+                    return await f(session, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+@contextlib.contextmanager
+def handle_db_timeouts(statement_timeout_ms: int | None = None) -> Iterator[None]:
+    """Turn database timeout errors into HTTP errors.
+
+    A cancelled statement is raised as a 504 Gateway Timeout, and a closed
+    idle transaction or a timeout waiting for a pooled connection as a
+    503 Service Unavailable.
+    """
+    try:
+        yield
+    except sqlalchemy.exc.TimeoutError as e:
+        log_db_timeout("timed out waiting for a database connection", e)
+        raise ServiceUnavailable() from e
+    except sqlalchemy.exc.DBAPIError as e:
+        if isinstance(e.orig, psycopg.errors.QueryCanceled):
+            log_db_timeout("database statement timed out", e, statement_timeout_ms)
+            raise GatewayTimeout() from e
+        if isinstance(e.orig, psycopg.errors.IdleInTransactionSessionTimeout):
+            log_db_timeout("database transaction idle timeout", e)
+            raise ServiceUnavailable() from e
+        raise
+
+
+def log_db_timeout(
+    message: str, error: sqlalchemy.exc.SQLAlchemyError, statement_timeout_ms: int | None = None
+) -> None:
+    orig = getattr(error, "orig", None)
+    logger.warning(
+        message,
+        extra={
+            "db.error_type": type(orig or error).__name__,
+            "db.sqlstate": getattr(orig, "sqlstate", None),
+            "db.statement_timeout_ms": statement_timeout_ms,
+        },
+    )
+
+
+def _log_query_stats(response: Response) -> Response:
+    stats = query_stats.get_query_stats()
+    if stats is not None:
+        flask_logger.add_extra_data_to_current_request_logs(stats.get_log_data())
+    return response
+
+
+def _stop_query_stats(error: BaseException | None) -> None:
+    query_stats.stop_query_stats()
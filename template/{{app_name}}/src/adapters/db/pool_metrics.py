@@ -0,0 +1,186 @@
+"""
+This module contains the PoolMetrics class, which collects usage metrics of
+a SQLAlchemy connection pool using pool event listeners.
+
+Usage:
+    pool_metrics = PoolMetrics()
+    pool_metrics.listen(engine.pool)
+    ...
+    pool_metrics.snapshot()
+
+The checkout wait time is measured by TimedQueuePool, or by
+TimedAsyncAdaptedQueuePool for an AsyncEngine, as SQLAlchemy has no pool
+event for when a checkout starts.
+"""
+import bisect
+import threading
+import time
+from typing import Any, cast
+
+import sqlalchemy
+import sqlalchemy.pool as pool
+from sqlalchemy.pool import ConnectionPoolEntry, PoolProxiedConnection
+
+# Upper bounds in milliseconds of the histogram buckets. Durations greater
+# than the last bound are counted in an extra overflow bucket.
+DEFAULT_BUCKET_BOUNDS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Key of the checkout time stored in the info dict of a pooled connection
+_CHECKOUT_TIME_KEY = "pool_metrics_checkout_time"
+
+
+class Histogram:
+    """Histogram of durations in milliseconds with fixed buckets.
+
+    Not thread safe, PoolMetrics guards its histograms with a lock.
+    """
+
+    def __init__(self, bucket_bounds_ms: tuple[float, ...] = DEFAULT_BUCKET_BOUNDS_MS) -> None:
+        self.bucket_bounds_ms = bucket_bounds_ms
+        self.bucket_counts = [0] * (len(bucket_bounds_ms) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, duration_ms: float) -> None:
+        self.bucket_counts[bisect.bisect_left(self.bucket_bounds_ms, duration_ms)] += 1
+        self.count += 1
+        self.sum_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+
+    def snapshot(self) -> dict[str, Any]:
+        bucket_labels = [f"le_{bound}ms" for bound in self.bucket_bounds_ms] + ["overflow"]
+        return {
+            "count": self.count,
+            "mean_ms": round(self.sum_ms / self.count, 3) if self.count else None,
+            "max_ms": round(self.max_ms, 3),
+            "buckets": dict(zip(bucket_labels, self.bucket_counts)),
+        }
+
+
+class PoolMetrics:
+    """Counters and histograms of the usage of a connection pool."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.invalidations = 0
+        self.soft_invalidations = 0
+        self.checkout_wait = Histogram()
+        self.time_held = Histogram()
+        # The creation time of each open connection, by connection record
+        self._connection_start_times: dict[int, float] = {}
+
+    def listen(self, conn_pool: pool.Pool) -> None:
+        """Add the event listeners that collect the metrics to a pool."""
+        sqlalchemy.event.listen(conn_pool, "connect", self._on_connect)
+        sqlalchemy.event.listen(conn_pool, "checkout", self._on_checkout)
+        sqlalchemy.event.listen(conn_pool, "checkin", self._on_checkin)
+        sqlalchemy.event.listen(conn_pool, "invalidate", self._on_invalidate)
+        sqlalchemy.event.listen(conn_pool, "soft_invalidate", self._on_soft_invalidate)
+        sqlalchemy.event.listen(conn_pool, "close", self._on_close)
+        sqlalchemy.event.listen(conn_pool, "detach", self._on_close)
+
+    def observe_checkout_wait(self, duration_ms: float, timed_out: bool = False) -> None:
+        with self._lock:
+            self.checkout_wait.observe(duration_ms)
+            if timed_out:
+                self.checkout_timeouts += 1
+
+    def snapshot(self) -> dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            connection_ages = [now - start for start in self._connection_start_times.values()]
+            return {
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkout_timeouts": self.checkout_timeouts,
+                "invalidations": self.invalidations,
+                "soft_invalidations": self.soft_invalidations,
+                "open_connections": len(connection_ages),
+                "max_connection_age_seconds": (
+                    round(max(connection_ages), 3) if connection_ages else None
+                ),
+                "checkout_wait": self.checkout_wait.snapshot(),
+                "time_held": self.time_held.snapshot(),
+            }
+
+    def _on_connect(self, dbapi_connection: Any, connection_record: ConnectionPoolEntry) -> None:
+        with self._lock:
+            self.connects += 1
+            self._connection_start_times[id(connection_record)] = time.monotonic()
+
+    def _on_checkout(
+        self,
+        dbapi_connection: Any,
+        connection_record: ConnectionPoolEntry,
+        connection_proxy: PoolProxiedConnection,
+    ) -> None:
+        connection_record.info[_CHECKOUT_TIME_KEY] = time.monotonic()
+        with self._lock:
+            self.checkouts += 1
+
+    def _on_checkin(self, dbapi_connection: Any, connection_record: ConnectionPoolEntry) -> None:
+        checkout_time = connection_record.info.pop(_CHECKOUT_TIME_KEY, None)
+        if checkout_time is None:
+            return
+        with self._lock:
+            self.time_held.observe((time.monotonic() - checkout_time) * 1000)
+
+    def _on_invalidate(
+        self,
+        dbapi_connection: Any,
+        connection_record: ConnectionPoolEntry,
+        exception: BaseException | None,
+    ) -> None:
+        with self._lock:
+            self.invalidations += 1
+
+    def _on_soft_invalidate(
+        self,
+        dbapi_connection: Any,
+        connection_record: ConnectionPoolEntry,
+        exception: BaseException | None,
+    ) -> None:
+        with self._lock:
+            self.soft_invalidations += 1
+
+    def _on_close(self, dbapi_connection: Any, connection_record: ConnectionPoolEntry) -> None:
+        with self._lock:
+            self._connection_start_times.pop(id(connection_record), None)
+
+
+class TimedQueuePool(pool.QueuePool):
+    """QueuePool that records how long each checkout waits for a connection."""
+
+    def __init__(self, *args: Any, pool_metrics: PoolMetrics | None = None, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.pool_metrics = pool_metrics or PoolMetrics()
+
+    def recreate(self) -> "TimedQueuePool":
+        # Keep the same metrics if the pool is recreated, such as by engine.dispose()
+        recreated = cast(TimedQueuePool, super().recreate())
+        recreated.pool_metrics = self.pool_metrics
+        return recreated
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        start_time = time.monotonic()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except sqlalchemy.exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            self.pool_metrics.observe_checkout_wait(
+                (time.monotonic() - start_time) * 1000, timed_out=timed_out
+            )
+
+
+class TimedAsyncAdaptedQueuePool(TimedQueuePool, pool.AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that records how long each checkout waits for a connection.
+
+    The pool of an AsyncEngine, see AsyncPostgresDBClient.
+    """
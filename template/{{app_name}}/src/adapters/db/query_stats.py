@@ -0,0 +1,172 @@
+"""
+This module counts and times the SQL statements run on an engine, for a unit
+of work such as a web request.
+
+The stats are collected by cursor execute event listeners added to each
+engine with listen(), into the QueryStats of the current context started with
+start_query_stats(). Statements run while no stats are started are not counted.
+
+Usage:
+    query_stats.listen(engine)
+
+    stats = query_stats.start_query_stats()
+    ...
+    stats.query_count
+    query_stats.stop_query_stats()
+
+For web requests, flask_db starts and stops the stats for each request and
+adds them to the request logs.
+"""
+import contextvars
+import logging
+import re
+import time
+from collections import Counter
+from typing import Any, Optional
+
+import sqlalchemy
+from pydantic import Field
+
+from src.util.env_config import PydanticBaseEnvConfig
+
+logger = logging.getLogger(__name__)
+
+# Statements longer than this are truncated in logs
+MAX_LOGGED_STATEMENT_LENGTH = 500
+
+# Key of the start times of the executing statements in the info dict of a connection
+_START_TIMES_KEY = "query_stats_start_times"
+
+
+class QueryStatsConfig(PydanticBaseEnvConfig):
+    # Log a warning when a statement of the same shape runs more than this many
+    # times in one unit of work, which usually means an N+1 query pattern.
+    # None to not warn.
+    repeated_statement_warning_threshold: Optional[int] = Field(
+        None, alias="DB_REPEATED_STATEMENT_WARNING_THRESHOLD"
+    )
+
+
+class QueryStats:
+    """Count, total time and slowest statement of the queries of a unit of work."""
+
+    def __init__(self, repeated_statement_warning_threshold: int | None = None) -> None:
+        self.repeated_statement_warning_threshold = repeated_statement_warning_threshold
+        self.query_count = 0
+        self.total_time_ms = 0.0
+        self.slowest_time_ms = 0.0
+        self.slowest_statement: str | None = None
+        self.statement_shape_counts: Counter[str] = Counter()
+
+    def record(self, statement: str, duration_ms: float) -> None:
+        self.query_count += 1
+        self.total_time_ms += duration_ms
+        if duration_ms >= self.slowest_time_ms:
+            self.slowest_time_ms = duration_ms
+            self.slowest_statement = statement
+
+        if self.repeated_statement_warning_threshold is None:
+            return
+        shape = get_statement_shape(statement)
+        self.statement_shape_counts[shape] += 1
+        # Only warn once for each statement shape
+        if self.statement_shape_counts[shape] == self.repeated_statement_warning_threshold + 1:
+            logger.warning(
+                "database statement repeated, possible N+1 query",
+                extra={
+                    "db.statement": truncate_statement(shape),
+                    "db.statement_count": self.statement_shape_counts[shape],
+                },
+            )
+
+    def get_log_data(self) -> dict[str, str | int | float | None]:
+        return {
+            "db.query_count": self.query_count,
+            "db.total_time_ms": round(self.total_time_ms, 3),
+            "db.slowest_query_time_ms": round(self.slowest_time_ms, 3),
+            "db.slowest_statement": (
+                truncate_statement(self.slowest_statement) if self.slowest_statement else None
+            ),
+        }
+
+
+_current_query_stats: contextvars.ContextVar[QueryStats | None] = contextvars.ContextVar(
+    "query_stats", default=None
+)
+
+
+def start_query_stats(repeated_statement_warning_threshold: int | None = None) -> QueryStats:
+    """Start collecting query stats for the current context."""
+    query_stats = QueryStats(repeated_statement_warning_threshold)
+    _current_query_stats.set(query_stats)
+    return query_stats
+
+
+def get_query_stats() -> QueryStats | None:
+    return _current_query_stats.get()
+
+
+def stop_query_stats() -> QueryStats | None:
+    """Stop collecting query stats for the current context and return them."""
+    query_stats = _current_query_stats.get()
+    _current_query_stats.set(None)
+    return query_stats
+
+
+def listen(engine: sqlalchemy.engine.Engine) -> None:
+    """Add the event listeners that collect query stats to an engine."""
+    sqlalchemy.event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    sqlalchemy.event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    sqlalchemy.event.listen(engine, "handle_error", _handle_error)
+
+
+def get_statement_shape(statement: str) -> str:
+    """Normalize a statement so that statements differing only in parameters match.
+
+    Collapses whitespace, and lists of parameters such as those of an expanded
+    IN clause to a single parameter.
+    """
+    shape = re.sub(r"\s+", " ", statement).strip()
+    shape = re.sub(r"%\(\w+\)s|%s", "?", shape)
+    return re.sub(r"\?(, ?\?)+", "?", shape)
+
+
+def truncate_statement(statement: str) -> str:
+    if len(statement) <= MAX_LOGGED_STATEMENT_LENGTH:
+        return statement
+    return statement[:MAX_LOGGED_STATEMENT_LENGTH] + "..."
+
+
+def _before_cursor_execute(
+    conn: sqlalchemy.Connection,
+    cursor: Any,
+    statement: str,
+    parameters: Any,
+    context: Any,
+    executemany: bool,
+) -> None:
+    if _current_query_stats.get() is None:
+        return
+    conn.info.setdefault(_START_TIMES_KEY, []).append(time.perf_counter())
+
+
+def _after_cursor_execute(
+    conn: sqlalchemy.Connection,
+    cursor: Any,
+    statement: str,
+    parameters: Any,
+    context: Any,
+    executemany: bool,
+) -> None:
+    query_stats = _current_query_stats.get()
+    start_times = conn.info.get(_START_TIMES_KEY)
+    if query_stats is None or not start_times:
+        return
+    query_stats.record(statement, (time.perf_counter() - start_times.pop()) * 1000)
+
+
+def _handle_error(exception_context: sqlalchemy.engine.ExceptionContext) -> None:
+    # A failed statement has no after_cursor_execute event, so drop its start time
+    conn = exception_context.connection
+    if conn is not None and conn.info.get(_START_TIMES_KEY):
+        conn.info[_START_TIMES_KEY].pop()
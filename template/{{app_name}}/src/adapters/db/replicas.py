@@ -0,0 +1,132 @@
+"""
+This module contains the ReplicaRouter class, which chooses a read replica
+engine for read-only database work.
+
+Replicas are balanced by round robin, or by the fewest checked out connections.
+A replica whose replication lag exceeds the configured maximum is skipped, and
+when no replica is usable the caller falls back to the primary.
+
+For usage information look at the package docstring in __init__.py
+"""
+import itertools
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from enum import StrEnum
+from typing import Any, Callable
+
+import sqlalchemy
+import sqlalchemy.pool as pool
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# Replication lag in seconds. A server that is not a replica, or a replica that
+# has replayed everything it has received, has no lag.
+REPLICATION_LAG_QUERY = text(
+    """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+    """
+)
+
+
+class ReplicaBalancing(StrEnum):
+    ROUND_ROBIN = "round_robin"
+    LEAST_CONNECTIONS = "least_connections"
+
+
+def get_replication_lag(engine: sqlalchemy.engine.Engine) -> float:
+    with engine.connect() as conn:
+        return float(conn.scalar(REPLICATION_LAG_QUERY) or 0)
+
+
+@dataclass
+class Replica:
+    name: str
+    engine: sqlalchemy.engine.Engine
+    # The last measured replication lag, or None if it could not be measured
+    lag_seconds: float | None = None
+    lag_checked_at: float | None = None
+
+
+class ReplicaRouter:
+    """Chooses a replica engine for each read-only session or connection."""
+
+    def __init__(
+        self,
+        replicas: list[Replica],
+        balancing: ReplicaBalancing = ReplicaBalancing.ROUND_ROBIN,
+        max_lag_seconds: float | None = None,
+        lag_check_interval_seconds: float = 5,
+        get_lag: Callable[[sqlalchemy.engine.Engine], float] = get_replication_lag,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.replicas = replicas
+        self.balancing = balancing
+        self.max_lag_seconds = max_lag_seconds
+        self.lag_check_interval_seconds = lag_check_interval_seconds
+        self._get_lag = get_lag
+        self._clock = clock
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def get_engine(self) -> sqlalchemy.engine.Engine | None:
+        """Return the engine of a usable replica, or None to use the primary."""
+        replicas = [replica for replica in self.replicas if self._is_usable(replica)]
+        if not replicas:
+            logger.warning("no database replica is usable, falling back to the primary")
+            return None
+
+        if self.balancing == ReplicaBalancing.LEAST_CONNECTIONS:
+            return min(replicas, key=_get_checked_out_count).engine
+
+        with self._lock:
+            index = next(self._counter)
+        return replicas[index % len(replicas)].engine
+
+    def stats(self) -> list[dict[str, Any]]:
+        return [
+            {
+                "name": replica.name,
+                "lag_seconds": replica.lag_seconds,
+                "checked_out": _get_checked_out_count(replica),
+            }
+            for replica in self.replicas
+        ]
+
+    def _is_usable(self, replica: Replica) -> bool:
+        if self.max_lag_seconds is None:
+            return True
+
+        now = self._clock()
+        if (
+            replica.lag_checked_at is None
+            or now - replica.lag_checked_at >= self.lag_check_interval_seconds
+        ):
+            # Several threads may check the lag at once, which is harmless
+            replica.lag_checked_at = now
+            try:
+                replica.lag_seconds = self._get_lag(replica.engine)
+            except Exception:
+                logger.exception(
+                    "failed to check database replica lag", extra={"replica": replica.name}
+                )
+                replica.lag_seconds = None
+
+            if replica.lag_seconds is None or replica.lag_seconds > self.max_lag_seconds:
+                logger.warning(
+                    "database replica is unavailable or lagging",
+                    extra={"replica": replica.name, "lag_seconds": replica.lag_seconds},
+                )
+
+        return replica.lag_seconds is not None and replica.lag_seconds <= self.max_lag_seconds
+
+
+def _get_checked_out_count(replica: Replica) -> int:
+    conn_pool = replica.engine.pool
+    return conn_pool.checkedout() if isinstance(conn_pool, pool.QueuePool) else 0
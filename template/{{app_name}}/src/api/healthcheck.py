@@ -1,20 +1,39 @@
+import functools
 import logging
 from typing import Tuple
 
-from apiflask import APIBlueprint
+from apiflask import APIBlueprint, fields
 from flask import current_app
+from pydantic import Field
 from sqlalchemy import text
 from werkzeug.exceptions import ServiceUnavailable
 
 import src.adapters.db.flask_db as flask_db
 from src.api import response
 from src.api.schemas import request_schema
+from src.util.env_config import PydanticBaseEnvConfig
 
 logger = logging.getLogger(__name__)
 
 
+class HealthcheckConfig(PydanticBaseEnvConfig):
+    # Whether to include the usage stats of the database connection pool in the
+    # health response. Off by default, as the endpoint is not authenticated.
+    include_db_pool_stats: bool = Field(False, alias="HEALTHCHECK_INCLUDE_DB_POOL_STATS")
+
+
+@functools.cache
+def get_healthcheck_config() -> HealthcheckConfig:
+    """Return the healthcheck config, which is read from the environment once,
+    as load balancers call the health endpoint often."""
+    return HealthcheckConfig()
+
+
 class HealthcheckSchema(request_schema.OrderedSchema):
     message: str
+    db_pool = fields.Dict(
+        metadata={"description": "Usage stats of the database connection pool, if enabled"}
+    )
 
 
 healthcheck_blueprint = APIBlueprint("healthcheck", __name__, tag="Health")
@@ -25,9 +44,14 @@ healthcheck_blueprint = APIBlueprint("healthcheck", __name__, tag="Health")
 @healthcheck_blueprint.doc(responses=[200, ServiceUnavailable.code])
 def health() -> Tuple[response.ApiResponse, int]:
     try:
-        with flask_db.get_db(current_app).get_connection() as conn:
+        db_client = flask_db.get_db(current_app)
+        with db_client.get_connection() as conn:
             assert conn.scalar(text("SELECT 1 AS healthy")) == 1
-        return response.ApiResponse(message="Service healthy"), 200
+
+        data = {}
+        if get_healthcheck_config().include_db_pool_stats:
+            data["db_pool"] = db_client.pool_stats()
+        return response.ApiResponse(message="Service healthy", data=data), 200
     except Exception:
         logger.exception("Connection to DB failure")
         return response.ApiResponse(message="Service unavailable"), ServiceUnavailable.code
@@ -47,7 +47,7 @@ def user_patch(
 @user_blueprint.get("/v1/users/<uuid:user_id>")
 @user_blueprint.output(user_schemas.UserSchema)
 @user_blueprint.auth_required(api_key_auth)
-@flask_db.with_db_session()
+@flask_db.with_db_session(read_only=True)
 def user_get(db_session: db.Session, user_id: str) -> response.ApiResponse:
     user = user_service.get_user(db_session, user_id)
     logger.info("Successfully fetched user", extra=get_user_log_params(user))
@@ -59,7 +59,7 @@ def user_get(db_session: db.Session, user_id: str) -> response.ApiResponse:
 # many=True allows us to return a list of user objects
 @user_blueprint.output(user_schemas.UserSchema(many=True))
 @user_blueprint.auth_required(api_key_auth)
-@flask_db.with_db_session()
+@flask_db.with_db_session(read_only=True)
 def user_search(db_session: db.Session, search_params: dict) -> response.ApiResponse:
     user_result, pagination_info = user_service.search_user(db_session, search_params)
     logger.info("Successfully searched users")
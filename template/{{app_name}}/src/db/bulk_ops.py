@@ -1,151 +1,1401 @@
 """Bulk database operations for performance.
 
-Provides a bulk_upsert function for use with
-Postgres and the psycopg library.
+Provides bulk_upsert, bulk_upsert_stream, bulk_upsert_models,
+parallel_bulk_upsert, bulk_delete and bulk_sync functions, and the
+BulkUpsertSession class they are built on, for use with Postgres and the
+psycopg library.
 """
-from typing import Any, Sequence
+import concurrent.futures
+import functools
+import itertools
+import logging
+import operator
+import queue
+import re
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+from enum import StrEnum
+from typing import Any, Collection, Iterable, Iterator, Mapping, Sequence
 
 import psycopg
+import sqlalchemy
 from psycopg import rows, sql
+from sqlalchemy.dialects import postgresql
+
+import src.adapters.db as db
+from src.db.models.base import Base, metadata
+
+logger = logging.getLogger(__name__)
 
 Connection = psycopg.Connection
 Cursor = psycopg.Cursor
 kwargs_row = rows.kwargs_row
 
+DEFAULT_BATCH_SIZE = 10_000
+
+# Columns that are never overwritten when updating a conflicting row, unless
+# a different set of immutable_columns is given
+DEFAULT_IMMUTABLE_COLUMNS = frozenset(["id", "number"])
+
+# The objects to upsert can be any of:
+#   - objects with an attribute for each column, such as ORM models or dataclasses
+#   - dicts (or other mappings) with a key for each column
+#   - tuples or lists of values in the same order as the columns
+#   - a single mapping of each column name to a sequence of values for that column
+Objects = Iterable[Any] | Mapping[str, Sequence[Any]]
+
+
+@dataclass
+class BatchResult:
+    """Summary of a single batch written by a BulkUpsertSession."""
+
+    batch_number: int
+    row_count: int
+    elapsed_seconds: float
+
+    # Only set if the session was created with return_counts or return_keys
+    inserted_count: int | None = None
+    updated_count: int | None = None
+
+    # Only set if the session was created with return_keys
+    inserted_keys: list[tuple[Any, ...]] | None = None
+    updated_keys: list[tuple[Any, ...]] | None = None
+
+    # Only set by bulk_sync
+    deleted_count: int | None = None
+
+    # Only set by parallel_bulk_upsert
+    partition_number: int | None = None
+
+    @property
+    def rows_per_second(self) -> float:
+        if self.elapsed_seconds <= 0:
+            return float(self.row_count)
+        return self.row_count / self.elapsed_seconds
+
+    @property
+    def skipped_count(self) -> int | None:
+        """The number of conflicting rows that were not updated due to the update_condition"""
+        if self.inserted_count is None or self.updated_count is None:
+            return None
+        return self.row_count - self.inserted_count - self.updated_count
+
+
+@dataclass
+class _WriteCounts:
+    inserted_count: int = 0
+    updated_count: int = 0
+    inserted_keys: list[tuple[Any, ...]] | None = None
+    updated_keys: list[tuple[Any, ...]] | None = None
+
 
 def bulk_upsert(
     cur: psycopg.Cursor,
     table: str,
     attributes: Sequence[str],
-    objects: Sequence[Any],
+    objects: Objects,
     constraint: str,
     update_condition: sql.SQL | None = None,
-) -> None:
+    binary: bool = False,
+    column_types: Sequence[str] | None = None,
+    return_counts: bool = False,
+    return_keys: Sequence[str] | None = None,
+    immutable_columns: Collection[str] = DEFAULT_IMMUTABLE_COLUMNS,
+    only_if_changed: bool = False,
+) -> BatchResult:
     """Bulk insert or update a sequence of objects.
 
     Insert a sequence of objects, or update on conflict.
     Write data from one table to another.
     If there are conflicts due to unique constraints, overwrite existing data.
+    The objects are written through a staging table, which is created in a
+    transaction of its own when no transaction is in progress, see
+    BulkUpsertSession.
 
     Args:
       cur: the Cursor object from the pyscopg library
       table: the name of the table to insert into or update
       attributes: a sequence of attribute names to copy from each object
-      objects: a sequence of objects to upsert
+      objects: the objects to upsert, either a sequence of objects, dicts or
+        tuples, or a mapping of each attribute to a sequence of its values
       constraint: the table unique constraint to use to determine conflicts
       update_condition: optional WHERE clause to limit updates for a
         conflicting row
+      binary: whether to use a binary COPY instead of a text COPY, which
+        avoids formatting and parsing values as text
+      column_types: the Postgres type name of each attribute for a binary COPY,
+        defaults to the types defined for the table in the SQLAlchemy metadata
+      return_counts: whether to count the inserted, updated and skipped rows
+      return_keys: optional column names to return the values of for each
+        inserted and updated row, such as the primary key
+      immutable_columns: columns that are not overwritten when updating a
+        conflicting row, such as the primary key or created_at
+      only_if_changed: whether to skip updating a conflicting row unless at least
+        one of the columns that would be overwritten has a different value
+
+    Returns:
+      a BatchResult with the row count and timing of the upsert
     """
-    if not update_condition:
-        update_condition = sql.SQL("")
+    session = BulkUpsertSession(
+        cur,
+        table,
+        attributes,
+        constraint,
+        update_condition=update_condition,
+        binary=binary,
+        column_types=column_types,
+        return_counts=return_counts,
+        return_keys=return_keys,
+        immutable_columns=immutable_columns,
+        only_if_changed=only_if_changed,
+    )
+    return session.upsert(objects)
+
+
+def bulk_upsert_stream(
+    cur: psycopg.Cursor,
+    table: str,
+    attributes: Sequence[str],
+    objects: Objects,
+    constraint: str,
+    update_condition: sql.SQL | None = None,
+    batch_size: int | None = DEFAULT_BATCH_SIZE,
+    binary: bool = False,
+    column_types: Sequence[str] | None = None,
+    return_counts: bool = False,
+    return_keys: Sequence[str] | None = None,
+    immutable_columns: Collection[str] = DEFAULT_IMMUTABLE_COLUMNS,
+    only_if_changed: bool = False,
+) -> list[BatchResult]:
+    """Bulk insert or update an iterable of objects in batches.
 
-    temp_table = f"temp_{table}"
-    _create_temp_table(cur, temp_table=temp_table, src_table=table)
-    _bulk_insert(cur, table=temp_table, columns=attributes, objects=objects)
-    _write_from_table_to_table(
+    Like bulk_upsert, but objects can be any iterable, including a generator,
+    and are consumed lazily so that only one batch is held in memory at a time.
+    The temp table is truncated between batches, with each batch written to
+    the destination table before the next one is read.
+
+    If batch_size is None, every object is written with a single COPY followed
+    by a single write to the destination table.
+
+    Args:
+      cur: the Cursor object from the pyscopg library
+      table: the name of the table to insert into or update
+      attributes: a sequence of attribute names to copy from each object
+      objects: the objects to upsert, either an iterable of objects, dicts or
+        tuples, or a mapping of each attribute to a sequence of its values
+      constraint: the table unique constraint to use to determine conflicts
+      update_condition: optional WHERE clause to limit updates for a
+        conflicting row
+      batch_size: the number of objects to write per batch, or None to
+        write all objects in one batch
+      binary: whether to use a binary COPY instead of a text COPY
+      column_types: the Postgres type name of each attribute for a binary COPY,
+        defaults to the types defined for the table in the SQLAlchemy metadata
+      return_counts: whether to count the inserted, updated and skipped rows
+      return_keys: optional column names to return the values of for each
+        inserted and updated row, such as the primary key
+      immutable_columns: columns that are not overwritten when updating a
+        conflicting row, such as the primary key or created_at
+      only_if_changed: whether to skip updating a conflicting row unless at least
+        one of the columns that would be overwritten has a different value
+
+    Returns:
+      a BatchResult with the row count and timing of each batch
+    """
+    if batch_size is not None and batch_size <= 0:
+        raise ValueError("Batch size must be at least 1")
+
+    batches: Iterable[Iterable[Any]]
+    if batch_size is None:
+        batches = [_iter_rows(objects, attributes)]
+    else:
+        batches = itertools.batched(_iter_rows(objects, attributes), batch_size)
+
+    session = BulkUpsertSession(
         cur,
-        src_table=temp_table,
-        dest_table=table,
-        columns=attributes,
-        constraint=constraint,
+        table,
+        attributes,
+        constraint,
         update_condition=update_condition,
+        binary=binary,
+        column_types=column_types,
+        return_counts=return_counts,
+        return_keys=return_keys,
+        immutable_columns=immutable_columns,
+        only_if_changed=only_if_changed,
+    )
+    return [session.upsert(batch) for batch in batches]
+
+
+@dataclass(frozen=True)
+class ModelTableSpec:
+    """The table details that bulk_upsert_models derives from a mapped class."""
+
+    table: str
+    # The ORM attribute key and table column name of each column
+    attribute_keys: tuple[str, ...]
+    columns: tuple[str, ...]
+    column_types: tuple[str, ...]
+    primary_key_columns: tuple[str, ...]
+    primary_key_constraint: str
+    unique_constraints: dict[str, tuple[str, ...]]
+    # The Python-side default of each column, which is applied to objects that
+    # have not been flushed, or None if the column has no such default
+    column_defaults: tuple[sqlalchemy.ColumnDefault | None, ...]
+
+
+@functools.cache
+def get_model_table_spec(model: type[Base]) -> ModelTableSpec:
+    """Get the table, columns and constraints of a mapped class.
+
+    Constraint names are the ones generated by the naming convention of the
+    metadata in src.db.models.base. The result is cached for each class.
+    """
+    mapper = sqlalchemy.inspect(model)
+    table = mapper.local_table
+    if not isinstance(table, sqlalchemy.Table):
+        raise ValueError(f"Model {model.__name__} is not mapped to a single table")
+
+    column_properties = [prop for prop in mapper.column_attrs if prop.columns[0].table is table]
+    columns = tuple(prop.columns[0].name for prop in column_properties)
+
+    return ModelTableSpec(
+        table=table.name,
+        attribute_keys=tuple(prop.key for prop in column_properties),
+        columns=columns,
+        column_types=tuple(get_column_types(table.name, columns)),
+        primary_key_columns=tuple(column.name for column in table.primary_key.columns),
+        primary_key_constraint=str(table.primary_key.name),
+        unique_constraints={
+            str(constraint.name): tuple(column.name for column in constraint.columns)
+            for constraint in table.constraints
+            if isinstance(constraint, sqlalchemy.UniqueConstraint)
+        },
+        column_defaults=tuple(
+            default
+            if isinstance(default, sqlalchemy.ColumnDefault)
+            and (default.is_scalar or default.is_callable)
+            else None
+            for default in (prop.columns[0].default for prop in column_properties)
+        ),
+    )
+
+
+class _DefaultContext:
+    """The part of an execution context that callable column defaults use."""
+
+    def __init__(self, parameters: dict[str, Any]):
+        self.parameters = parameters
+
+    def get_current_parameters(self, isolate_multiinsert_groups: bool = True) -> dict[str, Any]:
+        return self.parameters
+
+
+def apply_column_defaults(spec: ModelTableSpec, obj: Base) -> Base:
+    """Set the Python-side column defaults of an object, as a flush would.
+
+    Columns such as id and created_at get their values from Python-side
+    defaults, so they are None on objects that have not been flushed. Only
+    columns whose value is None are set, in column order, so that defaults
+    that depend on other columns, such as updated_at, see their values.
+    """
+    for attribute_key, default in zip(spec.attribute_keys, spec.column_defaults):
+        if default is None or getattr(obj, attribute_key) is not None:
+            continue
+        if default.is_callable:
+            parameters = {
+                other_column: getattr(obj, other_attribute_key)
+                for other_attribute_key, other_column in zip(spec.attribute_keys, spec.columns)
+            }
+            value = default.arg(_DefaultContext(parameters))
+        else:
+            value = default.arg
+        setattr(obj, attribute_key, value)
+    return obj
+
+
+def bulk_upsert_models(
+    cur: psycopg.Cursor,
+    model: type[Base],
+    objects: Iterable[Base],
+    constraint: str | None = None,
+    columns: Sequence[str] | None = None,
+    batch_size: int | None = DEFAULT_BATCH_SIZE,
+    binary: bool = True,
+    return_counts: bool = False,
+    immutable_columns: Collection[str] | None = None,
+    only_if_changed: bool = False,
+) -> list[BatchResult]:
+    """Bulk insert or update instances of a mapped class.
+
+    Like bulk_upsert_stream, but the table, columns, column types and
+    constraint are derived from the model rather than passed in by hand.
+    Python-side column defaults, such as those of id and created_at, are
+    applied to objects that have not been flushed, see apply_column_defaults.
+
+    Usage:
+        bulk_upsert_models(cur, User, users)
+
+    Args:
+      cur: the Cursor object from the pyscopg library
+      model: the mapped class, such as User
+      objects: an iterable of instances of the model
+      constraint: the name of the primary key or a unique constraint of the table
+        to use to determine conflicts, defaults to the primary key
+      columns: the columns to write, defaults to every column of the table.
+        Every column that is NOT NULL in the table must have a value.
+      batch_size: the number of objects to write per batch, or None to
+        write all objects in one batch
+      binary: whether to use a binary COPY, which is the default as the
+        column types are known from the model
+      return_counts: whether to count the inserted, updated and skipped rows
+      immutable_columns: columns that are not overwritten when updating a
+        conflicting row, defaults to the columns of the constraint, the primary
+        key and created_at
+      only_if_changed: whether to skip updating a conflicting row unless at least
+        one of the columns that would be overwritten has a different value
+
+    Returns:
+      a BatchResult with the row count and timing of each batch
+    """
+    spec = get_model_table_spec(model)
+
+    if constraint is None:
+        constraint = spec.primary_key_constraint
+    if constraint == spec.primary_key_constraint:
+        constraint_columns = spec.primary_key_columns
+    elif constraint in spec.unique_constraints:
+        constraint_columns = spec.unique_constraints[constraint]
+    else:
+        raise ValueError(f"Constraint {constraint} is not defined for table {spec.table}")
+
+    if columns is None:
+        columns = spec.columns
+    unknown_columns = [column for column in columns if column not in spec.columns]
+    if unknown_columns:
+        raise ValueError(
+            f"Columns are not defined for table {spec.table}: {', '.join(unknown_columns)}"
+        )
+
+    if immutable_columns is None:
+        # The primary key is kept even when conflicts are found with a unique
+        # constraint, as other tables may reference the existing row's key
+        immutable_columns = {*constraint_columns, *spec.primary_key_columns, "created_at"}
+
+    column_indexes = [spec.columns.index(column) for column in columns]
+    attribute_getter = operator.attrgetter(*[spec.attribute_keys[i] for i in column_indexes])
+    objects = (apply_column_defaults(spec, obj) for obj in objects)
+    if len(columns) == 1:
+        rows: Iterable[tuple[Any, ...]] = ((attribute_getter(obj),) for obj in objects)
+    else:
+        rows = map(attribute_getter, objects)
+
+    return bulk_upsert_stream(
+        cur,
+        spec.table,
+        columns,
+        rows,
+        constraint,
+        batch_size=batch_size,
+        binary=binary,
+        column_types=[spec.column_types[i] for i in column_indexes],
+        return_counts=return_counts,
+        immutable_columns=immutable_columns,
+        only_if_changed=only_if_changed,
     )
 
 
-def _create_temp_table(cur: psycopg.Cursor, temp_table: str, src_table: str) -> None:
+# Staging tables that exist on each connection, outliving the transaction
+# that created them. Connections are pooled, so a staging table created for
+# one request is reused by later bulk upserts on the same connection.
+_staging_tables: weakref.WeakKeyDictionary[
+    psycopg.Connection, set[str]
+] = weakref.WeakKeyDictionary()
+
+
+class BulkUpsertSession:
+    """Repeatedly bulk upsert batches of objects through one staging table.
+
+    The staging table is a temp table that is created the first time it is
+    needed on a connection and then reused by every later session on that
+    connection, so upserting many small batches does not create and drop a
+    table each time. Its rows are deleted on commit, and it is truncated
+    between batches within a transaction.
+
+    When the connection has no transaction in progress, the staging table is
+    created and committed in a transaction of its own, before any of the
+    batch is written, so that it outlives the caller's transaction. Nothing
+    else is committed. Within a transaction, it is created in that
+    transaction and dropped again if it is rolled back. If the connection's
+    temp tables were dropped, such as by DISCARD ALL when a pool reset the
+    connection, the staging table is created again.
+
+    Usage:
+        session = BulkUpsertSession(cur, "user", attributes, "user_pkey")
+        for batch in batches:
+            session.upsert(batch)
     """
-    Create table that lives only for the current transaction.
+
+    def __init__(
+        self,
+        cur: psycopg.Cursor,
+        table: str,
+        attributes: Sequence[str],
+        constraint: str,
+        update_condition: sql.SQL | None = None,
+        binary: bool = False,
+        column_types: Sequence[str] | None = None,
+        return_counts: bool = False,
+        return_keys: Sequence[str] | None = None,
+        immutable_columns: Collection[str] = DEFAULT_IMMUTABLE_COLUMNS,
+        only_if_changed: bool = False,
+    ) -> None:
+        """
+        Args:
+          cur: the Cursor object from the pyscopg library
+          table: the name of the table to insert into or update
+          attributes: a sequence of attribute names to copy from each object
+          constraint: the table unique constraint to use to determine conflicts
+          update_condition: optional WHERE clause to limit updates for a
+            conflicting row
+          binary: whether to use a binary COPY instead of a text COPY
+          column_types: the Postgres type name of each attribute for a binary COPY,
+            defaults to the types defined for the table in the SQLAlchemy metadata
+          return_counts: whether to count the inserted, updated and skipped rows
+            of each batch, using RETURNING on the upsert
+          return_keys: optional column names to return the values of for each
+            inserted and updated row, such as the primary key. Implies return_counts.
+          immutable_columns: columns that are not overwritten when updating a
+            conflicting row, such as the primary key or created_at
+          only_if_changed: whether to skip updating a conflicting row unless at least
+            one of the columns that would be overwritten has a different value,
+            which avoids rewriting unchanged rows. Cannot be combined with update_condition.
+        """
+        if only_if_changed and update_condition:
+            raise ValueError("Cannot use both only_if_changed and an update_condition")
+
+        if binary and column_types is None:
+            column_types = get_column_types(table, attributes)
+
+        self.cur = cur
+        self.table = table
+        self.attributes = attributes
+        self.column_types = column_types if binary else None
+        self.return_counts = return_counts or return_keys is not None
+        self.return_keys = return_keys
+        self.staging_table = f"temp_{table}"
+        self.batch_count = 0
+
+        # Build the write query once rather than for every batch
+        write_query_args = (
+            self.staging_table,
+            table,
+            tuple(attributes),
+            constraint,
+        )
+        write_query_kwargs: dict[str, Any] = dict(
+            return_counts=self.return_counts,
+            return_keys=tuple(return_keys) if return_keys is not None else None,
+            immutable_columns=frozenset(immutable_columns),
+            only_if_changed=only_if_changed,
+        )
+        if update_condition:
+            self._write_query = _build_write_query(
+                *write_query_args, update_condition=update_condition, **write_query_kwargs
+            )
+        else:
+            self._write_query = _build_cached_write_query(*write_query_args, **write_query_kwargs)
+
+        self._has_staging_table = False
+
+    def upsert(self, objects: Objects) -> BatchResult:
+        """Bulk insert or update a batch of objects.
+
+        The objects can be any of the shapes described by Objects.
+        """
+        if self._has_staging_table:
+            _truncate_table(self.cur, self.staging_table)
+        else:
+            _prepare_staging_table(self.cur, self.staging_table, src_table=self.table)
+            self._has_staging_table = True
+
+        self.batch_count += 1
+        start_time = time.monotonic()
+        row_count = _bulk_insert(
+            self.cur,
+            table=self.staging_table,
+            columns=self.attributes,
+            objects=objects,
+            column_types=self.column_types,
+        )
+        write_counts = _write_from_table_to_table(
+            self.cur,
+            self._write_query,
+            return_counts=self.return_counts,
+            return_keys=self.return_keys,
+        )
+        result = BatchResult(
+            batch_number=self.batch_count,
+            row_count=row_count,
+            elapsed_seconds=time.monotonic() - start_time,
+        )
+        if write_counts is not None:
+            result.inserted_count = write_counts.inserted_count
+            result.updated_count = write_counts.updated_count
+            result.inserted_keys = write_counts.inserted_keys
+            result.updated_keys = write_counts.updated_keys
+
+        logger.info(
+            "Upserted batch %s of %s rows into %s",
+            result.batch_number,
+            row_count,
+            self.table,
+            extra={
+                "table": self.table,
+                "batch_number": result.batch_number,
+                "row_count": row_count,
+                "elapsed_seconds": round(result.elapsed_seconds, 3),
+                "rows_per_second": round(result.rows_per_second, 1),
+                "inserted_count": result.inserted_count,
+                "updated_count": result.updated_count,
+                "skipped_count": result.skipped_count,
+            },
+        )
+        return result
+
+    def delete_missing(
+        self, key_columns: Sequence[str], delete_condition: sql.Composable | None = None
+    ) -> int:
+        """Delete rows from the table that are not in the most recently upserted batch.
+
+        Rows are matched on key_columns, which must be included in the attributes.
+
+        Args:
+          key_columns: the columns that identify a row, such as the primary key
+          delete_condition: optional condition to limit which rows can be deleted,
+            such as only rows from the same source as the batch
+        Returns:
+          the number of deleted rows
+        """
+        if self.batch_count == 0:
+            raise ValueError("Cannot delete missing rows before upserting a batch")
+
+        deleted_count = _delete_from_table_by_table(
+            self.cur,
+            src_table=self.staging_table,
+            dest_table=self.table,
+            key_columns=key_columns,
+            matching=False,
+            delete_condition=delete_condition,
+        )
+        logger.info(
+            "Deleted %s rows missing from batch %s from %s",
+            deleted_count,
+            self.batch_count,
+            self.table,
+            extra={
+                "table": self.table,
+                "batch_number": self.batch_count,
+                "deleted_count": deleted_count,
+            },
+        )
+        return deleted_count
+
+
+def bulk_delete(
+    cur: psycopg.Cursor,
+    table: str,
+    key_columns: Sequence[str],
+    keys: Objects,
+    binary: bool = False,
+    column_types: Sequence[str] | None = None,
+) -> int:
+    """Bulk delete rows by key.
+
+    The keys are written to a staging table with COPY,
+    and then deleted from the table with a single join.
+
+    Args:
+      cur: the Cursor object from the pyscopg library
+      table: the name of the table to delete from
+      key_columns: the columns that identify a row, such as the primary key
+      keys: the keys of the rows to delete, in any of the shapes described by Objects
+      binary: whether to use a binary COPY instead of a text COPY
+      column_types: the Postgres type name of each key column for a binary COPY,
+        defaults to the types defined for the table in the SQLAlchemy metadata
+
+    Returns:
+      the number of deleted rows
+    """
+    if binary and column_types is None:
+        column_types = get_column_types(table, key_columns)
+
+    staging_table = f"temp_{table}_keys_{'_'.join(key_columns)}"
+    _prepare_staging_table(cur, staging_table, src_table=table, columns=key_columns)
+
+    start_time = time.monotonic()
+    row_count = _bulk_insert(
+        cur,
+        table=staging_table,
+        columns=key_columns,
+        objects=keys,
+        column_types=column_types if binary else None,
+    )
+    deleted_count = _delete_from_table_by_table(
+        cur, src_table=staging_table, dest_table=table, key_columns=key_columns, matching=True
+    )
+
+    logger.info(
+        "Deleted %s of %s keys from %s",
+        deleted_count,
+        row_count,
+        table,
+        extra={
+            "table": table,
+            "row_count": row_count,
+            "deleted_count": deleted_count,
+            "elapsed_seconds": round(time.monotonic() - start_time, 3),
+        },
+    )
+    return deleted_count
+
+
+def bulk_sync(
+    cur: psycopg.Cursor,
+    table: str,
+    attributes: Sequence[str],
+    objects: Objects,
+    constraint: str,
+    key_columns: Sequence[str],
+    update_condition: sql.SQL | None = None,
+    delete_condition: sql.Composable | None = None,
+    binary: bool = False,
+    column_types: Sequence[str] | None = None,
+    return_counts: bool = False,
+    immutable_columns: Collection[str] = DEFAULT_IMMUTABLE_COLUMNS,
+    only_if_changed: bool = False,
+) -> BatchResult:
+    """Make a table match a full snapshot of objects.
+
+    Bulk upsert the objects, then delete every row whose key is not in the
+    snapshot. The snapshot is written with a single COPY so that the delete
+    can be done with one anti-join against the staging table.
+
+    Args:
+      cur: the Cursor object from the pyscopg library
+      table: the name of the table to sync
+      attributes: a sequence of attribute names to copy from each object
+      objects: the full snapshot of objects, in any of the shapes described by Objects
+      constraint: the table unique constraint to use to determine conflicts
+      key_columns: the columns that identify a row, which must be included in attributes
+      update_condition: optional WHERE clause to limit updates for a
+        conflicting row
+      delete_condition: optional condition to limit which rows can be deleted,
+        for example when the snapshot only covers part of the table
+      binary: whether to use a binary COPY instead of a text COPY
+      column_types: the Postgres type name of each attribute for a binary COPY,
+        defaults to the types defined for the table in the SQLAlchemy metadata
+      return_counts: whether to count the inserted, updated and skipped rows
+      immutable_columns: columns that are not overwritten when updating a
+        conflicting row, such as the primary key or created_at
+      only_if_changed: whether to skip updating a conflicting row unless at least
+        one of the columns that would be overwritten has a different value
+
+    Returns:
+      a BatchResult with the counts of the upsert and the number of deleted rows
+    """
+    missing_key_columns = [column for column in key_columns if column not in attributes]
+    if missing_key_columns:
+        raise ValueError(
+            f"Key columns are missing from attributes: {', '.join(missing_key_columns)}"
+        )
+
+    session = BulkUpsertSession(
+        cur,
+        table,
+        attributes,
+        constraint,
+        update_condition=update_condition,
+        binary=binary,
+        column_types=column_types,
+        return_counts=return_counts,
+        immutable_columns=immutable_columns,
+        only_if_changed=only_if_changed,
+    )
+    result = session.upsert(objects)
+    result.deleted_count = session.delete_missing(key_columns, delete_condition)
+    return result
+
+
+class CommitMode(StrEnum):
+    # Commit each partition as soon as all of its batches have been written
+    PER_PARTITION = "per_partition"
+    # Commit every partition only once all of them have been written, and roll
+    # every partition back if any of them fails
+    ALL_OR_NOTHING = "all_or_nothing"
+
+
+# Marks the end of the rows sent to a partition
+_END_OF_PARTITION = object()
+# Marks that not every row of a partition could be sent, so it must not commit
+_ABORT_PARTITION = object()
+# The number of batches of rows that can wait in the queue of each partition
+_PARTITION_QUEUE_BATCHES = 2
+
+
+def parallel_bulk_upsert(
+    db_client: db.PostgresDBClient,
+    table: str,
+    attributes: Sequence[str],
+    objects: Objects,
+    constraint: str,
+    key_columns: Sequence[str],
+    partition_count: int = 4,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    commit_mode: CommitMode = CommitMode.PER_PARTITION,
+    update_condition: sql.SQL | None = None,
+    binary: bool = False,
+    column_types: Sequence[str] | None = None,
+    return_counts: bool = False,
+    immutable_columns: Collection[str] = DEFAULT_IMMUTABLE_COLUMNS,
+    only_if_changed: bool = False,
+) -> list[BatchResult]:
+    """Bulk insert or update objects over several connections at once.
+
+    The objects are split into partitions by a hash of their key columns,
+    and each partition is streamed in batches to its own pooled connection
+    from a separate thread. Partitioning by key means a row is never written
+    by two connections, so the partitions can't conflict or deadlock with
+    each other. Rows are handed to each partition in batches through a
+    bounded queue, so memory use stays flat however many objects there are.
+
+    A partition only commits once it has been sent all of its rows. If
+    reading the objects fails, or a partition fails before every row has
+    been sent, no partition commits.
+
+    The commit_mode determines the transactional behavior:
+      - PER_PARTITION: each partition commits on its own once it is done, so
+        if one partition fails after every row has been sent, the others may
+        still be committed.
+      - ALL_OR_NOTHING: each partition waits until every partition has written
+        all of its rows, then they all commit, or all roll back if any failed.
+        Postgres can't PREPARE a transaction that used a temp table, so the
+        commits are not a true two-phase commit: if a commit itself fails after
+        others have succeeded, such as from a lost connection, those others
+        remain committed.
+
+    The connection pool of the db_client needs at least partition_count connections.
+
+    Args:
+      db_client: the client to get a connection for each partition from
+      table: the name of the table to insert into or update
+      attributes: a sequence of attribute names to copy from each object
+      objects: the objects to upsert, in any of the shapes described by Objects
+      constraint: the table unique constraint to use to determine conflicts
+      key_columns: the columns to partition on, which must be included in
+        attributes, such as the columns of the unique constraint
+      partition_count: the number of connections to write with in parallel
+      batch_size: the number of objects to write per batch in each partition
+      commit_mode: when each partition is committed
+      update_condition: optional WHERE clause to limit updates for a
+        conflicting row
+      binary: whether to use a binary COPY instead of a text COPY
+      column_types: the Postgres type name of each attribute for a binary COPY,
+        defaults to the types defined for the table in the SQLAlchemy metadata
+      return_counts: whether to count the inserted, updated and skipped rows
+      immutable_columns: columns that are not overwritten when updating a
+        conflicting row, such as the primary key or created_at
+      only_if_changed: whether to skip updating a conflicting row unless at least
+        one of the columns that would be overwritten has a different value
+
+    Returns:
+      the BatchResults of every partition, ordered by partition and batch number
+    """
+    if partition_count <= 0:
+        raise ValueError("Partition count must be at least 1")
+    if batch_size <= 0:
+        raise ValueError("Batch size must be at least 1")
+    missing_key_columns = [column for column in key_columns if column not in attributes]
+    if missing_key_columns:
+        raise ValueError(
+            f"Key columns are missing from attributes: {', '.join(missing_key_columns)}"
+        )
+
+    if binary and column_types is None:
+        column_types = get_column_types(table, attributes)
+
+    key_getter = operator.itemgetter(*[attributes.index(column) for column in key_columns])
+    partition_queues: list[queue.Queue] = [
+        queue.Queue(maxsize=_PARTITION_QUEUE_BATCHES) for _ in range(partition_count)
+    ]
+    failed = threading.Event()
+    commit_barrier = threading.Barrier(partition_count)
+
+    def upsert_partition(partition_number: int) -> list[BatchResult]:
+        has_every_row = False
+
+        def iter_partition_batches() -> Iterator[list[Sequence[Any]]]:
+            nonlocal has_every_row
+            while (batch := partition_queues[partition_number].get()) is not _ABORT_PARTITION:
+                if batch is _END_OF_PARTITION:
+                    has_every_row = True
+                    return
+                yield batch
+
+        conn = None
+        try:
+            conn = db_client.get_raw_connection()
+            # SQLAlchemy's DBAPICursor type doesn't specify that it is a context manager
+            with conn.cursor() as cur:  # type: ignore
+                session = BulkUpsertSession(
+                    cur,
+                    table,
+                    attributes,
+                    constraint,
+                    update_condition=update_condition,
+                    binary=binary,
+                    column_types=column_types,
+                    return_counts=return_counts,
+                    immutable_columns=immutable_columns,
+                    only_if_changed=only_if_changed,
+                )
+                results = [session.upsert(batch) for batch in iter_partition_batches()]
+
+            if not has_every_row:
+                # Another partition or reading the objects failed, which is raised instead
+                conn.rollback()
+                return []
+            if commit_mode == CommitMode.ALL_OR_NOTHING:
+                # Raises BrokenBarrierError if another partition failed
+                commit_barrier.wait()
+            conn.commit()
+        except BaseException:
+            failed.set()
+            commit_barrier.abort()
+            if conn is not None:
+                conn.rollback()
+            raise
+        finally:
+            if conn is not None:
+                conn.close()
+
+        for result in results:
+            result.partition_number = partition_number
+        return results
+
+    start_time = time.monotonic()
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=partition_count, thread_name_prefix=f"bulk_upsert_{table}"
+    ) as executor:
+        futures = [
+            executor.submit(upsert_partition, partition_number)
+            for partition_number in range(partition_count)
+        ]
+
+        def put(partition_number: int, item: Any) -> None:
+            # Don't block forever on the queue of a partition that has stopped reading
+            while not futures[partition_number].done():
+                try:
+                    partition_queues[partition_number].put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+        # Rows are sent to the partitions in batches, so that the queues are not
+        # locked for every row
+        partition_batches: list[list[Sequence[Any]]] = [[] for _ in range(partition_count)]
+        is_every_row_sent = False
+        try:
+            for row in _iter_rows(objects, attributes):
+                if failed.is_set():
+                    break
+                partition_number = hash(key_getter(row)) % partition_count
+                batch = partition_batches[partition_number]
+                batch.append(row)
+                if len(batch) == batch_size:
+                    put(partition_number, batch)
+                    partition_batches[partition_number] = []
+            else:
+                for partition_number, batch in enumerate(partition_batches):
+                    if batch:
+                        put(partition_number, batch)
+                is_every_row_sent = True
+        except BaseException:
+            # Make sure nothing is committed in ALL_OR_NOTHING mode
+            # if reading the objects fails
+            failed.set()
+            commit_barrier.abort()
+            raise
+        finally:
+            # Always end every partition so that no thread waits forever, and
+            # so that none commits unless it was sent all of its rows
+            end_of_partition = _END_OF_PARTITION if is_every_row_sent else _ABORT_PARTITION
+            for partition_number in range(partition_count):
+                put(partition_number, end_of_partition)
+
+        # If any partition failed, raise its exception rather than the
+        # BrokenBarrierError of the partitions that were waiting to commit
+        errors = [error for future in futures if (error := future.exception()) is not None]
+        if errors:
+            raise next(
+                (error for error in errors if not isinstance(error, threading.BrokenBarrierError)),
+                errors[0],
+            )
+        results = [result for future in futures for result in future.result()]
+
+    row_count = sum(result.row_count for result in results)
+    elapsed_seconds = time.monotonic() - start_time
+    logger.info(
+        "Upserted %s rows into %s over %s partitions",
+        row_count,
+        table,
+        partition_count,
+        extra={
+            "table": table,
+            "partition_count": partition_count,
+            "commit_mode": commit_mode,
+            "row_count": row_count,
+            "elapsed_seconds": round(elapsed_seconds, 3),
+            "rows_per_second": round(row_count / elapsed_seconds, 1) if elapsed_seconds else None,
+        },
+    )
+    return results
+
+
+def _prepare_staging_table(
+    cur: psycopg.Cursor,
+    staging_table: str,
+    src_table: str,
+    columns: Sequence[str] | None = None,
+) -> None:
+    """
+    Create a staging table unless it is already known to exist on the connection,
+    and make sure that it is empty.
+    Args:
+      cur: the Cursor object from the pyscopg library
+      staging_table: the name of the staging table
+      src_table: the name of the existing table to copy the structure from
+      columns: optional subset of columns to include in the staging table
+    """
+    conn = cur.connection
+    staging_tables = _staging_tables.setdefault(conn, set())
+    if staging_table in staging_tables:
+        try:
+            # Within a transaction this is a savepoint, so that a missing
+            # staging table does not abort the caller's transaction
+            with conn.transaction():
+                _truncate_table(cur, staging_table)
+            return
+        except psycopg.errors.UndefinedTable:
+            # The temp tables of the connection were dropped, such as by
+            # DISCARD ALL when a pool reset the connection
+            logger.info(
+                "Staging table %s no longer exists, creating it again",
+                staging_table,
+                extra={"staging_table": staging_table},
+            )
+            staging_tables.discard(staging_table)
+
+    if conn.info.transaction_status == psycopg.pq.TransactionStatus.IDLE:
+        # No transaction is in progress, so create the staging table in a
+        # transaction of its own, which commits nothing else, so that it is
+        # kept for the life of the connection
+        with conn.transaction():
+            _create_staging_table(cur, staging_table, src_table=src_table, columns=columns)
+        staging_tables.add(staging_table)
+    else:
+        # The staging table would be dropped if the caller's transaction is
+        # rolled back, so don't track it. Later calls in the same transaction
+        # find it with IF NOT EXISTS, so it may hold rows from those calls.
+        _create_staging_table(cur, staging_table, src_table=src_table, columns=columns)
+        _truncate_table(cur, staging_table)
+
+
+def get_column_types(table: str, columns: Sequence[str]) -> list[str]:
+    """Get the Postgres type names of columns from the SQLAlchemy metadata.
+
+    The returned names can be passed to psycopg's Copy.set_types
+    to configure the binary dumper of each column for a binary COPY.
+
+    Args:
+      table: the name of a table defined in src.db.models
+      columns: a sequence of column names in that table
+    """
+    if table not in metadata.tables:
+        raise ValueError(f"Table {table} is not defined in the SQLAlchemy metadata")
+    table_columns = metadata.tables[table].columns
+
+    column_types = []
+    for column in columns:
+        if column not in table_columns:
+            raise ValueError(f"Column {column} is not defined for table {table}")
+        type_name = table_columns[column].type.compile(dialect=postgresql.dialect())
+        # Remove any type modifiers such as the length in VARCHAR(5)
+        column_types.append(re.sub(r"\(.*\)", "", type_name).lower())
+    return column_types
+
+
+def _create_staging_table(
+    cur: psycopg.Cursor,
+    staging_table: str,
+    src_table: str,
+    columns: Sequence[str] | None = None,
+) -> None:
+    """
+    Create a temp table that lives for the rest of the connection, unless it is
+    created in a transaction that is then rolled back.
     Use an existing table to determine the table structure.
-    Once the transaction is committed the temp table will be deleted.
+    Rows are deleted from the table whenever a transaction is committed.
     Args:
-      temp_table: the name of the temporary table to create
+      staging_table: the name of the temporary table to create
       src_table: the name of the existing table
+      columns: optional subset of columns to include, without their constraints
     """
+    if columns is not None:
+        cur.execute(
+            sql.SQL(
+                "CREATE TEMP TABLE IF NOT EXISTS {staging_table}\
+          ON COMMIT DELETE ROWS\
+          AS SELECT {columns} FROM {src_table} WITH NO DATA"
+            ).format(
+                staging_table=sql.Identifier(staging_table),
+                columns=sql.SQL(",").join(map(sql.Identifier, columns)),
+                src_table=sql.Identifier(src_table),
+            )
+        )
+        return
+
     cur.execute(
         sql.SQL(
-            "CREATE TEMP TABLE {temp_table}\
+            "CREATE TEMP TABLE IF NOT EXISTS {staging_table}\
       (LIKE {src_table})\
-      ON COMMIT DROP"
+      ON COMMIT DELETE ROWS"
         ).format(
-            temp_table=sql.Identifier(temp_table),
+            staging_table=sql.Identifier(staging_table),
             src_table=sql.Identifier(src_table),
         )
     )
 
 
+def _truncate_table(cur: psycopg.Cursor, table: str) -> None:
+    """
+    Remove all rows from a table, such as a temp table between batches.
+    Args:
+      table: the name of the table to truncate
+    """
+    cur.execute(sql.SQL("TRUNCATE {table}").format(table=sql.Identifier(table)))
+
+
 def _bulk_insert(
     cur: psycopg.Cursor,
     table: str,
     columns: Sequence[str],
-    objects: Sequence[Any],
-) -> None:
+    objects: Objects,
+    column_types: Sequence[str] | None = None,
+) -> int:
     """
-    Write data from a sequence of objects to a temp table.
+    Write data from an iterable of objects to a temp table.
     This function uses the PostgreSQL COPY command which is highly performant.
     Args:
       cur: the Cursor object from the pyscopg library
       table: the name of the temporary table
       columns: a sequence of column names that are attributes of each object
-      objects: a sequence of objects with attributes defined by columns
+      objects: the objects to write, in any of the shapes described by Objects
+      column_types: if set, the Postgres type name of each column,
+        used to write the rows with a binary COPY
+    Returns:
+      the number of rows written
     """
+    query = _build_copy_query(table, tuple(columns), binary=column_types is not None)
+    row_count = 0
+    with cur.copy(query) as copy:
+        if column_types is not None:
+            copy.set_types(column_types)
+        for values in _iter_rows(objects, columns):
+            copy.write_row(values)
+            row_count += 1
+    return row_count
+
+
+@functools.lru_cache(maxsize=256)
+def _build_copy_query(table: str, columns: tuple[str, ...], binary: bool) -> sql.Composed:
     columns_sql = sql.SQL(",").join(map(sql.Identifier, columns))
-    query = sql.SQL("COPY {table}({columns}) FROM STDIN").format(
+    return sql.SQL("COPY {table}({columns}) FROM STDIN {options}").format(
         table=sql.Identifier(table),
         columns=columns_sql,
+        options=sql.SQL("(FORMAT BINARY)" if binary else ""),
     )
-    with cur.copy(query) as copy:
-        for obj in objects:
-            values = [getattr(obj, column) for column in columns]
-            copy.write_row(values)
 
 
-def _write_from_table_to_table(
-    cur: psycopg.Cursor,
+def _iter_rows(objects: Objects, columns: Sequence[str]) -> Iterator[Sequence[Any]]:
+    """
+    Convert objects into rows of values ordered the same as columns.
+    The shape of every object is assumed to be the same as the first one.
+    Args:
+      objects: the objects to convert, in any of the shapes described by Objects
+      columns: a sequence of column names
+    """
+    if isinstance(objects, Mapping):
+        missing_columns = [column for column in columns if column not in objects]
+        if missing_columns:
+            raise ValueError(f"Columnar data is missing columns: {', '.join(missing_columns)}")
+        if len({len(objects[column]) for column in columns}) > 1:
+            raise ValueError("Columnar data has columns of different lengths")
+        return zip(*(objects[column] for column in columns))
+
+    iterator: Iterator[Any] = iter(objects)
+    first = next(iterator, None)
+    if first is None:
+        return iter(())
+    all_objects = itertools.chain([first], iterator)
+
+    if isinstance(first, (tuple, list)):
+        return all_objects
+
+    getter = (
+        operator.itemgetter(*columns)
+        if isinstance(first, Mapping)
+        else operator.attrgetter(*columns)
+    )
+    if len(columns) == 1:
+        # The getters return a single value rather than a tuple for one column
+        return ((getter(obj),) for obj in all_objects)
+    return map(getter, all_objects)
+
+
+def _build_write_query(
     src_table: str,
     dest_table: str,
     columns: Sequence[str],
     constraint: str,
     update_condition: sql.SQL | None = None,
-) -> None:
+    return_counts: bool = False,
+    return_keys: Sequence[str] | None = None,
+    immutable_columns: Collection[str] = DEFAULT_IMMUTABLE_COLUMNS,
+    only_if_changed: bool = False,
+) -> sql.Composed:
     """
-    Write data from one table to another.
+    Build the query to write data from one table to another.
     If there are conflicts due to unique constraints, overwrite existing data.
     Args:
-      cur: the Cursor object from the pyscopg library
       src_table: the name of the table that will be copied from
       dest_table: the name of the table that will be written to
       columns: a sequence of column names to copy over
       constraint: the arbiter constraint to use to determine conflicts
       update_condition: optional WHERE clause to limit updates for a
         conflicting row
+      return_counts: whether to count the inserted and updated rows
+      return_keys: optional column names to return for each inserted and updated row
+      immutable_columns: columns that are not overwritten for a conflicting row
+      only_if_changed: whether to only update a conflicting row if the value
+        of at least one of the updated columns is different
     """
-    if not update_condition:
-        update_condition = sql.SQL("")
+    update_columns = [column for column in columns if column not in immutable_columns]
+
+    condition_sql: sql.Composable = update_condition or sql.SQL("")
+    if only_if_changed and update_columns:
+        condition_sql = sql.SQL(
+            "WHERE ({dest_columns}) IS DISTINCT FROM ({excluded_columns})"
+        ).format(
+            dest_columns=sql.SQL(",").join(
+                sql.SQL("{dest_table}.{column}").format(
+                    dest_table=sql.Identifier(dest_table), column=sql.Identifier(column)
+                )
+                for column in update_columns
+            ),
+            excluded_columns=sql.SQL(",").join(
+                sql.SQL("EXCLUDED.{column}").format(column=sql.Identifier(column))
+                for column in update_columns
+            ),
+        )
+
+    # If every column is immutable there is nothing to update
+    conflict_action: sql.Composable = sql.SQL("DO NOTHING")
+    if update_columns:
+        update_sql = sql.SQL(",").join(
+            [
+                sql.SQL("{column} = EXCLUDED.{column}").format(
+                    column=sql.Identifier(column),
+                )
+                for column in update_columns
+            ]
+        )
+        conflict_action = sql.SQL("DO UPDATE SET {update_sql} {update_condition}").format(
+            update_sql=update_sql, update_condition=condition_sql
+        )
 
     columns_sql = sql.SQL(",").join(map(sql.Identifier, columns))
-    update_sql = sql.SQL(",").join(
-        [
-            sql.SQL("{column} = EXCLUDED.{column}").format(
-                column=sql.Identifier(column),
-            )
-            for column in columns
-            if column not in ["id", "number"]
-        ]
-    )
     query = sql.SQL(
         "INSERT INTO {dest_table}({columns})\
     SELECT {columns} FROM {src_table}\
-    ON CONFLICT ON CONSTRAINT {constraint} DO UPDATE SET {update_sql}\
-      {update_condition}"
+    ON CONFLICT ON CONSTRAINT {constraint} {conflict_action}"
     ).format(
         dest_table=sql.Identifier(dest_table),
         columns=columns_sql,
         src_table=sql.Identifier(src_table),
         constraint=sql.Identifier(constraint),
-        update_sql=update_sql,
-        update_condition=update_condition,
+        conflict_action=conflict_action,
+    )
+
+    if not return_counts and return_keys is None:
+        return query
+
+    # xmax is only zero for a newly inserted row version, so it distinguishes
+    # inserted rows from updated ones. Conflicting rows that are not updated
+    # because of the update_condition are not returned at all.
+    if return_keys is None:
+        query = sql.SQL(
+            "WITH upserted AS ({query} RETURNING (xmax = 0) AS inserted)\
+        SELECT inserted, count(*) FROM upserted GROUP BY inserted"
+        ).format(query=query)
+    else:
+        query = sql.SQL(
+            "WITH upserted AS ({query} RETURNING (xmax = 0) AS inserted, {keys})\
+        SELECT inserted, {keys} FROM upserted"
+        ).format(query=query, keys=sql.SQL(",").join(map(sql.Identifier, return_keys)))
+
+    return query
+
+
+@functools.lru_cache(maxsize=256)
+def _build_cached_write_query(
+    src_table: str,
+    dest_table: str,
+    columns: tuple[str, ...],
+    constraint: str,
+    return_counts: bool,
+    return_keys: tuple[str, ...] | None,
+    immutable_columns: frozenset[str],
+    only_if_changed: bool,
+) -> sql.Composed:
+    """
+    Build the query to write data from one table to another, reusing
+    the query built for a previous batch with the same arguments.
+    A query with a custom update_condition isn't cached, as psycopg's
+    sql.SQL objects can't be hashed.
+    """
+    return _build_write_query(
+        src_table,
+        dest_table,
+        columns,
+        constraint,
+        return_counts=return_counts,
+        return_keys=return_keys,
+        immutable_columns=immutable_columns,
+        only_if_changed=only_if_changed,
+    )
+
+
+def _write_from_table_to_table(
+    cur: psycopg.Cursor,
+    query: sql.Composed,
+    return_counts: bool = False,
+    return_keys: Sequence[str] | None = None,
+) -> _WriteCounts | None:
+    """
+    Write data from one table to another with a query from _build_write_query.
+    Args:
+      cur: the Cursor object from the pyscopg library
+      query: the query to execute
+      return_counts: whether the query was built with return_counts
+      return_keys: the return_keys that the query was built with
+    Returns:
+      the inserted and updated counts if return_counts or return_keys is set
+    """
+    if not return_counts and return_keys is None:
+        cur.execute(query)
+        return None
+
+    # Use a separate cursor so the results don't depend on the caller's row factory
+    with cur.connection.cursor(row_factory=rows.tuple_row) as result_cur:
+        result_cur.execute(query)
+        results = result_cur.fetchall()
+
+    write_counts = _WriteCounts()
+    if return_keys is None:
+        for inserted, count in results:
+            if inserted:
+                write_counts.inserted_count = count
+            else:
+                write_counts.updated_count = count
+        return write_counts
+
+    write_counts.inserted_keys = [tuple(row[1:]) for row in results if row[0]]
+    write_counts.updated_keys = [tuple(row[1:]) for row in results if not row[0]]
+    write_counts.inserted_count = len(write_counts.inserted_keys)
+    write_counts.updated_count = len(write_counts.updated_keys)
+    return write_counts
+
+
+def _delete_from_table_by_table(
+    cur: psycopg.Cursor,
+    src_table: str,
+    dest_table: str,
+    key_columns: Sequence[str],
+    matching: bool,
+    delete_condition: sql.Composable | None = None,
+) -> int:
+    """
+    Delete rows from one table based on the keys in another.
+    Args:
+      cur: the Cursor object from the pyscopg library
+      src_table: the name of the table with the keys
+      dest_table: the name of the table to delete from
+      key_columns: the columns to match rows on
+      matching: whether to delete the rows that have a matching key in src_table,
+        or the rows that don't
+      delete_condition: optional condition to limit which rows can be deleted
+    Returns:
+      the number of deleted rows
+    """
+    join_sql = sql.SQL(" AND ").join(
+        [
+            sql.SQL("{dest_table}.{column} = {src_table}.{column}").format(
+                dest_table=sql.Identifier(dest_table),
+                src_table=sql.Identifier(src_table),
+                column=sql.Identifier(column),
+            )
+            for column in key_columns
+        ]
     )
+    if matching:
+        query = sql.SQL("DELETE FROM {dest_table} USING {src_table} WHERE {join_sql}").format(
+            dest_table=sql.Identifier(dest_table),
+            src_table=sql.Identifier(src_table),
+            join_sql=join_sql,
+        )
+    else:
+        query = sql.SQL(
+            "DELETE FROM {dest_table}\
+    WHERE NOT EXISTS (SELECT 1 FROM {src_table} WHERE {join_sql})"
+        ).format(
+            dest_table=sql.Identifier(dest_table),
+            src_table=sql.Identifier(src_table),
+            join_sql=join_sql,
+        )
+
+    if delete_condition is not None:
+        query = sql.SQL("{query} AND ({delete_condition})").format(
+            query=query, delete_condition=delete_condition
+        )
+
     cur.execute(query)
+    return cur.rowcount
 
 
-__all__ = ["bulk_upsert"]
+__all__ = [
+    "BatchResult",
+    "BulkUpsertSession",
+    "CommitMode",
+    "ModelTableSpec",
+    "bulk_delete",
+    "bulk_sync",
+    "bulk_upsert",
+    "bulk_upsert_models",
+    "bulk_upsert_stream",
+    "get_column_types",
+    "get_model_table_spec",
+    "parallel_bulk_upsert",
+]
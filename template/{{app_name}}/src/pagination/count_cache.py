@@ -0,0 +1,166 @@
+"""
+This module contains the CountCache class, which caches the total record
+counts of paginated queries for a short time.
+
+Clients paging through the results of a search with the same filters would
+otherwise recount the records for every page. A CountCache keeps each count
+for ttl_seconds, keyed on the compiled statement, its bound parameters, and
+the versions of the tables that it reads. Writes bump the versions of the
+tables they change, so that counts cached before the write are not used.
+
+The counts and table versions are kept in a CountCacheStore.
+LocalCountCacheStore keeps them in the memory of the process, evicting the
+least recently used counts. A store shared by every process, such as one
+backed by Redis, can implement the same interface. With the local store,
+table versions are only bumped in the process that made the write, so other
+processes may return counts that are up to ttl_seconds stale.
+
+Usage:
+    count_cache = CountCache(LocalCountCacheStore(), ttl_seconds=30)
+
+    paginator = Paginator(stmt, db_session, count_cache=count_cache)
+    ...
+    # After committing a write to the user table
+    count_cache.bump_table_versions(["user"])
+
+The application wide cache configured by PAGINATION_COUNT_CACHE_TTL_SECONDS
+is returned by get_count_cache().
+"""
+import abc
+import functools
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable
+
+from pydantic import Field
+from sqlalchemy import Select
+from sqlalchemy.sql.util import find_tables
+
+import src.adapters.db as db
+from src.util.env_config import PydanticBaseEnvConfig
+
+
+class CountCacheConfig(PydanticBaseEnvConfig):
+    # Seconds to cache the total record counts of paginated queries, or 0 to not cache them
+    ttl_seconds: float = Field(0, alias="PAGINATION_COUNT_CACHE_TTL_SECONDS")
+    # The most counts to keep in the memory of each process
+    max_entries: int = Field(1000, alias="PAGINATION_COUNT_CACHE_MAX_ENTRIES")
+
+
+class CountCacheStore(abc.ABC, metaclass=abc.ABCMeta):
+    """Storage of cached counts and table versions."""
+
+    @abc.abstractmethod
+    def get(self, key: str) -> int | None:
+        """Return the count of a key, or None if it is not cached or has expired."""
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def set(self, key: str, count: int, ttl_seconds: float) -> None:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def get_table_version(self, table_name: str) -> int:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def increment_table_version(self, table_name: str) -> None:
+        raise NotImplementedError()
+
+
+class LocalCountCacheStore(CountCacheStore):
+    """CountCacheStore in the memory of the process, evicting the least recently used counts."""
+
+    def __init__(self, max_entries: int = 1000, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self._clock = clock
+        # The count and expiry time of each key, from least to most recently used
+        self._entries: OrderedDict[str, tuple[int, float]] = OrderedDict()
+        # Kept apart from the counts so that versions are never evicted, as a
+        # version reset to an earlier value would make stale counts current again
+        self._table_versions: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> int | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            count, expires_at = entry
+            if self._clock() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return count
+
+    def set(self, key: str, count: int, ttl_seconds: float) -> None:
+        with self._lock:
+            self._entries[key] = (count, self._clock() + ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_table_version(self, table_name: str) -> int:
+        with self._lock:
+            return self._table_versions.get(table_name, 0)
+
+    def increment_table_version(self, table_name: str) -> None:
+        with self._lock:
+            self._table_versions[table_name] = self._table_versions.get(table_name, 0) + 1
+
+
+class CountCache:
+    """Cache of the total record counts of paginated queries."""
+
+    def __init__(self, store: CountCacheStore, ttl_seconds: float):
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+
+    def get_key(self, db_session: db.Session, stmt: Select) -> str:
+        """Return the cache key of the count of a statement.
+
+        Get the key before counting, so that a count made while a write is
+        committed is cached under the table versions from before the write.
+        """
+        compiled = stmt.order_by(None).compile(bind=db_session.get_bind())
+        table_names = sorted({table.fullname for table in find_tables(stmt)})
+        key_data = {
+            "statement": str(compiled),
+            "parameters": compiled.params,
+            "table_versions": {name: self.store.get_table_version(name) for name in table_names},
+        }
+        key_json = json.dumps(key_data, sort_keys=True, default=str)
+        return "count:" + hashlib.sha256(key_json.encode()).hexdigest()
+
+    def get(self, key: str) -> int | None:
+        return self.store.get(key)
+
+    def set(self, key: str, count: int) -> None:
+        self.store.set(key, count, self.ttl_seconds)
+
+    def bump_table_versions(self, table_names: Iterable[str]) -> None:
+        """Stop using the cached counts of queries that read any of the tables.
+
+        Call after committing writes to the tables.
+        """
+        for table_name in table_names:
+            self.store.increment_table_version(table_name)
+
+
+@functools.cache
+def get_count_cache() -> CountCache | None:
+    """Return the application wide count cache, or None if it is not enabled."""
+    config = CountCacheConfig()
+    if config.ttl_seconds <= 0:
+        return None
+    return CountCache(LocalCountCacheStore(config.max_entries), config.ttl_seconds)
+
+
+def bump_table_versions(table_names: Iterable[str]) -> None:
+    """Bump the table versions of the application wide count cache, if enabled."""
+    count_cache = get_count_cache()
+    if count_cache is not None:
+        count_cache.bump_table_versions(table_names)
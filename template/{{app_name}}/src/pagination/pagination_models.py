@@ -4,7 +4,7 @@ from typing import Self
 
 from pydantic import BaseModel
 
-from src.pagination.paginator import Paginator
+from src.pagination.paginator import Paginator, TotalRecordsMode
 
 
 class SortDirection(StrEnum):
@@ -23,7 +23,11 @@ class SortingParams(BaseModel):
 
 class PagingParams(BaseModel):
     page_size: int
-    page_offset: int
+    page_offset: int = 1
+    # The next_cursor of a previous page, to fetch the page after it with
+    # keyset pagination instead of page_offset
+    cursor: str | None = None
+    total_records_mode: TotalRecordsMode = TotalRecordsMode.EXACT
 
 
 class PaginationParams(BaseModel):
@@ -33,24 +37,36 @@ class PaginationParams(BaseModel):
 
 @dataclasses.dataclass
 class PaginationInfo:
-    page_offset: int
+    # None for a page fetched with a cursor
+    page_offset: int | None
     page_size: int
 
     order_by: str
     sort_direction: SortDirection
 
-    total_records: int
-    total_pages: int
+    # None if the records were not counted
+    total_records: int | None
+    total_pages: int | None
+
+    next_cursor: str | None = None
+    # Whether total_records is an estimate
+    total_records_approximate: bool = False
 
     @classmethod
     def from_pagination_models(
         cls, pagination_params: PaginationParams, paginator: Paginator
     ) -> Self:
         return cls(
-            page_offset=pagination_params.paging.page_offset,
+            page_offset=(
+                pagination_params.paging.page_offset
+                if pagination_params.paging.cursor is None
+                else None
+            ),
             page_size=pagination_params.paging.page_size,
             order_by=pagination_params.sorting.order_by,
             sort_direction=pagination_params.sorting.sort_direction,
             total_records=paginator.total_records,
             total_pages=paginator.total_pages,
+            next_cursor=paginator.next_cursor,
+            total_records_approximate=paginator.total_records_approximate,
         )
@@ -1,9 +1,11 @@
-from typing import Type
+from typing import Any, Type
 
 from apiflask import fields, validators
+from marshmallow import ValidationError, validates_schema
 
 from src.api.schemas import request_schema
 from src.pagination.pagination_models import SortDirection
+from src.pagination.paginator import TotalRecordsMode
 
 
 class PaginationSchema(request_schema.OrderedSchema):
@@ -13,11 +15,39 @@ class PaginationSchema(request_schema.OrderedSchema):
         metadata={"description": "The size of the page to fetch", "example": 25},
     )
     page_offset = fields.Integer(
-        required=True,
         validate=[validators.Range(min=1)],
-        metadata={"description": "The page number to fetch, starts counting from 1", "example": 1},
+        metadata={
+            "description": "The page number to fetch, starts counting from 1. Defaults to 1",
+            "example": 1,
+        },
+    )
+    cursor = fields.String(
+        metadata={
+            "description": (
+                "The next_cursor of a previously fetched page, to fetch the page after it."
+                " Faster than page_offset for deep pages. Use instead of page_offset"
+            ),
+        },
+    )
+
+    total_records_mode = fields.Enum(
+        TotalRecordsMode,
+        by_value=True,
+        metadata={
+            "description": (
+                "How to get total_records: exact counts the records, with_page counts them"
+                " in the same query as the page, first_page counts them only for the first"
+                " page, estimate uses an approximate count, and none skips it."
+                " Defaults to exact"
+            ),
+        },
     )
 
+    @validates_schema
+    def validate_page_offset_or_cursor(self, data: dict, **kwargs: Any) -> None:
+        if "page_offset" in data and "cursor" in data:
+            raise ValidationError("Only one of page_offset and cursor can be set", "cursor")
+
 
 def generate_sorting_schema(
     cls_name: str, order_by_fields: list[str] | None = None
@@ -66,16 +96,28 @@ class PaginationInfoSchema(request_schema.OrderedSchema):
     # This is part of the response schema to provide all pagination information back to a user
 
     page_offset = fields.Integer(
-        metadata={"description": "The page number that was fetched", "example": 1}
+        allow_none=True,
+        metadata={
+            "description": "The page number that was fetched, or null if fetched with a cursor",
+            "example": 1,
+        },
     )
     page_size = fields.Integer(
         metadata={"description": "The size of the page fetched", "example": 25}
     )
     total_records = fields.Integer(
-        metadata={"description": "The total number of records fetchable", "example": 42}
+        allow_none=True,
+        metadata={
+            "description": "The total number of records fetchable, or null if not counted",
+            "example": 42,
+        },
     )
     total_pages = fields.Integer(
-        metadata={"description": "The total number of pages that can be fetched", "example": 2}
+        allow_none=True,
+        metadata={
+            "description": "The total number of pages that can be fetched, or null if not counted",
+            "example": 2,
+        },
     )
     order_by = fields.String(
         metadata={"description": "The field that the records were sorted by", "example": "id"}
@@ -85,3 +127,14 @@ class PaginationInfoSchema(request_schema.OrderedSchema):
         by_value=True,
         metadata={"description": "The direction the records are sorted"},
     )
+    next_cursor = fields.String(
+        allow_none=True,
+        metadata={
+            "description": (
+                "The cursor to fetch the next page with, or null if this is the last page"
+            ),
+        },
+    )
+    total_records_approximate = fields.Boolean(
+        metadata={"description": "Whether total_records and total_pages are estimates"}
+    )
@@ -1,10 +1,29 @@
+import base64
+import binascii
+import datetime
+import json
 import math
-from typing import Generic, Sequence, TypeVar
+from concurrent.futures import Future, ThreadPoolExecutor
+from enum import StrEnum
+from typing import Any, Generic, Iterator, Sequence, TypeVar
 
-from sqlalchemy import Select, func
+from sqlalchemy import (
+    ClauseElement,
+    Executable,
+    Select,
+    asc,
+    desc,
+    func,
+    literal,
+    tuple_,
+)
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import InstrumentedAttribute
+from sqlalchemy.sql.compiler import SQLCompiler
 
 import src.adapters.db as db
 from src.db.models.base import Base
+from src.pagination.count_cache import CountCache
 
 DEFAULT_PAGE_SIZE = 25
 
@@ -12,6 +31,25 @@ DEFAULT_PAGE_SIZE = 25
 T = TypeVar("T", bound=Base)
 
 
+class TotalRecordsMode(StrEnum):
+    """How a Paginator gets total_records."""
+
+    # Count the records with a count(*) of the statement
+    EXACT = "exact"
+    # Count the records in the same query as the page, with count(*) OVER (),
+    # which saves a round trip. Pages after a cursor, and pages past the end,
+    # are still counted with a separate count(*)
+    WITH_PAGE = "with_page"
+    # Count the records only when fetching the first page, as clients paging
+    # through results already have the total from it
+    FIRST_PAGE = "first_page"
+    # Use the row estimate of the query planner, which needs no scan but may be
+    # far off, especially with filters on columns that are correlated
+    ESTIMATE = "estimate"
+    # Don't get the total
+    NONE = "none"
+
+
 class Paginator(Generic[T]):
     """
     DB select statement paginator that helps with setting up queries
@@ -36,10 +74,51 @@ class Paginator(Generic[T]):
         paginator: Paginator[User] = Paginator(stmt, db_session, page_size=10)
         users: list[User] = paginator.page_at(page_offset=2)
 
+    Offset pagination scans and discards every row before the page, so deep
+    pages get slower. For keyset pagination, pass the columns to sort by as
+    keyset_columns, ending with a unique column such as the primary key as a
+    tie-breaker. The statement is then ordered by those columns, and each page
+    resumes after the last row of the previous page, which it identifies with
+    an opaque cursor::
+
+        paginator: Paginator[User] = Paginator(
+            select(User), db_session, page_size=10, keyset_columns=[User.created_at, User.id]
+        )
+        users = paginator.page_after(cursor=None)  # the first page
+        users = paginator.page_after(cursor=paginator.next_cursor)  # the second page
+
+    The keyset columns must not be nullable.
+
+    Counting the records for total_records can cost as much as fetching the
+    page. Use total_records_mode to count in the same query as the page, to
+    skip the count, to only count for the first page, or to use the estimate of
+    the query planner instead. total_records and total_pages are None when
+    not counted, and total_records_approximate is True when they are estimated.
+
+    Pass a count_cache to reuse exact counts of the same statement and
+    parameters for a short time, see src.pagination.count_cache.
+
+    Batch jobs that walk every record can use iter_all, which fetches keyset
+    batches and keeps the session from growing::
+
+        paginator: Paginator[User] = Paginator(
+            select(User), db_session, keyset_columns=[User.id],
+            total_records_mode=TotalRecordsMode.NONE,
+        )
+        for user in paginator.iter_all(batch_size=1000):
+            ...
     """
 
-    def __init__(self, stmt: Select, db_session: db.Session, page_size: int = 25):
-        self.stmt = stmt
+    def __init__(
+        self,
+        stmt: Select,
+        db_session: db.Session,
+        page_size: int = 25,
+        keyset_columns: Sequence[InstrumentedAttribute] | None = None,
+        is_ascending: bool = True,
+        total_records_mode: TotalRecordsMode = TotalRecordsMode.EXACT,
+        count_cache: CountCache | None = None,
+    ):
         self.db_session = db_session
 
         if page_size <= 0:
@@ -47,21 +126,275 @@ class Paginator(Generic[T]):
 
         self.page_size = page_size
 
-        self.total_records = _get_record_count(self.db_session, self.stmt)
-        self.total_pages = int(math.ceil(self.total_records / self.page_size))
+        self.keyset_columns = list(keyset_columns or [])
+        self.is_ascending = is_ascending
+        if self.keyset_columns:
+            sort_fn = asc if is_ascending else desc
+            stmt = stmt.order_by(None).order_by(
+                *[sort_fn(column) for column in self.keyset_columns]
+            )
+        self.stmt = stmt
+
+        # The cursor of the last row of the last page fetched, if there may be more
+        # rows after it and keyset_columns are set
+        self.next_cursor: str | None = None
+
+        self.total_records_mode = total_records_mode
+        self.count_cache = count_cache
+        self._count_cache_key: str | None = None
+        self.total_records: int | None = None
+        self.total_pages: int | None = None
+        self.total_records_approximate = False
+
+        if total_records_mode == TotalRecordsMode.EXACT:
+            self._set_total_records(self._count())
+        elif total_records_mode == TotalRecordsMode.ESTIMATE:
+            self._set_total_records(_get_estimated_record_count(self.db_session, self.stmt))
+            self.total_records_approximate = True
+
+    def _count(self) -> int:
+        cached_count = self._get_cached_count()
+        if cached_count is not None:
+            return cached_count
+
+        count = _get_record_count(self.db_session, self.stmt)
+        self._set_cached_count(count)
+        return count
+
+    def _get_cached_count(self) -> int | None:
+        if self.count_cache is None:
+            return None
+        if self._count_cache_key is None:
+            self._count_cache_key = self.count_cache.get_key(self.db_session, self.stmt)
+        return self.count_cache.get(self._count_cache_key)
+
+    def _set_cached_count(self, count: int) -> None:
+        if self.count_cache is not None and self._count_cache_key is not None:
+            self.count_cache.set(self._count_cache_key, count)
+
+    def _set_total_records(self, total_records: int) -> None:
+        self.total_records = total_records
+        self.total_pages = int(math.ceil(total_records / self.page_size))
+
+    def _count_first_page(self) -> None:
+        if self.total_records_mode == TotalRecordsMode.FIRST_PAGE and self.total_records is None:
+            self._set_total_records(self._count())
 
     def page_at(self, page_offset: int) -> Sequence[T]:
         """
         Get a specific page for pagination
         """
-        if page_offset <= 0 or page_offset > self.total_pages:
+        if page_offset == 1:
+            self._count_first_page()
+
+        # Skip the query for pages past the end, when the exact total is known
+        if page_offset <= 0 or (
+            self.total_pages is not None
+            and not self.total_records_approximate
+            and page_offset > self.total_pages
+        ):
             return []
 
         offset = self.page_size * (page_offset - 1)
 
-        return (
-            self.db_session.execute(self.stmt.offset(offset).limit(self.page_size)).scalars().all()
+        page = self._fetch_page(self.stmt.offset(offset))
+        if self.total_records_mode == TotalRecordsMode.WITH_PAGE and self.total_records is None:
+            # An empty page has no count, and is either past the end or of no records
+            self._set_total_records(self._count() if page_offset > 1 else 0)
+        return page
+
+    def page_after(self, cursor: str | None) -> Sequence[T]:
+        """
+        Get the page after the row of a cursor, or the first page if cursor is None
+
+        Raises ValueError if keyset_columns are not set or the cursor is not valid
+        for them.
+        """
+        if not self.keyset_columns:
+            raise ValueError("Keyset pagination requires keyset_columns")
+
+        stmt = self.stmt
+        if cursor is None:
+            self._count_first_page()
+        else:
+            values = decode_cursor(cursor, self.keyset_columns, self.is_ascending)
+            stmt = self._get_keyset_stmt(values)
+
+            # A window count would only count the rows after the cursor
+            if self.total_records_mode == TotalRecordsMode.WITH_PAGE and self.total_records is None:
+                self._set_total_records(self._count())
+
+        page = self._fetch_page(stmt)
+        if self.total_records_mode == TotalRecordsMode.WITH_PAGE and self.total_records is None:
+            self._set_total_records(0)
+        return page
+
+    def iter_all(self, batch_size: int | None = None, prefetch: bool = False) -> Iterator[T]:
+        """
+        Iterate over every record, fetching them in keyset batches of batch_size,
+        which defaults to the page size
+
+        Once the caller moves on from a batch, its records are expunged from
+        the session, so that the session does not keep every record. Flush any
+        changes to a record before moving on from its batch, as changes to
+        expunged records are not saved.
+
+        With prefetch, the next batch is fetched on a background thread while
+        the caller processes the current batch. Each batch is then fetched in
+        its own session and transaction, using the engine that db_session is
+        bound to, and the records are yielded detached from any session, so
+        use loader options such as selectinload on the statement to load the
+        relationships that the caller needs. As the batches are not read from
+        one snapshot, records may be skipped or repeated if they change during
+        the iteration, and any transaction of db_session is not used. Without
+        prefetch, every batch is read in the transaction of db_session, which
+        gives a consistent snapshot when it is a repeatable read transaction.
+
+        Raises ValueError if keyset_columns are not set.
+        """
+        if not self.keyset_columns:
+            raise ValueError("Keyset iteration requires keyset_columns")
+        if batch_size is None:
+            batch_size = self.page_size
+        if batch_size <= 0:
+            raise ValueError("Batch size must be at least 1")
+
+        if prefetch:
+            yield from self._iter_all_prefetched(batch_size)
+            return
+
+        last_row_values = None
+        while True:
+            batch = (
+                self.db_session.execute(self._get_keyset_stmt(last_row_values).limit(batch_size))
+                .scalars()
+                .all()
+            )
+            yield from batch
+
+            for record in batch:
+                self.db_session.expunge(record)
+            # A batch shorter than the batch size is the last one
+            if len(batch) < batch_size:
+                return
+            last_row_values = self._get_keyset_values(batch[-1])
+
+    def _iter_all_prefetched(self, batch_size: int) -> Iterator[T]:
+        # Each batch gets its own connection from the engine, as a connection
+        # can't be shared with the background thread
+        engine = self.db_session.get_bind().engine
+
+        def fetch_batch(last_row_values: list[Any] | None) -> Sequence[T]:
+            with db.Session(bind=engine, expire_on_commit=False) as session:
+                batch = (
+                    session.execute(self._get_keyset_stmt(last_row_values).limit(batch_size))
+                    .scalars()
+                    .all()
+                )
+                session.expunge_all()
+                return batch
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future: Future[Sequence[T]] | None = executor.submit(fetch_batch, None)
+            while future is not None:
+                batch = future.result()
+                future = None
+                if len(batch) == batch_size:
+                    future = executor.submit(fetch_batch, self._get_keyset_values(batch[-1]))
+                yield from batch
+
+    def _get_keyset_stmt(self, last_row_values: Sequence[Any] | None) -> Select:
+        """Get the statement for the rows after the row of the keyset values, if any."""
+        if last_row_values is None:
+            return self.stmt
+
+        keyset = tuple_(*self.keyset_columns)
+        last_row = tuple_(
+            *[
+                literal(value, column.type)
+                for value, column in zip(last_row_values, self.keyset_columns)
+            ]
+        )
+        return self.stmt.where(keyset > last_row if self.is_ascending else keyset < last_row)
+
+    def _get_keyset_values(self, record: T) -> list[Any]:
+        return [getattr(record, column.key) for column in self.keyset_columns]
+
+    def _fetch_page(self, stmt: Select) -> Sequence[T]:
+        stmt = stmt.limit(self.page_size)
+        page: Sequence[T]
+        count_with_page = (
+            self.total_records_mode == TotalRecordsMode.WITH_PAGE and self.total_records is None
         )
+        if count_with_page:
+            cached_count = self._get_cached_count()
+            if cached_count is not None:
+                self._set_total_records(cached_count)
+                count_with_page = False
+
+        if count_with_page:
+            # Every row has the count of all rows before the LIMIT
+            rows = self.db_session.execute(stmt.add_columns(func.count().over())).all()
+            page = [row[0] for row in rows]
+            if rows:
+                self._set_total_records(rows[0][1])
+                self._set_cached_count(rows[0][1])
+        else:
+            page = self.db_session.execute(stmt).scalars().all()
+
+        # A page shorter than the page size is the last one
+        self.next_cursor = None
+        if self.keyset_columns and len(page) == self.page_size:
+            self.next_cursor = encode_cursor(
+                self._get_keyset_values(page[-1]), self.keyset_columns, self.is_ascending
+            )
+
+        return page
+
+
+def encode_cursor(
+    values: Sequence[Any], keyset_columns: Sequence[InstrumentedAttribute], is_ascending: bool
+) -> str:
+    """Encode the keyset values of a row as an opaque cursor.
+
+    The cursor also records the keyset columns and sort direction, so that it
+    is rejected if used with a different sort.
+    """
+    data = {
+        "columns": [column.key for column in keyset_columns],
+        "ascending": is_ascending,
+        "values": values,
+    }
+    return base64.urlsafe_b64encode(json.dumps(data, default=str).encode()).decode()
+
+
+def decode_cursor(
+    cursor: str, keyset_columns: Sequence[InstrumentedAttribute], is_ascending: bool
+) -> list[Any]:
+    """Decode the keyset values of a cursor from encode_cursor."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if data["columns"] != [column.key for column in keyset_columns]:
+            raise ValueError("Cursor is for a different sort order")
+        if data["ascending"] != is_ascending:
+            raise ValueError("Cursor is for a different sort direction")
+        if len(data["values"]) != len(keyset_columns):
+            raise ValueError("Cursor has the wrong number of values")
+        return [
+            _parse_value(value, column.type.python_type)
+            for value, column in zip(data["values"], keyset_columns)
+        ]
+    except (binascii.Error, TypeError, KeyError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def _parse_value(value: Any, python_type: type[Any]) -> Any:
+    # Values that JSON can't represent were encoded with str()
+    if value is None or isinstance(value, python_type):
+        return value
+    if issubclass(python_type, (datetime.date, datetime.time)):
+        return python_type.fromisoformat(value)
+    return python_type(value)
 
 
 def _get_record_count(db_session: db.Session, stmt: Select) -> int:
@@ -69,3 +402,24 @@ def _get_record_count(db_session: db.Session, stmt: Select) -> int:
     # and remove the order_by as we won't care for this query.
     count_stmt = stmt.order_by(None).with_only_columns(func.count(), maintain_column_froms=True)
     return db_session.execute(count_stmt).scalar_one()
+
+
+class _Explain(Executable, ClauseElement):
+    """EXPLAIN (FORMAT JSON) of a statement, which plans it without running it."""
+
+    inherit_cache = False
+
+    def __init__(self, stmt: Select):
+        self.stmt = stmt
+
+
+@compiles(_Explain, "postgresql")
+def _compile_explain(element: _Explain, compiler: SQLCompiler, **kwargs: Any) -> str:
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.stmt, **kwargs)
+
+
+def _get_estimated_record_count(db_session: db.Session, stmt: Select) -> int:
+    # The row estimate of the top node of the plan, which is the number of rows
+    # the planner expects the statement to return
+    plan = db_session.execute(_Explain(stmt.order_by(None))).scalar_one()
+    return int(plan[0]["Plan"]["Plan Rows"])
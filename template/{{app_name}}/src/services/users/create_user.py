@@ -1,6 +1,7 @@
 from datetime import date
 from typing import TypedDict
 
+import src.pagination.count_cache as count_cache
 from src.adapters.db import Session
 from src.db.models import user_models
 from src.db.models.user_models import Role, User
@@ -37,4 +38,5 @@ def create_user(db_session: Session, user_params: CreateUserParams) -> User:
             roles=[Role(type=role["type"]) for role in user_params["roles"]],
         )
         db_session.add(user)
+    count_cache.bump_table_versions([User.__tablename__, Role.__tablename__])
     return user
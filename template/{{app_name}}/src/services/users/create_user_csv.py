@@ -1,11 +1,15 @@
 import csv
 import logging
 from dataclasses import asdict, dataclass
+from typing import Iterable, Iterator
 
 from smart_open import open as smart_open
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
 
 import src.adapters.db as db
 from src.db.models.user_models import User
+from src.pagination.paginator import Paginator, TotalRecordsMode
 
 logger = logging.getLogger(__name__)
 
@@ -21,31 +25,57 @@ USER_CSV_RECORD_HEADERS = UserCsvRecord(
     user_name="User Name", roles="Roles", is_user_active="Is User Active?"
 )
 
+# The number of user records to fetch from the DB at a time
+USER_RECORD_BATCH_SIZE = 1000
+
 
 def create_user_csv(db_session: db.Session, output_file_path: str) -> None:
-    # Get DB records
-    user_records = get_user_records(db_session)
+    # Read every batch in one repeatable read transaction, so that the CSV is
+    # a consistent snapshot of the users even if they change during the export
+    with db_session.begin():
+        db_session.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+
+        # Get DB records
+        user_records = get_user_records(db_session)
 
-    csv_records = convert_user_records_for_csv(user_records)
+        csv_records = convert_user_records_for_csv(user_records)
 
-    generate_csv_file(csv_records, output_file_path)
+        generate_csv_file(csv_records, output_file_path)
 
 
-def get_user_records(db_session: db.Session) -> list[User]:
+def get_user_records(
+    db_session: db.Session, batch_size: int = USER_RECORD_BATCH_SIZE
+) -> Iterator[User]:
+    """
+    Stream the user records from the DB in batches, oldest first, so that
+    the export does not hold every user in memory.
+
+    The batches are read in the transaction of db_session, so they are
+    consistent with each other when it is a repeatable read transaction.
+    Prefetching is not used, as it would read each batch in its own
+    transaction.
+    """
     logger.info("Fetching user records from DB")
-    user_records = db_session.query(User).all()
+    paginator: Paginator[User] = Paginator(
+        select(User).options(selectinload(User.roles)),
+        db_session,
+        keyset_columns=[User.created_at, User.id],
+        total_records_mode=TotalRecordsMode.NONE,
+    )
+
+    record_count = 0
+    for user in paginator.iter_all(batch_size=batch_size):
+        record_count += 1
+        yield user
 
-    record_count = len(user_records)
     logger.info(
         "Found %s user records",
         record_count,
         extra={"user_records": record_count},
     )
 
-    return user_records
-
 
-def generate_csv_file(records: list[UserCsvRecord], output_file_path: str) -> None:
+def generate_csv_file(records: Iterable[UserCsvRecord], output_file_path: str) -> None:
     logger.info("Generating user role CSV at %s", output_file_path)
 
     # smart_open can write files to local & S3
@@ -61,21 +91,16 @@ def generate_csv_file(records: list[UserCsvRecord], output_file_path: str) -> No
     logger.info("Successfully created user role CSV at %s", output_file_path)
 
 
-def convert_user_records_for_csv(records: list[User]) -> list[UserCsvRecord]:
+def convert_user_records_for_csv(records: Iterable[User]) -> Iterator[UserCsvRecord]:
     logger.info("Converting user role records to CSV format")
-    out_records: list[UserCsvRecord] = []
-    out_records.append(USER_CSV_RECORD_HEADERS)
+    yield USER_CSV_RECORD_HEADERS
 
     for user in records:
         user_name = " ".join([user.first_name, user.last_name])
         roles = " ".join([role.type for role in user.roles]) if user.roles else ""
 
-        out_records.append(
-            UserCsvRecord(
-                user_name=user_name,
-                roles=roles,
-                is_user_active=str(user.is_active),
-            )
+        yield UserCsvRecord(
+            user_name=user_name,
+            roles=roles,
+            is_user_active=str(user.is_active),
         )
-
-    return out_records
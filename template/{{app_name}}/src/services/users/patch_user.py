@@ -6,6 +6,7 @@ from typing import TypedDict
 import apiflask
 from sqlalchemy import orm
 
+import src.pagination.count_cache as count_cache
 from src.adapters.db import Session
 from src.db.models.user_models import Role, User
 from src.services.users.create_user import RoleParams
@@ -45,6 +46,7 @@ def patch_user(
                 continue
 
             setattr(user, key, value)
+    count_cache.bump_table_versions([User.__tablename__, Role.__tablename__])
     return user
 
 
@@ -1,9 +1,11 @@
 from typing import Sequence, Tuple
 
-from sqlalchemy import asc, desc, select
+import apiflask
+from sqlalchemy import select
 from sqlalchemy.orm import selectinload
 
 import src.adapters.db as db
+import src.pagination.count_cache as count_cache
 from src.api.response import PaginationInfo
 from src.db.models.user_models import Role, RoleType, User
 from src.pagination.pagination_models import PaginationParams
@@ -29,15 +31,13 @@ def search_user(
 def _search_user(
     db_session: db.Session, search_user_params: SearchUserParams
 ) -> Tuple[Sequence[User], PaginationInfo]:
-    # Determine whether it is ascending/descending sort order
-    sort_fn = asc if search_user_params.sorting.is_ascending else desc
+    # Sort by the requested field, with the id as a tie-breaker so that the
+    # order is stable and the results can be paged with a cursor
+    sort_column = getattr(User, search_user_params.sorting.order_by)
+    keyset_columns = [sort_column] if sort_column is User.id else [sort_column, User.id]
 
     # Create the base select statement
-    stmt = (
-        select(User)
-        .options(selectinload(User.roles))
-        .order_by(sort_fn(search_user_params.sorting.order_by))
-    )
+    stmt = select(User).options(selectinload(User.roles))
 
     # Attach any filters
     if search_user_params.phone_number is not None:
@@ -51,9 +51,21 @@ def _search_user(
 
     # Call the paginator and fetch pagination info to return
     paginator: Paginator[User] = Paginator(
-        stmt, db_session, page_size=search_user_params.paging.page_size
+        stmt,
+        db_session,
+        page_size=search_user_params.paging.page_size,
+        keyset_columns=keyset_columns,
+        is_ascending=search_user_params.sorting.is_ascending,
+        total_records_mode=search_user_params.paging.total_records_mode,
+        count_cache=count_cache.get_count_cache(),
     )
-    users = paginator.page_at(page_offset=search_user_params.paging.page_offset)
+    if search_user_params.paging.cursor is not None:
+        try:
+            users = paginator.page_after(cursor=search_user_params.paging.cursor)
+        except ValueError as e:
+            raise apiflask.HTTPError(422, message=str(e)) from e
+    else:
+        users = paginator.page_at(page_offset=search_user_params.paging.page_offset)
     pagination_info = PaginationInfo.from_pagination_models(search_user_params, paginator)
 
     return users, pagination_info
@@ -0,0 +1,188 @@
+import pytest
+from sqlalchemy import select
+
+import src.adapters.db.query_stats as query_stats
+import src.pagination.count_cache as count_cache
+from src.db.models.user_models import Role, RoleType, User
+from src.pagination.count_cache import CountCache, LocalCountCacheStore
+from src.pagination.paginator import Paginator, TotalRecordsMode
+from tests.src.db.models.factories import UserFactory
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_local_count_cache_store_expiry():
+    clock = FakeClock()
+    store = LocalCountCacheStore(clock=clock)
+
+    store.set("a", 1, ttl_seconds=10)
+    assert store.get("a") == 1
+
+    clock.now = 9.9
+    assert store.get("a") == 1
+
+    clock.now = 10
+    assert store.get("a") is None
+    assert store.get("b") is None
+
+
+def test_local_count_cache_store_evicts_least_recently_used():
+    store = LocalCountCacheStore(max_entries=2)
+
+    store.set("a", 1, ttl_seconds=10)
+    store.set("b", 2, ttl_seconds=10)
+    assert store.get("a") == 1
+    store.set("c", 3, ttl_seconds=10)
+
+    assert store.get("a") == 1
+    assert store.get("b") is None
+    assert store.get("c") == 3
+
+
+def test_local_count_cache_store_table_versions():
+    store = LocalCountCacheStore(max_entries=1)
+    assert store.get_table_version("user") == 0
+
+    store.increment_table_version("user")
+    store.increment_table_version("user")
+    # Versions are not evicted with the counts
+    store.set("a", 1, ttl_seconds=10)
+    store.set("b", 2, ttl_seconds=10)
+
+    assert store.get_table_version("user") == 2
+    assert store.get_table_version("role") == 0
+
+
+def test_count_cache_key(db_session):
+    cache = CountCache(LocalCountCacheStore(), ttl_seconds=10)
+    stmt = select(User).where(User.phone_number == "111-111-1111")
+
+    key = cache.get_key(db_session, stmt)
+    # The same filters have the same key regardless of ordering
+    assert cache.get_key(db_session, stmt.order_by(User.id)) == key
+    # Other parameters or filters do not
+    assert cache.get_key(db_session, select(User).where(User.phone_number == "2")) != key
+    assert cache.get_key(db_session, select(User)) != key
+
+    # Bumping a table the statement reads changes the key
+    cache.bump_table_versions(["role"])
+    assert cache.get_key(db_session, stmt) == key
+    assert cache.get_key(db_session, stmt.join(Role)) != key
+    cache.bump_table_versions(["user"])
+    assert cache.get_key(db_session, stmt) != key
+
+
+def test_paginator_count_cache(db_session, enable_factory_create):
+    db_session.query(User).delete()
+    UserFactory.create_batch(3, phone_number="111-111-1111")
+    cache = CountCache(LocalCountCacheStore(), ttl_seconds=10)
+    stmt = select(User).where(User.phone_number == "111-111-1111")
+
+    stats = query_stats.start_query_stats()
+    try:
+        assert Paginator(stmt, db_session, count_cache=cache).total_records == 3
+        assert stats.query_count == 1
+
+        # Later pages reuse the cached count
+        paginator: Paginator[User] = Paginator(stmt, db_session, count_cache=cache)
+        assert paginator.total_records == 3
+        assert stats.query_count == 1
+
+        paginator = Paginator(
+            stmt, db_session, count_cache=cache, total_records_mode=TotalRecordsMode.WITH_PAGE
+        )
+        assert len(paginator.page_at(1)) == 3
+        assert paginator.total_records == 3
+        # Only the page, without the window count
+        assert stats.query_count == 2
+    finally:
+        query_stats.stop_query_stats()
+
+    # A write to the table, and the version bump after it, makes the paginator recount
+    UserFactory.create(phone_number="111-111-1111")
+    assert Paginator(stmt, db_session, count_cache=cache).total_records == 3
+    cache.bump_table_versions(["user"])
+    assert Paginator(stmt, db_session, count_cache=cache).total_records == 4
+
+
+def test_paginator_count_cache_with_page_caches_window_count(db_session, enable_factory_create):
+    db_session.query(User).delete()
+    UserFactory.create_batch(3, phone_number="111-111-1111")
+    cache = CountCache(LocalCountCacheStore(), ttl_seconds=10)
+    stmt = select(User).where(User.phone_number == "111-111-1111")
+
+    paginator: Paginator[User] = Paginator(
+        stmt, db_session, count_cache=cache, total_records_mode=TotalRecordsMode.WITH_PAGE
+    )
+    paginator.page_at(1)
+
+    assert cache.get(cache.get_key(db_session, stmt)) == 3
+
+
+@pytest.fixture
+def enable_count_cache(monkeypatch):
+    monkeypatch.setenv("PAGINATION_COUNT_CACHE_TTL_SECONDS", "30")
+    count_cache.get_count_cache.cache_clear()
+    yield
+    count_cache.get_count_cache.cache_clear()
+
+
+def test_get_count_cache(enable_count_cache):
+    cache = count_cache.get_count_cache()
+    assert cache is not None
+    assert cache.ttl_seconds == 30
+    assert count_cache.get_count_cache() is cache
+
+
+def test_get_count_cache_not_enabled():
+    count_cache.get_count_cache.cache_clear()
+    assert count_cache.get_count_cache() is None
+    # Bumping versions without a cache does nothing
+    count_cache.bump_table_versions(["user"])
+
+
+def test_search_user_count_invalidated_by_user_writes(
+    client, api_auth_token, db_session, enable_count_cache
+):
+    db_session.query(User).delete()
+    db_session.commit()
+
+    search_request = {
+        "role_type": RoleType.ADMIN,
+        "paging": {"page_offset": 1, "page_size": 5},
+        "sorting": {"order_by": "id", "sort_direction": "ascending"},
+    }
+
+    def search_total_records():
+        resp = client.post(
+            "/v1/users/search", json=search_request, headers={"X-Auth": api_auth_token}
+        )
+        return resp.get_json()["pagination_info"]["total_records"]
+
+    assert search_total_records() == 0
+
+    user_request = {
+        "first_name": "Anne",
+        "middle_name": "Marie",
+        "last_name": "Smith",
+        "phone_number": "123-456-7890",
+        "date_of_birth": "2022-01-01",
+        "is_active": True,
+        "roles": [{"type": "ADMIN"}],
+    }
+    resp = client.post("/v1/users", json=user_request, headers={"X-Auth": api_auth_token})
+    assert resp.status_code == 201
+    user_id = resp.get_json()["data"]["id"]
+    assert search_total_records() == 1
+
+    resp = client.patch(
+        f"/v1/users/{user_id}", json={"roles": []}, headers={"X-Auth": api_auth_token}
+    )
+    assert resp.status_code == 200
+    assert search_total_records() == 0
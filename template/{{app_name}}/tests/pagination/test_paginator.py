@@ -1,8 +1,12 @@
+import uuid
+
 import pytest
-from sqlalchemy import select
+from sqlalchemy import delete, select, text
+from sqlalchemy.orm import selectinload
 
+import src.adapters.db.query_stats as query_stats
 from src.db.models.user_models import User
-from src.pagination.paginator import Paginator
+from src.pagination.paginator import Paginator, TotalRecordsMode, encode_cursor
 from tests.src.db.models.factories import UserFactory
 
 TEST_PAGINATOR_FIRST_NAME = "test_paginator_first_name"
@@ -122,3 +126,275 @@ def test_paginator(db_session, create_users):
 def test_page_size_zero_or_negative(db_session, page_size):
     with pytest.raises(ValueError, match="Page size must be at least 1"):
         Paginator(select(User), db_session, page_size)
+
+
+@pytest.mark.parametrize("is_ascending", [True, False])
+def test_paginator_keyset(db_session, create_users, is_ascending):
+    # Sort by a column with duplicate values, so the id is needed as a tie-breaker
+    keyset_columns = [User.last_name, User.id]
+    paginator: Paginator[User] = Paginator(
+        select(User),
+        db_session,
+        page_size=4,
+        keyset_columns=keyset_columns,
+        is_ascending=is_ascending,
+    )
+
+    users: list[User] = []
+    pages = []
+    cursor = None
+    while True:
+        page = paginator.page_after(cursor)
+        pages.append(len(page))
+        users.extend(page)
+        cursor = paginator.next_cursor
+        if cursor is None:
+            break
+
+    assert pages == [4, 4, 4, 3]
+    expected_order = sorted(users, key=lambda u: (u.last_name, u.id), reverse=not is_ascending)
+    assert [u.id for u in users] == [u.id for u in expected_order]
+
+    # Offset pages are ordered the same way
+    offset_users = [user for page in range(1, 5) for user in paginator.page_at(page)]
+    assert [u.id for u in offset_users] == [u.id for u in users]
+
+
+def test_paginator_keyset_last_page_is_full(db_session, create_users):
+    paginator: Paginator[User] = Paginator(
+        select(User), db_session, page_size=5, keyset_columns=[User.id]
+    )
+    assert len(paginator.page_after(paginator.next_cursor)) == 5
+    assert len(paginator.page_after(paginator.next_cursor)) == 5
+    assert len(paginator.page_after(paginator.next_cursor)) == 5
+
+    # The last full page has a cursor, which leads to an empty page
+    assert paginator.next_cursor is not None
+    assert len(paginator.page_after(paginator.next_cursor)) == 0
+    assert paginator.next_cursor is None
+
+
+def test_paginator_keyset_cursor_from_offset_page(db_session, create_users):
+    paginator: Paginator[User] = Paginator(
+        select(User), db_session, page_size=6, keyset_columns=[User.created_at, User.id]
+    )
+    first_page = paginator.page_at(1)
+    second_page = paginator.page_after(paginator.next_cursor)
+
+    assert [u.id for u in second_page] == [u.id for u in paginator.page_at(2)]
+    assert not {u.id for u in first_page} & {u.id for u in second_page}
+
+
+def test_paginator_keyset_invalid_cursor(db_session):
+    paginator: Paginator[User] = Paginator(
+        select(User), db_session, keyset_columns=[User.created_at, User.id]
+    )
+    other_sort_cursor = encode_cursor(["a"], [User.last_name], True)
+    other_direction_cursor = encode_cursor(
+        ["2024-01-01 00:00:00+00:00", str(uuid.uuid4())], [User.created_at, User.id], False
+    )
+    wrong_type_cursor = encode_cursor(
+        ["not a date", "not a uuid"], [User.created_at, User.id], True
+    )
+
+    for cursor in ["not a cursor", other_sort_cursor, other_direction_cursor, wrong_type_cursor]:
+        with pytest.raises(ValueError, match="Invalid cursor"):
+            paginator.page_after(cursor)
+
+
+def test_paginator_keyset_not_configured(db_session):
+    paginator: Paginator[User] = Paginator(select(User), db_session)
+    with pytest.raises(ValueError, match="Keyset pagination requires keyset_columns"):
+        paginator.page_after(None)
+
+
+def test_paginator_total_records_mode_none(db_session, create_users):
+    paginator: Paginator[User] = Paginator(
+        select(User), db_session, page_size=6, total_records_mode=TotalRecordsMode.NONE
+    )
+    assert paginator.total_records is None
+    assert paginator.total_pages is None
+
+    assert len(paginator.page_at(3)) == 3
+    assert len(paginator.page_at(4)) == 0
+    assert paginator.total_records is None
+
+
+def test_paginator_total_records_mode_first_page(db_session, create_users):
+    paginator: Paginator[User] = Paginator(
+        select(User),
+        db_session,
+        page_size=6,
+        keyset_columns=[User.id],
+        total_records_mode=TotalRecordsMode.FIRST_PAGE,
+    )
+    assert paginator.total_records is None
+
+    # Only counted for the first page
+    paginator.page_at(2)
+    assert paginator.total_records is None
+    paginator.page_after(paginator.next_cursor)
+    assert paginator.total_records is None
+
+    paginator.page_at(1)
+    assert paginator.total_records == 15
+    assert paginator.total_pages == 3
+
+    paginator = Paginator(
+        select(User),
+        db_session,
+        keyset_columns=[User.id],
+        total_records_mode=TotalRecordsMode.FIRST_PAGE,
+    )
+    paginator.page_after(None)
+    assert paginator.total_records == 15
+
+
+def test_paginator_total_records_mode_estimate(db_session, create_users):
+    db_session.execute(text("ANALYZE"))
+    stmt = select(User).options(selectinload(User.roles)).where(User.is_active.is_(True))
+    paginator: Paginator[User] = Paginator(
+        stmt, db_session, page_size=6, total_records_mode=TotalRecordsMode.ESTIMATE
+    )
+    assert paginator.total_records_approximate
+    assert paginator.total_records is not None
+    assert 1 <= paginator.total_records <= 15
+
+    # Pages past the estimated number of pages are still fetched
+    assert len(paginator.page_at(2)) == 6
+
+
+def test_paginator_total_records_mode_with_page(db_session, create_users):
+    stats = query_stats.start_query_stats()
+    try:
+        paginator: Paginator[User] = Paginator(
+            select(User).options(selectinload(User.roles)),
+            db_session,
+            page_size=6,
+            keyset_columns=[User.id],
+            total_records_mode=TotalRecordsMode.WITH_PAGE,
+        )
+        assert paginator.total_records is None
+        assert stats.query_count == 0
+
+        page = paginator.page_at(2)
+        assert len(page) == 6
+        assert all(isinstance(user, User) for user in page)
+        assert paginator.total_records == 15
+        assert paginator.total_pages == 3
+        # The page and the count, plus the eager load of the roles
+        assert stats.query_count == 2
+    finally:
+        query_stats.stop_query_stats()
+
+    # Pages past the end and pages after a cursor are counted separately
+    paginator = Paginator(
+        select(User), db_session, page_size=6, total_records_mode=TotalRecordsMode.WITH_PAGE
+    )
+    assert len(paginator.page_at(4)) == 0
+    assert paginator.total_records == 15
+
+    paginator = Paginator(
+        select(User),
+        db_session,
+        page_size=6,
+        keyset_columns=[User.id],
+        total_records_mode=TotalRecordsMode.WITH_PAGE,
+    )
+    paginator.page_after(None)
+    cursor = paginator.next_cursor
+
+    paginator = Paginator(
+        select(User),
+        db_session,
+        page_size=6,
+        keyset_columns=[User.id],
+        total_records_mode=TotalRecordsMode.WITH_PAGE,
+    )
+    assert len(paginator.page_after(cursor)) == 6
+    assert paginator.total_records == 15
+
+
+def test_paginator_total_records_mode_with_page_no_records(db_session):
+    paginator: Paginator[User] = Paginator(
+        select(User).where(User.last_name == "something that won't be found"),
+        db_session,
+        total_records_mode=TotalRecordsMode.WITH_PAGE,
+    )
+    assert len(paginator.page_at(1)) == 0
+    assert paginator.total_records == 0
+    assert paginator.total_pages == 0
+
+
+@pytest.mark.parametrize("prefetch", [False, True])
+def test_paginator_iter_all(db_session, create_users, prefetch):
+    expected_ids = db_session.execute(select(User.id).order_by(User.id)).scalars().all()
+    paginator: Paginator[User] = Paginator(
+        select(User).options(selectinload(User.roles)),
+        db_session,
+        keyset_columns=[User.id],
+        total_records_mode=TotalRecordsMode.NONE,
+    )
+
+    stats = query_stats.start_query_stats()
+    try:
+        users = list(paginator.iter_all(batch_size=4, prefetch=prefetch))
+    finally:
+        query_stats.stop_query_stats()
+
+    assert [user.id for user in users] == expected_ids
+    if not prefetch:
+        # 15 records in 4 batches, each with the eager load of the roles. Query
+        # stats are not collected for the queries of the background thread.
+        assert stats.query_count == 8
+    # The records, including the relationships that were loaded, are not kept in the session
+    assert all(user not in db_session for user in users)
+    assert all(user.roles == [] for user in users)
+
+
+def test_paginator_iter_all_expunges_previous_batches(db_session, create_users):
+    paginator: Paginator[User] = Paginator(
+        select(User), db_session, keyset_columns=[User.id], is_ascending=False
+    )
+
+    users = paginator.iter_all(batch_size=5)
+    first_batch = [next(users) for _ in range(5)]
+    assert all(user in db_session for user in first_batch)
+
+    remaining_users = [next(users)]
+    assert all(user not in db_session for user in first_batch)
+    assert remaining_users[0] in db_session
+
+    remaining_users.extend(users)
+    ids = [user.id for user in first_batch + remaining_users]
+    assert len(ids) == 15
+    assert ids == sorted(ids, reverse=True)
+
+
+def test_paginator_iter_all_batch_size_multiple_of_records(db_session, create_users):
+    paginator: Paginator[User] = Paginator(
+        select(User), db_session, keyset_columns=[User.id], total_records_mode=TotalRecordsMode.NONE
+    )
+    assert len(list(paginator.iter_all(batch_size=5))) == 15
+    # Defaults to the page size
+    assert len(list(paginator.iter_all(prefetch=True))) == 15
+
+
+def test_paginator_iter_all_requires_keyset_columns(db_session):
+    paginator: Paginator[User] = Paginator(select(User), db_session)
+    with pytest.raises(ValueError, match="Keyset iteration requires keyset_columns"):
+        list(paginator.iter_all())
+
+
+def test_paginator_iter_all_reads_in_session_transaction(db_session, db_client, create_users):
+    db_session.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+    paginator: Paginator[User] = Paginator(select(User), db_session, keyset_columns=[User.id])
+
+    users = paginator.iter_all(batch_size=5)
+    first_batch = [next(users) for _ in range(5)]
+
+    # Later batches come from the same snapshot, so users deleted in the meantime are still read
+    with db_client.get_session() as other_session, other_session.begin():
+        other_session.execute(delete(User))
+
+    assert len(first_batch + list(users)) == 15
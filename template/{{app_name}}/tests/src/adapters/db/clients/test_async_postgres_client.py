@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import threading
+
+import psycopg.errors
+import pytest
+import sqlalchemy
+from sqlalchemy import text
+
+import src.adapters.db as db
+import src.adapters.db.clients.async_postgres_client as async_postgres_client
+import src.adapters.db.query_stats as query_stats
+from src.adapters.db.clients.postgres_config import get_db_config
+
+
+def run_with_client(f, db_client: db.AsyncDBClient | None = None):
+    """Run an async function of a db client in a new event loop, and dispose
+    of the client's connections before the loop is closed."""
+    async_db_client = db_client or db.AsyncPostgresDBClient()
+
+    async def run():
+        try:
+            return await f(async_db_client)
+        finally:
+            await async_db_client.dispose()
+
+    return asyncio.run(run())
+
+
+def test_get_connection(db_client: db.DBClient):
+    async def get_schema(async_db_client: db.AsyncDBClient):
+        async with async_db_client.get_connection() as conn:
+            return await conn.scalar(text("SELECT current_schema()"))
+
+    assert run_with_client(get_schema) == get_db_config().db_schema
+
+
+def test_get_session(db_client: db.DBClient):
+    async def query(async_db_client: db.AsyncDBClient):
+        async with async_db_client.get_session() as session, session.begin():
+            return await session.scalar(text("SELECT 'hello, world'"))
+
+    assert run_with_client(query) == "hello, world"
+
+
+def test_check_db_connection(db_client: db.DBClient, caplog):
+    caplog.set_level(logging.INFO)  # noqa: B1
+
+    async def check(async_db_client: db.AsyncDBClient):
+        await async_db_client.check_db_connection()
+
+    run_with_client(check)
+    assert "connected to postgres db" in caplog.messages
+
+
+def test_get_session_statement_timeout(db_client: db.DBClient):
+    async def sleep(async_db_client: db.AsyncDBClient):
+        async with async_db_client.get_session(statement_timeout_ms=50) as session:
+            async with session.begin():
+                await session.execute(text("SELECT pg_sleep(1)"))
+
+    with pytest.raises(sqlalchemy.exc.OperationalError) as exc_info:
+        run_with_client(sleep)
+    assert isinstance(exc_info.value.orig, psycopg.errors.QueryCanceled)
+
+
+def test_concurrent_sessions_share_pool(db_client: db.DBClient, monkeypatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "2")
+    monkeypatch.setenv("DB_POOL_MAX_OVERFLOW", "0")
+
+    async def query(async_db_client: db.AsyncDBClient):
+        async def select_one():
+            async with async_db_client.get_session() as session:
+                return await session.scalar(text("SELECT 1"))
+
+        results = await asyncio.gather(*[select_one() for _ in range(10)])
+        return results, async_db_client.pool_stats()
+
+    results, stats = run_with_client(query)
+    assert results == [1] * 10
+    assert stats["size"] == 2
+    assert stats["connects"] <= 2
+    assert stats["checkouts"] == 10
+    assert stats["checkout_wait"]["count"] == 10
+
+
+def test_query_stats(db_client: db.DBClient):
+    async def query(async_db_client: db.AsyncDBClient):
+        stats = query_stats.start_query_stats()
+        try:
+            async with async_db_client.get_connection() as conn:
+                await conn.execute(text("SELECT 1"))
+                await conn.execute(text("SELECT 2"))
+        finally:
+            query_stats.stop_query_stats()
+        return stats
+
+    assert run_with_client(query).query_count == 2
+
+
+def test_connection_parameters_computed_off_event_loop(db_client: db.DBClient, monkeypatch):
+    # Getting an IAM auth token may do network I/O, so it must not block the event loop
+    threads = []
+    get_connection_parameters = async_postgres_client.get_connection_parameters
+
+    def get_connection_parameters_in_thread(db_config):
+        threads.append(threading.current_thread())
+        return get_connection_parameters(db_config)
+
+    monkeypatch.setattr(
+        async_postgres_client, "get_connection_parameters", get_connection_parameters_in_thread
+    )
+
+    async def query(async_db_client: db.AsyncDBClient):
+        async with async_db_client.get_connection() as conn:
+            return await conn.scalar(text("SELECT 1"))
+
+    assert run_with_client(query) == 1
+    assert len(threads) == 1
+    assert threads[0] is not threading.main_thread()
+
+
+def test_null_pool(db_client: db.DBClient):
+    async def query(async_db_client: db.AsyncDBClient):
+        async with async_db_client.get_connection() as conn:
+            await conn.execute(text("SELECT 1"))
+        return async_db_client.has_connection_pool()
+
+    assert run_with_client(query, db.AsyncPostgresDBClient(null_pool=True)) is False
+    assert run_with_client(query, db.AsyncPostgresDBClient(null_pool=False)) is True
@@ -0,0 +1,72 @@
+"""Tests for the PgBouncer transaction pooling mode of PostgresDBClient
+
+These run against the database directly by default. To run them through
+PgBouncer, start it with `docker compose --profile pgbouncer up -d` and set
+DB_PORT to the PgBouncer port, see docs/database/database-management.md.
+"""
+import pytest
+import sqlalchemy.pool as pool
+from sqlalchemy import text
+
+import src.adapters.db as db
+from src.adapters.db.clients.postgres_client import get_connection_parameters
+from src.adapters.db.clients.postgres_config import get_db_config
+from src.db.models.user_models import User
+from tests.src.db.models.factories import UserFactory
+
+
+@pytest.fixture
+def pgbouncer_db_client(monkeypatch: pytest.MonkeyPatch, db_client) -> db.PostgresDBClient:
+    monkeypatch.setenv("DB_PGBOUNCER_TRANSACTION_MODE", "true")
+    monkeypatch.setenv("DB_NULL_POOL", "true")
+    return db.PostgresDBClient()
+
+
+def test_get_connection_parameters_pgbouncer_transaction_mode(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("DB_PGBOUNCER_TRANSACTION_MODE", "true")
+    conn_params = get_connection_parameters(get_db_config())
+
+    assert "options" not in conn_params
+    assert conn_params["prepare_threshold"] is None
+
+
+def test_search_path_per_transaction(pgbouncer_db_client: db.PostgresDBClient):
+    db_schema = get_db_config().db_schema
+    assert isinstance(pgbouncer_db_client._engine.pool, pool.NullPool)
+
+    with pgbouncer_db_client.get_connection() as conn:
+        assert conn.scalar(text("SHOW search_path")) == db_schema
+        conn.commit()
+
+        # The search_path is only set for the transaction
+        dbapi_connection = conn.connection.dbapi_connection
+        with dbapi_connection.cursor() as cur:  # type: ignore
+            cur.execute("SHOW search_path")
+            assert cur.fetchone()[0] != db_schema
+            dbapi_connection.rollback()  # type: ignore
+
+
+def test_session_pgbouncer_transaction_mode(pgbouncer_db_client: db.PostgresDBClient):
+    user = UserFactory.build(roles=[])
+
+    with pgbouncer_db_client.get_session() as session:
+        with session.begin():
+            session.add(user)
+        # Enough queries that psycopg would prepare them if prepared statements were enabled
+        for _ in range(10):
+            assert session.get(User, user.id, populate_existing=True) is not None
+            session.rollback()
+
+        with session.begin():
+            dbapi_connection = session.connection().connection.dbapi_connection
+            assert dbapi_connection.prepare_threshold is None  # type: ignore
+            session.delete(user)
+
+
+def test_timeouts_per_transaction(monkeypatch: pytest.MonkeyPatch, db_client):
+    monkeypatch.setenv("DB_PGBOUNCER_TRANSACTION_MODE", "true")
+    monkeypatch.setenv("DB_STATEMENT_TIMEOUT_MS", "5000")
+    db_client = db.PostgresDBClient()
+
+    with db_client.get_connection() as conn:
+        assert conn.scalar(text("SHOW statement_timeout")) == "5s"
@@ -1,10 +1,23 @@
 import logging
+import threading
+import time
 from dataclasses import dataclass
 
 import pytest
+from sqlalchemy import text
 
-from src.adapters.db.clients.postgres_client import get_connection_parameters, verify_ssl
+import src.adapters.db as db
+import src.adapters.db.clients.postgres_client as postgres_client
+from src.adapters.db.clients.postgres_client import (
+    IamAuthTokenCache,
+    get_connection_parameters,
+    get_pool_parameters,
+    get_rds_client,
+    verify_ssl,
+)
 from src.adapters.db.clients.postgres_config import get_db_config
+from src.adapters.db.pool_metrics import TimedQueuePool
+from src.adapters.db.replicas import Replica
 
 
 @dataclass
@@ -52,3 +65,246 @@ def test_get_connection_parameters(monkeypatch: pytest.MonkeyPatch):
         connect_timeout=10,
         sslmode="require",
     )
+
+
+def test_get_connection_parameters_timeouts(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("DB_STATEMENT_TIMEOUT_MS", "5000")
+    monkeypatch.setenv("DB_IDLE_IN_TRANSACTION_SESSION_TIMEOUT_MS", "60000")
+    db_config = get_db_config()
+    conn_params = get_connection_parameters(db_config)
+
+    assert conn_params["options"] == (
+        f"-c search_path={db_config.db_schema} -c statement_timeout=5000"
+        " -c idle_in_transaction_session_timeout=60000"
+    )
+
+
+def test_get_pool_parameters(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "5")
+    monkeypatch.setenv("DB_POOL_MAX_OVERFLOW", "2")
+    monkeypatch.setenv("DB_POOL_TIMEOUT", "2.5")
+    monkeypatch.setenv("DB_POOL_RECYCLE", "3600")
+    monkeypatch.setenv("DB_POOL_PRE_PING", "true")
+
+    assert get_pool_parameters(get_db_config()) == dict(
+        pool_size=5, max_overflow=2, timeout=2.5, recycle=3600, pre_ping=True
+    )
+
+
+@pytest.mark.parametrize(
+    "workers,threads,max_connections,expected_pool_size,expected_max_overflow",
+    [
+        # One connection per thread
+        (8, 4, None, 4, 0),
+        # Connections left over after one per thread are overflow
+        (8, 4, 50, 4, 2),
+        # Fewer connections than threads
+        (8, 4, 20, 2, 0),
+        # At least one connection per worker
+        (8, 4, 4, 1, 0),
+    ],
+)
+def test_get_pool_parameters_gunicorn_sizing(
+    monkeypatch: pytest.MonkeyPatch,
+    workers,
+    threads,
+    max_connections,
+    expected_pool_size,
+    expected_max_overflow,
+):
+    monkeypatch.setenv("DB_POOL_SIZING_MODE", "gunicorn")
+    monkeypatch.setenv("GUNICORN_WORKERS", str(workers))
+    monkeypatch.setenv("GUNICORN_THREADS", str(threads))
+    if max_connections is not None:
+        monkeypatch.setenv("DB_MAX_CONNECTIONS", str(max_connections))
+
+    pool_parameters = get_pool_parameters(get_db_config())
+
+    assert pool_parameters["pool_size"] == expected_pool_size
+    assert pool_parameters["max_overflow"] == expected_max_overflow
+    if max_connections is not None:
+        assert workers * (expected_pool_size + expected_max_overflow) <= max(
+            max_connections, workers
+        )
+
+
+def test_get_pool_parameters_gunicorn_sizing_not_under_gunicorn(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("DB_POOL_SIZING_MODE", "gunicorn")
+    monkeypatch.delenv("GUNICORN_WORKERS", raising=False)
+    monkeypatch.delenv("GUNICORN_THREADS", raising=False)
+
+    pool_parameters = get_pool_parameters(get_db_config())
+
+    assert pool_parameters["pool_size"] == 20
+    assert pool_parameters["max_overflow"] == 10
+
+
+def test_postgres_db_client_pool(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "3")
+    monkeypatch.setenv("DB_CHECK_CONNECTION_ON_INIT", "False")
+
+    db_client = db.PostgresDBClient()
+
+    assert db_client._engine.pool.size() == 3  # type: ignore
+
+
+def test_warm_up_pool(monkeypatch: pytest.MonkeyPatch, caplog):
+    caplog.set_level(logging.INFO)  # noqa: B1
+    monkeypatch.setenv("DB_POOL_SIZE", "3")
+    monkeypatch.setenv("DB_POOL_WARM_UP_CONNECTIONS", "5")
+    monkeypatch.setenv("DB_CHECK_CONNECTION_ON_INIT", "False")
+    db_client = db.PostgresDBClient()
+
+    # At most the pool size is opened
+    assert db_client.warm_up_pool() == 3
+
+    pool_stats = db_client.pool_stats()
+    assert pool_stats["connects"] == 3
+    assert pool_stats["checked_in"] == 3
+    record = next(r for r in caplog.records if r.message == "warmed up db connection pool")
+    assert record.__dict__["db.warm_up_connections"] == 3
+    assert record.__dict__["db.warm_up_time_ms"] > 0
+
+    # Requests then reuse the warm connections
+    with db_client.get_connection() as conn:
+        conn.exec_driver_sql("SELECT 1")
+    assert db_client.pool_stats()["connects"] == 3
+
+
+def test_warm_up_pool_replicas(monkeypatch: pytest.MonkeyPatch, caplog):
+    caplog.set_level(logging.INFO)  # noqa: B1
+    monkeypatch.setenv("DB_POOL_SIZE", "2")
+    monkeypatch.setenv("DB_POOL_WARM_UP_CONNECTIONS", "2")
+    # Use the local database as both replicas
+    monkeypatch.setenv("DB_REPLICA_HOSTS", "localhost, 127.0.0.1")
+    monkeypatch.setenv("DB_CHECK_CONNECTION_ON_INIT", "False")
+    db_client = db.PostgresDBClient()
+    assert db_client._replica_router is not None
+    replicas = db_client._replica_router.replicas
+
+    def get_replica_connects(replica: Replica) -> int:
+        assert isinstance(replica.engine.pool, TimedQueuePool)
+        return replica.engine.pool.pool_metrics.snapshot()["connects"]
+
+    # The primary and each replica are warmed up
+    assert db_client.warm_up_pool() == 6
+
+    assert db_client.pool_stats()["connects"] == 2
+    assert [get_replica_connects(replica) for replica in replicas] == [2, 2]
+    records = [r for r in caplog.records if r.message == "warmed up db connection pool"]
+    assert sorted(record.__dict__["db.host"] for record in records) == sorted(
+        [get_db_config().host, "localhost", "127.0.0.1"]
+    )
+
+    # Read-only sessions then reuse the warm replica connections
+    with db_client.get_session(read_only=True) as session:
+        session.execute(text("SELECT 1"))
+    assert [get_replica_connects(replica) for replica in replicas] == [2, 2]
+
+
+def test_warm_up_pool_not_configured(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("DB_CHECK_CONNECTION_ON_INIT", "False")
+    db_client = db.PostgresDBClient()
+
+    assert db_client.warm_up_pool() == 0
+    assert db_client.pool_stats()["connects"] == 0
+
+
+def test_warm_up_pool_connection_failure(monkeypatch: pytest.MonkeyPatch, caplog):
+    caplog.set_level(logging.INFO)  # noqa: B1
+    # Nothing listens on this port
+    monkeypatch.setenv("DB_PORT", "1")
+    monkeypatch.setenv("DB_CHECK_CONNECTION_ON_INIT", "False")
+    db_client = db.PostgresDBClient()
+
+    assert db_client.warm_up_pool(2) == 0
+    record = next(r for r in caplog.records if r.message == "warmed up db connection pool")
+    assert record.__dict__["db.warm_up_failures"] == 2
+
+
+def test_warm_up_pool_connection_parameters_failure(monkeypatch: pytest.MonkeyPatch, caplog):
+    caplog.set_level(logging.INFO)  # noqa: B1
+    monkeypatch.setenv("DB_POOL_WARM_UP_CONNECTIONS", "2")
+    monkeypatch.setenv("DB_CHECK_CONNECTION_ON_INIT", "False")
+    db_client = db.PostgresDBClient()
+
+    def fail_to_get_connection_parameters(db_config):
+        raise RuntimeError("failed to get IAM auth token")
+
+    monkeypatch.setattr(
+        postgres_client, "get_connection_parameters", fail_to_get_connection_parameters
+    )
+
+    # The failure is logged rather than raised, so that the worker still starts
+    assert db_client.warm_up_pool() == 0
+    assert "failed to get db connection parameters during pool warm-up" in caplog.messages
+    assert db_client.pool_stats()["connects"] == 0
+
+
+class TokenGenerator:
+    def __init__(self):
+        self.calls = 0
+        self.generated = threading.Event()
+
+    def __call__(self, aws_region, host, port, user):
+        self.calls += 1
+        self.generated.set()
+        return f"token-{self.calls}-{host}-{user}"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_iam_auth_token_cache():
+    generate_token = TokenGenerator()
+    clock = FakeClock()
+    cache = IamAuthTokenCache(generate_token, clock)
+
+    assert cache.get_token("us-east-1", "host", 5432, "app") == "token-1-host-app"
+    clock.now = 5 * 60
+    assert cache.get_token("us-east-1", "host", 5432, "app") == "token-1-host-app"
+    assert cache.get_token("us-east-1", "host", 5432, "other") == "token-2-host-other"
+    assert generate_token.calls == 2
+
+
+def test_iam_auth_token_cache_refreshes_in_background():
+    generate_token = TokenGenerator()
+    clock = FakeClock()
+    cache = IamAuthTokenCache(generate_token, clock)
+    cache.get_token("us-east-1", "host", 5432, "app")
+    generate_token.generated.clear()
+
+    # Due for refresh, the cached token is still returned while a new one is generated
+    clock.now = 11 * 60
+    assert cache.get_token("us-east-1", "host", 5432, "app") == "token-1-host-app"
+    assert generate_token.generated.wait(timeout=5)
+
+    def wait_for_token(expected):
+        for _ in range(100):
+            if cache.get_token("us-east-1", "host", 5432, "app") == expected:
+                return True
+            time.sleep(0.01)
+        return False
+
+    assert wait_for_token("token-2-host-app")
+    assert generate_token.calls == 2
+
+
+def test_iam_auth_token_cache_expired_token():
+    generate_token = TokenGenerator()
+    clock = FakeClock()
+    cache = IamAuthTokenCache(generate_token, clock)
+    cache.get_token("us-east-1", "host", 5432, "app")
+
+    clock.now = 14 * 60
+    assert cache.get_token("us-east-1", "host", 5432, "app") == "token-2-host-app"
+
+
+def test_get_rds_client():
+    assert get_rds_client("us-east-1") is get_rds_client("us-east-1")
+    assert get_rds_client("us-east-1") is not get_rds_client("us-west-2")
@@ -0,0 +1,89 @@
+"""Benchmarks comparing the sync and async database clients
+
+These are excluded from `make test`, run them with `make test-benchmark`.
+
+Each benchmark runs QUERY_COUNT short queries with a number of concurrent
+workers, for each of CONCURRENCY_LEVELS: threads sharing a PostgresDBClient,
+or asyncio tasks sharing an AsyncPostgresDBClient. Each client's pool has one
+connection per worker, so the benchmarks compare the overhead of the clients
+and of threads against tasks, rather than waiting for connections.
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import text
+
+import src.adapters.db as db
+from src.adapters.db.clients.postgres_config import get_db_config
+
+logger = logging.getLogger(__name__)
+
+QUERY_COUNT = 2_000
+CONCURRENCY_LEVELS = [1, 10, 50]
+# Each query waits on the server for a while, like a typical indexed lookup
+# over the network would
+QUERY = text("SELECT pg_sleep(0.002)")
+
+
+def run_sync(concurrency: int) -> None:
+    db_config = get_db_config().model_copy(
+        update={"pool_size": concurrency, "pool_max_overflow": 0}
+    )
+    db_client = db.PostgresDBClient(db_config)
+
+    def query(_: int) -> None:
+        with db_client.get_session() as session:
+            session.execute(QUERY)
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(query, range(QUERY_COUNT)))
+    finally:
+        # Close the connections, so that the benchmarks stay within the
+        # server's max_connections
+        db_client._engine.dispose()
+
+
+async def run_async(concurrency: int) -> None:
+    db_config = get_db_config().model_copy(
+        update={"pool_size": concurrency, "pool_max_overflow": 0}
+    )
+    db_client = db.AsyncPostgresDBClient(db_config)
+    queue: asyncio.Queue[int] = asyncio.Queue()
+    for i in range(QUERY_COUNT):
+        queue.put_nowait(i)
+
+    async def worker() -> None:
+        while not queue.empty():
+            queue.get_nowait()
+            async with db_client.get_session() as session:
+                await session.execute(QUERY)
+
+    try:
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+    finally:
+        await db_client.dispose()
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("concurrency", CONCURRENCY_LEVELS)
+@pytest.mark.parametrize("client", ["sync", "async"])
+def test_benchmark_concurrent_queries(db_client: db.DBClient, client, concurrency):
+    start_time = time.perf_counter()
+    if client == "sync":
+        run_sync(concurrency)
+    else:
+        asyncio.run(run_async(concurrency))
+    elapsed_seconds = time.perf_counter() - start_time
+
+    result = {
+        "client": client,
+        "concurrency": concurrency,
+        "query_count": QUERY_COUNT,
+        "elapsed_seconds": round(elapsed_seconds, 4),
+        "queries_per_second": round(QUERY_COUNT / elapsed_seconds),
+    }
+    logger.info("concurrent query benchmark", extra=result)
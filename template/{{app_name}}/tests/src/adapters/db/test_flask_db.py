@@ -1,3 +1,6 @@
+import asyncio
+import time
+
 import pytest
 from flask import Flask, current_app
 from sqlalchemy import text
@@ -49,3 +52,148 @@ def test_with_db_session_not_default_name(example_app: Flask):
 
     response = example_app.test_client().get("/hello")
     assert response.get_json() == {"data": "hello, world"}
+
+
+def test_with_db_session_read_only(example_app: Flask, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("DB_REPLICA_HOSTS", "localhost")
+    db_client = db.PostgresDBClient()
+    flask_db.register_db_client(db_client, example_app)
+
+    @example_app.route("/hello")
+    @flask_db.with_db_session(read_only=True)
+    def hello(db_session: db.Session):
+        assert db_session.get_bind() is not db_client._engine
+        with db_session.begin():
+            return {"data": db_session.scalar(text("SELECT 'hello, world'"))}
+
+    response = example_app.test_client().get("/hello")
+    assert response.get_json() == {"data": "hello, world"}
+
+
+def test_with_db_session_unused_does_not_check_out_connection(example_app: Flask):
+    db_client = flask_db.get_db(example_app)
+
+    @example_app.route("/hello")
+    @flask_db.with_db_session()
+    def hello(db_session: db.Session):
+        return {"data": "hello, world"}
+
+    checkouts = db_client.pool_stats()["checkouts"]
+    response = example_app.test_client().get("/hello")
+    assert response.get_json() == {"data": "hello, world"}
+    assert db_client.pool_stats()["checkouts"] == checkouts
+
+
+def test_with_db_session_statement_timeout(example_app: Flask, caplog):
+    @example_app.route("/hello")
+    @flask_db.with_db_session(statement_timeout_ms=50)
+    def hello(db_session: db.Session):
+        with db_session.begin():
+            db_session.execute(text("SELECT pg_sleep(1)"))
+        return {"data": "hello, world"}
+
+    response = example_app.test_client().get("/hello")
+    assert response.status_code == 504
+
+    record = next(r for r in caplog.records if r.message == "database statement timed out")
+    assert record.__dict__["db.sqlstate"] == "57014"
+    assert record.__dict__["db.statement_timeout_ms"] == 50
+
+
+def test_with_db_session_statement_timeout_only_applies_to_session(example_app: Flask):
+    @example_app.route("/hello")
+    @flask_db.with_db_session(statement_timeout_ms=50)
+    def hello(db_session: db.Session):
+        with db_session.begin():
+            session_timeout = db_session.scalar(text("SHOW statement_timeout"))
+        with flask_db.get_db(current_app).get_connection() as conn:
+            default_timeout = conn.scalar(text("SHOW statement_timeout"))
+        return {"session": session_timeout, "default": default_timeout}
+
+    response = example_app.test_client().get("/hello")
+    assert response.get_json() == {"session": "50ms", "default": "0"}
+
+
+def test_with_db_session_idle_in_transaction_timeout(
+    monkeypatch: pytest.MonkeyPatch, example_app: Flask
+):
+    monkeypatch.setenv("DB_IDLE_IN_TRANSACTION_SESSION_TIMEOUT_MS", "50")
+    flask_db.register_db_client(db.PostgresDBClient(), example_app)
+
+    @example_app.route("/hello")
+    @flask_db.with_db_session()
+    def hello(db_session: db.Session):
+        with db_session.begin():
+            db_session.execute(text("SELECT 1"))
+            time.sleep(0.5)
+            db_session.execute(text("SELECT 1"))
+        return {"data": "hello, world"}
+
+    response = example_app.test_client().get("/hello")
+    assert response.status_code == 503
+
+
+def test_with_db_session_pool_timeout(monkeypatch: pytest.MonkeyPatch, example_app: Flask):
+    monkeypatch.setenv("DB_POOL_SIZE", "1")
+    monkeypatch.setenv("DB_POOL_MAX_OVERFLOW", "0")
+    monkeypatch.setenv("DB_POOL_TIMEOUT", "0.1")
+    db_client = db.PostgresDBClient()
+    flask_db.register_db_client(db_client, example_app)
+
+    @example_app.route("/hello")
+    @flask_db.with_db_session()
+    def hello(db_session: db.Session):
+        db_session.execute(text("SELECT 1"))
+        return {"data": "hello, world"}
+
+    with db_client.get_connection() as conn:
+        conn.execute(text("SELECT 1"))
+        response = example_app.test_client().get("/hello")
+    assert response.status_code == 503
+
+
+def test_with_async_db_session(example_app: Flask):
+    flask_db.register_db_client(
+        db.AsyncPostgresDBClient(null_pool=True), example_app, client_name="async"
+    )
+
+    @example_app.route("/hello/<name>")
+    @flask_db.with_async_db_session(client_name="async")
+    async def hello(db_session: db.AsyncSession, name: str):
+        async with db_session.begin():
+            greeting = await db_session.scalar(text("SELECT 'hello, ' || :name"), {"name": name})
+        return {"data": greeting}
+
+    # Each request runs in a new event loop, so each one makes its own connection
+    client = example_app.test_client()
+    for name in ["world", "again"]:
+        response = client.get(f"/hello/{name}")
+        assert response.get_json() == {"data": f"hello, {name}"}
+
+
+def test_with_async_db_session_statement_timeout(example_app: Flask):
+    flask_db.register_db_client(
+        db.AsyncPostgresDBClient(null_pool=True), example_app, client_name="async"
+    )
+
+    @example_app.route("/hello")
+    @flask_db.with_async_db_session(client_name="async", statement_timeout_ms=50)
+    async def hello(db_session: db.AsyncSession):
+        async with db_session.begin():
+            await db_session.execute(text("SELECT pg_sleep(1)"))
+        return {"data": "hello, world"}
+
+    response = example_app.test_client().get("/hello")
+    assert response.status_code == 504
+
+
+def test_register_async_db_client_with_pool(example_app: Flask):
+    async_db_client = db.AsyncPostgresDBClient(null_pool=False)
+    with pytest.raises(ValueError, match="must not pool connections"):
+        flask_db.register_db_client(async_db_client, example_app, client_name="async")
+    asyncio.run(async_db_client.dispose())
+
+
+def test_get_async_db_not_async(example_app: Flask):
+    with pytest.raises(AssertionError):
+        flask_db.get_async_db(example_app)
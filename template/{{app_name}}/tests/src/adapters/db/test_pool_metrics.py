@@ -0,0 +1,62 @@
+import pytest
+import sqlalchemy
+from sqlalchemy import text
+
+import src.adapters.db as db
+from src.adapters.db.pool_metrics import Histogram
+
+
+def test_histogram():
+    histogram = Histogram(bucket_bounds_ms=(1, 10))
+    for duration_ms in [0.5, 1, 5, 20]:
+        histogram.observe(duration_ms)
+
+    assert histogram.snapshot() == {
+        "count": 4,
+        "mean_ms": 6.625,
+        "max_ms": 20,
+        "buckets": {"le_1ms": 2, "le_10ms": 1, "overflow": 1},
+    }
+
+
+def test_pool_stats(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "2")
+    monkeypatch.setenv("DB_POOL_MAX_OVERFLOW", "0")
+    monkeypatch.setenv("DB_CHECK_CONNECTION_ON_INIT", "False")
+    db_client = db.PostgresDBClient()
+
+    with db_client.get_connection() as conn:
+        conn.execute(text("SELECT 1"))
+        stats = db_client.pool_stats()
+        assert stats["checked_out"] == 1
+        assert stats["size"] == 2
+
+    stats = db_client.pool_stats()
+    assert stats["checked_out"] == 0
+    assert stats["checked_in"] == 1
+    assert stats["connects"] == 1
+    assert stats["open_connections"] == 1
+    assert stats["max_connection_age_seconds"] >= 0
+    assert stats["checkouts"] == 1
+    assert stats["checkout_wait"]["count"] == 1
+    assert stats["time_held"]["count"] == 1
+
+
+def test_pool_stats_invalidation_and_timeout(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "1")
+    monkeypatch.setenv("DB_POOL_MAX_OVERFLOW", "0")
+    monkeypatch.setenv("DB_POOL_TIMEOUT", "0.1")
+    monkeypatch.setenv("DB_CHECK_CONNECTION_ON_INIT", "False")
+    db_client = db.PostgresDBClient()
+
+    with db_client.get_connection() as conn:
+        conn.execute(text("SELECT 1"))
+        with pytest.raises(sqlalchemy.exc.TimeoutError):
+            db_client.get_connection().execute(text("SELECT 1"))
+        conn.invalidate()
+
+    stats = db_client.pool_stats()
+    assert stats["checkout_timeouts"] == 1
+    assert stats["checkout_wait"]["max_ms"] >= 100
+    assert stats["invalidations"] == 1
+    assert stats["open_connections"] == 0
@@ -0,0 +1,140 @@
+import logging
+import sys
+
+import pytest
+import sqlalchemy
+from flask import Flask
+from sqlalchemy import text
+
+import src.adapters.db as db
+import src.adapters.db.flask_db as flask_db
+import src.adapters.db.query_stats as query_stats
+import src.logging.flask_logger as flask_logger
+
+
+@pytest.fixture
+def logger():
+    logger = logging.getLogger("src")
+    before_level = logger.level
+
+    logger.setLevel(logging.DEBUG)
+    handler = logging.StreamHandler(sys.stdout)
+    logger.addHandler(handler)
+    yield logger
+    logger.setLevel(before_level)
+    logger.removeHandler(handler)
+
+
+@pytest.fixture
+def example_app(logger) -> Flask:
+    app = Flask(__name__)
+    flask_logger.init_app(logger, app)
+    flask_db.register_db_client(db.PostgresDBClient(), app)
+    return app
+
+
+@pytest.mark.parametrize(
+    "statement,expected_shape",
+    [
+        ("SELECT 1", "SELECT 1"),
+        (
+            "SELECT user.id \n FROM user\n WHERE user.id = %(pk_1)s",
+            "SELECT user.id FROM user WHERE user.id = ?",
+        ),
+        (
+            "SELECT role.type FROM role WHERE role.user_id IN (%(id_1_1)s, %(id_1_2)s, %(id_1_3)s)",
+            "SELECT role.type FROM role WHERE role.user_id IN (?)",
+        ),
+        (
+            "INSERT INTO role (user_id, type) VALUES (%s, %s)",
+            "INSERT INTO role (user_id, type) VALUES (?)",
+        ),
+    ],
+)
+def test_get_statement_shape(statement, expected_shape):
+    assert query_stats.get_statement_shape(statement) == expected_shape
+
+
+def test_query_stats(db_client: db.DBClient):
+    with db_client.get_connection() as conn:
+        conn.execute(text("SELECT 1"))
+
+        stats = query_stats.start_query_stats()
+        conn.execute(text("SELECT pg_sleep(0.05)"))
+        conn.execute(text("SELECT 1"))
+        assert query_stats.stop_query_stats() is stats
+
+        conn.execute(text("SELECT 1"))
+
+    assert stats.query_count == 2
+    assert stats.slowest_statement == "SELECT pg_sleep(0.05)"
+    assert stats.slowest_time_ms >= 50
+    assert stats.total_time_ms >= stats.slowest_time_ms
+
+
+def test_query_stats_failed_statement(db_client: db.DBClient):
+    stats = query_stats.start_query_stats()
+    try:
+        with db_client.get_connection() as conn:
+            with pytest.raises(sqlalchemy.exc.ProgrammingError):
+                conn.execute(text("SELECT * FROM table_that_does_not_exist"))
+            conn.rollback()
+            conn.execute(text("SELECT 1"))
+    finally:
+        query_stats.stop_query_stats()
+
+    assert stats.query_count == 1
+    assert stats.slowest_statement == "SELECT 1"
+
+
+def test_query_stats_repeated_statement_warning(caplog):
+    stats = query_stats.QueryStats(repeated_statement_warning_threshold=2)
+    for i in range(5):
+        stats.record(f"SELECT * FROM role WHERE user_id = %(user_id_{i})s", 1)
+
+    warnings = [
+        record
+        for record in caplog.records
+        if record.message.startswith("database statement repeated")
+    ]
+    assert len(warnings) == 1
+    assert warnings[0].__dict__["db.statement"] == "SELECT * FROM role WHERE user_id = ?"
+    assert warnings[0].__dict__["db.statement_count"] == 3
+
+
+def test_request_logs_query_stats(example_app: Flask, caplog):
+    @example_app.route("/hello")
+    @flask_db.with_db_session()
+    def hello(db_session: db.Session):
+        with db_session.begin():
+            for _ in range(3):
+                db_session.execute(text("SELECT 'hello, world'"))
+        return {"data": "hello, world"}
+
+    example_app.test_client().get("/hello")
+
+    end_request = next(record for record in caplog.records if record.message == "end request")
+    # BEGIN is not a cursor execute, so only the SELECT statements are counted
+    assert end_request.__dict__["db.query_count"] == 3
+    assert end_request.__dict__["db.slowest_statement"] == "SELECT 'hello, world'"
+    assert end_request.__dict__["db.total_time_ms"] > 0
+
+
+def test_request_logs_repeated_statement_warning(monkeypatch: pytest.MonkeyPatch, logger, caplog):
+    monkeypatch.setenv("DB_REPEATED_STATEMENT_WARNING_THRESHOLD", "2")
+    app = Flask(__name__)
+    flask_logger.init_app(logger, app)
+    flask_db.register_db_client(db.PostgresDBClient(), app)
+
+    @app.route("/hello")
+    @flask_db.with_db_session()
+    def hello(db_session: db.Session):
+        for i in range(3):
+            db_session.execute(text("SELECT :i"), {"i": i})
+        return {"data": "hello, world"}
+
+    app.test_client().get("/hello")
+
+    warning = next(r for r in caplog.records if r.message.startswith("database statement repeated"))
+    assert warning.__dict__["db.statement"] == "SELECT ?"
+    assert warning.__dict__["request.path"] == "/hello"
@@ -0,0 +1,105 @@
+import pytest
+from sqlalchemy import text
+
+import src.adapters.db as db
+from src.adapters.db.replicas import (
+    ReplicaBalancing,
+    ReplicaRouter,
+    get_replication_lag,
+)
+
+
+@pytest.fixture
+def replica_db_client(monkeypatch: pytest.MonkeyPatch) -> db.PostgresDBClient:
+    # Use the local database as both replicas, as it is not in recovery it has no lag
+    monkeypatch.setenv("DB_REPLICA_HOSTS", "localhost, 127.0.0.1")
+    monkeypatch.setenv("DB_CHECK_CONNECTION_ON_INIT", "False")
+    return db.PostgresDBClient()
+
+
+def get_router(db_client: db.DBClient) -> ReplicaRouter:
+    assert db_client._replica_router is not None
+    return db_client._replica_router
+
+
+def test_read_only_session_round_robin(replica_db_client: db.PostgresDBClient):
+    replicas = get_router(replica_db_client).replicas
+    assert [replica.name for replica in replicas] == ["localhost", "127.0.0.1"]
+
+    engines = []
+    for _ in range(4):
+        with replica_db_client.get_session(read_only=True) as session:
+            assert session.scalar(text("SELECT 1")) == 1
+            engines.append(session.get_bind())
+
+    assert engines == [replicas[0].engine, replicas[1].engine] * 2
+
+
+def test_read_only_connection_least_connections(
+    replica_db_client: db.PostgresDBClient,
+):
+    router = get_router(replica_db_client)
+    router.balancing = ReplicaBalancing.LEAST_CONNECTIONS
+
+    with replica_db_client.get_connection(read_only=True) as conn:
+        assert conn.engine is router.replicas[0].engine
+        with replica_db_client.get_connection(read_only=True) as conn2:
+            assert conn2.engine is router.replicas[1].engine
+
+
+def test_read_only_session_chooses_replica_on_first_use(replica_db_client: db.PostgresDBClient):
+    router = get_router(replica_db_client)
+
+    with replica_db_client.get_session(read_only=True):
+        pass
+    with replica_db_client.get_session(read_only=True) as session:
+        assert session.scalar(text("SELECT 1")) == 1
+        assert session.get_bind() is router.replicas[0].engine
+
+    assert all(
+        replica["checked_out"] == 0 for replica in replica_db_client.pool_stats()["replicas"]
+    )
+
+
+def test_session_not_read_only_uses_primary(replica_db_client: db.PostgresDBClient):
+    with replica_db_client.get_session() as session:
+        assert session.get_bind() is replica_db_client._engine
+
+
+def test_replica_lag_falls_back_to_primary(replica_db_client: db.PostgresDBClient):
+    router = get_router(replica_db_client)
+    lags = {router.replicas[0].engine: 60.0, router.replicas[1].engine: 1.0}
+    router._get_lag = lambda engine: lags[engine]
+
+    with replica_db_client.get_session(read_only=True) as session:
+        assert session.get_bind() is router.replicas[1].engine
+
+    # Lag is only checked again after the check interval
+    lags[router.replicas[1].engine] = 60.0
+    with replica_db_client.get_session(read_only=True) as session:
+        assert session.get_bind() is router.replicas[1].engine
+
+    for replica in router.replicas:
+        replica.lag_checked_at = None
+    with replica_db_client.get_session(read_only=True) as session:
+        assert session.get_bind() is replica_db_client._engine
+
+    assert [replica["lag_seconds"] for replica in replica_db_client.pool_stats()["replicas"]] == [
+        60.0,
+        60.0,
+    ]
+
+
+def test_replica_lag_check_failure_falls_back_to_primary(replica_db_client: db.PostgresDBClient):
+    def get_lag(engine):
+        raise Exception("replica is down")
+
+    router = get_router(replica_db_client)
+    router._get_lag = get_lag
+
+    with replica_db_client.get_session(read_only=True) as session:
+        assert session.get_bind() is replica_db_client._engine
+
+
+def test_get_replication_lag(replica_db_client: db.PostgresDBClient):
+    assert get_replication_lag(replica_db_client._engine) == 0
@@ -1,12 +1,18 @@
 """Tests for bulk_ops module"""
 import operator
 import random
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
+from datetime import date
 
+import psycopg
+import pytest
 from psycopg import rows, sql
 
 import src.adapters.db as db
 from src.db import bulk_ops
+from src.db.models.user_models import User
+from src.util import datetime_util
+from tests.src.db.models.factories import UserFactory
 
 
 @dataclass
@@ -27,6 +33,29 @@ def get_random_number_object() -> Number:
     )
 
 
+def create_number_table(cur, table: str, constraint: str) -> None:
+    cur.execute(
+        sql.SQL(
+            "CREATE TEMP TABLE {table}"
+            "("
+            "id TEXT NOT NULL,"
+            "num INT,"
+            "CONSTRAINT {constraint} PRIMARY KEY (id)"
+            ")"
+        ).format(
+            table=sql.Identifier(table),
+            constraint=sql.Identifier(constraint),
+        )
+    )
+
+
+def fetch_numbers(cur, table: str) -> list[Number]:
+    cur.execute(
+        sql.SQL("SELECT id, num FROM {table} ORDER BY id ASC").format(table=sql.Identifier(table))
+    )
+    return cur.fetchall()
+
+
 def test_bulk_upsert(db_session: db.Session):
     db_client = db.PostgresDBClient()
     conn = db_client.get_raw_connection()
@@ -104,3 +133,752 @@ def test_bulk_upsert(db_session: db.Session):
         expected_objects = original_objects + updated_and_inserted_objects
         expected_objects.sort(key=operator.attrgetter("id"))
         assert records == expected_objects
+
+
+@pytest.mark.parametrize("batch_size,expected_batch_sizes", [(30, [30, 30, 30, 10]), (None, [100])])
+def test_bulk_upsert_stream(db_session: db.Session, batch_size, expected_batch_sizes):
+    db_client = db.PostgresDBClient()
+    conn = db_client.get_raw_connection()
+
+    with conn.cursor(row_factory=rows.class_row(Number)) as cur:  # type: ignore
+        table = "stream_table"
+        attributes = ["id", "num"]
+        constraint = "stream_table_pkey"
+        create_number_table(cur, table, constraint)
+
+        objects = [get_random_number_object() for i in range(100)]
+
+        # Pass a generator so the objects can only be consumed once
+        results = bulk_ops.bulk_upsert_stream(
+            cur,
+            table,
+            attributes,
+            (obj for obj in objects),
+            constraint,
+            batch_size=batch_size,
+        )
+        conn.commit()
+
+        assert [result.row_count for result in results] == expected_batch_sizes
+        assert [result.batch_number for result in results] == list(
+            range(1, len(expected_batch_sizes) + 1)
+        )
+        assert all(result.rows_per_second > 0 for result in results)
+
+        objects.sort(key=operator.attrgetter("id"))
+        assert fetch_numbers(cur, table) == objects
+
+        # Upsert again, updating the existing rows
+        for obj in objects:
+            obj.num = random.randint(1, 10000)
+        bulk_ops.bulk_upsert_stream(
+            cur, table, attributes, iter(objects), constraint, batch_size=batch_size
+        )
+        conn.commit()
+
+        assert fetch_numbers(cur, table) == objects
+
+
+def test_bulk_upsert_stream_empty(db_session: db.Session):
+    db_client = db.PostgresDBClient()
+    conn = db_client.get_raw_connection()
+
+    with conn.cursor(row_factory=rows.class_row(Number)) as cur:  # type: ignore
+        create_number_table(cur, "empty_stream_table", "empty_stream_table_pkey")
+        results = bulk_ops.bulk_upsert_stream(
+            cur, "empty_stream_table", ["id", "num"], iter([]), "empty_stream_table_pkey"
+        )
+        conn.commit()
+
+        assert results == []
+        assert fetch_numbers(cur, "empty_stream_table") == []
+
+
+@pytest.mark.parametrize("batch_size", [0, -1])
+def test_bulk_upsert_stream_invalid_batch_size(batch_size):
+    with pytest.raises(ValueError, match="Batch size must be at least 1"):
+        bulk_ops.bulk_upsert_stream(
+            None, "table", ["id"], [], "constraint", batch_size=batch_size  # type: ignore
+        )
+
+
+def test_bulk_upsert_binary(db_session: db.Session):
+    db_client = db.PostgresDBClient()
+    conn = db_client.get_raw_connection()
+
+    with conn.cursor(row_factory=rows.class_row(Number)) as cur:  # type: ignore
+        table = "binary_table"
+        attributes = ["id", "num"]
+        constraint = "binary_table_pkey"
+        create_number_table(cur, table, constraint)
+
+        objects = [get_random_number_object() for i in range(100)]
+        bulk_ops.bulk_upsert(
+            cur, table, attributes, objects, constraint, binary=True, column_types=["text", "int4"]
+        )
+        conn.commit()
+
+        objects.sort(key=operator.attrgetter("id"))
+        assert fetch_numbers(cur, table) == objects
+
+
+def test_bulk_upsert_binary_model_types(db_session: db.Session):
+    db_client = db.PostgresDBClient()
+    conn = db_client.get_raw_connection()
+
+    attributes = [
+        "id",
+        "first_name",
+        "middle_name",
+        "last_name",
+        "phone_number",
+        "date_of_birth",
+        "is_active",
+        "created_at",
+        "updated_at",
+    ]
+    now = datetime_util.utcnow()
+    users = UserFactory.build_batch(25, roles=[], created_at=now, updated_at=now)
+
+    with conn.cursor() as cur:  # type: ignore
+        results = bulk_ops.bulk_upsert_stream(
+            cur, "user", attributes, iter(users), "user_pkey", batch_size=10, binary=True
+        )
+        conn.commit()
+
+    assert sum(result.row_count for result in results) == 25
+    for user in users:
+        db_user = db_session.get(User, user.id)
+        assert db_user is not None
+        assert db_user.first_name == user.first_name
+        assert db_user.date_of_birth == user.date_of_birth
+        assert db_user.is_active == user.is_active
+        assert db_user.created_at == now
+
+
+def test_bulk_upsert_models(db_session: db.Session):
+    db_client = db.PostgresDBClient()
+    conn = db_client.get_raw_connection()
+
+    now = datetime_util.utcnow()
+    users = UserFactory.build_batch(25, roles=[], created_at=now, updated_at=now)
+
+    with conn.cursor() as cur:  # type: ignore
+        results = bulk_ops.bulk_upsert_models(cur, User, users, batch_size=10, return_counts=True)
+        conn.commit()
+
+    assert [result.row_count for result in results] == [10, 10, 5]
+    assert sum(result.inserted_count for result in results) == 25
+
+    # Update some users, keeping created_at and skipping unchanged users
+    later = datetime_util.utcnow()
+    for user in users[:5]:
+        user.first_name = "Updated"
+        user.created_at = later
+        user.updated_at = later
+
+    with conn.cursor() as cur:  # type: ignore
+        results = bulk_ops.bulk_upsert_models(
+            cur, User, users, return_counts=True, only_if_changed=True
+        )
+        conn.commit()
+
+    assert results[0].updated_count == 5
+    assert results[0].skipped_count == 20
+    for user in users:
+        db_session.expire_all()
+        db_user = db_session.get(User, user.id)
+        assert db_user is not None
+        assert db_user.first_name == user.first_name
+        assert db_user.date_of_birth == user.date_of_birth
+        assert db_user.created_at == now
+        assert db_user.updated_at == user.updated_at
+
+
+def test_bulk_upsert_models_unflushed_objects(db_session: db.Session):
+    db_client = db.PostgresDBClient()
+    conn = db_client.get_raw_connection()
+
+    # id, created_at and updated_at are only set by their defaults on flush
+    user = User(first_name="Unflushed", last_name="User", phone_number="123-456-7890")
+    user.date_of_birth = date(2000, 1, 1)
+    user.is_active = True
+    assert user.id is None and user.created_at is None
+
+    with conn.cursor() as cur:  # type: ignore
+        results = bulk_ops.bulk_upsert_models(cur, User, [user], return_counts=True)
+        conn.commit()
+
+    assert results[0].inserted_count == 1
+    assert user.id is not None
+    assert user.updated_at == user.created_at
+    db_user = db_session.get(User, user.id)
+    assert db_user is not None
+    assert db_user.first_name == "Unflushed"
+    assert db_user.created_at == user.created_at
+
+
+def test_bulk_upsert_models_unique_constraint_keeps_primary_key(monkeypatch):
+    spec = replace(
+        bulk_ops.get_model_table_spec(User),
+        unique_constraints={"user_phone_number_uniq": ("phone_number",)},
+    )
+    monkeypatch.setattr(bulk_ops, "get_model_table_spec", lambda model: spec)
+    calls = []
+    monkeypatch.setattr(
+        bulk_ops, "bulk_upsert_stream", lambda *args, **kwargs: calls.append(kwargs) or []
+    )
+
+    bulk_ops.bulk_upsert_models(None, User, [], constraint="user_phone_number_uniq")  # type: ignore
+
+    assert calls[0]["immutable_columns"] == {"phone_number", "id", "created_at"}
+
+
+def test_bulk_upsert_models_invalid_arguments():
+    cur = None  # never used, the arguments are checked first
+
+    with pytest.raises(ValueError, match="Constraint missing_key is not defined"):
+        bulk_ops.bulk_upsert_models(cur, User, [], constraint="missing_key")  # type: ignore
+    with pytest.raises(ValueError, match="Columns are not defined for table user: roles"):
+        bulk_ops.bulk_upsert_models(cur, User, [], columns=["id", "roles"])  # type: ignore
+
+
+def test_get_model_table_spec():
+    spec = bulk_ops.get_model_table_spec(User)
+
+    assert spec.table == "user"
+    assert spec.primary_key_constraint == "user_pkey"
+    assert spec.primary_key_columns == ("id",)
+    assert "id" in spec.columns
+    assert "roles" not in spec.attribute_keys
+    assert dict(zip(spec.columns, spec.column_types))["date_of_birth"] == "date"
+    assert bulk_ops.get_model_table_spec(User) is spec
+
+
+def test_bulk_upsert_session_reuses_write_query(db_session: db.Session):
+    db_client = db.PostgresDBClient()
+    conn = db_client.get_raw_connection()
+
+    with conn.cursor() as cur:  # type: ignore
+        create_number_table(cur, "query_cache_table", "query_cache_table_pkey")
+        sessions = [
+            bulk_ops.BulkUpsertSession(
+                cur, "query_cache_table", ["id", "num"], "query_cache_table_pkey"
+            )
+            for i in range(2)
+        ]
+
+    assert sessions[0]._write_query is sessions[1]._write_query
+
+
+def test_get_column_types():
+    assert bulk_ops.get_column_types("user", ["id", "first_name", "date_of_birth"]) == [
+        "uuid",
+        "text",
+        "date",
+    ]
+    assert bulk_ops.get_column_types("role", ["created_at", "type"]) == [
+        "timestamp with time zone",
+        "varchar",
+    ]
+
+
+def test_get_column_types_unknown_table_or_column():
+    with pytest.raises(ValueError, match="Table not_a_table is not defined"):
+        bulk_ops.get_column_types("not_a_table", ["id"])
+
+    with pytest.raises(ValueError, match="Column not_a_column is not defined for table user"):
+        bulk_ops.get_column_types("user", ["not_a_column"])
+
+
+def get_table_oid(cur, table: str) -> int | None:
+    cur.execute("SELECT to_regclass(%s)::oid AS oid", [f"pg_temp.{table}"])
+    return cur.fetchone()["oid"]
+
+
+def test_bulk_upsert_twice_in_one_transaction(db_session: db.Session):
+    db_client = db.PostgresDBClient()
+    conn = db_client.get_raw_connection()
+
+    with conn.cursor(row_factory=rows.class_row(Number)) as cur:  # type: ignore
+        table = "twice_table"
+        constraint = "twice_table_pkey"
+        create_number_table(cur, table, constraint)
+
+        first_objects = [get_random_number_object() for i in range(10)]
+        second_objects = [get_random_number_object() for i in range(10)]
+        bulk_ops.bulk_upsert(cur, table, ["id", "num"], first_objects, constraint)
+        bulk_ops.bulk_upsert(cur, table, ["id", "num"], second_objects, constraint)
+        conn.commit()
+
+        expected_objects = sorted(first_objects + second_objects, key=operator.attrgetter("id"))
+        assert fetch_numbers(cur, table) == expected_objects
+
+
+def test_bulk_upsert_session_reuses_staging_table(db_session: db.Session):
+    db_client = db.PostgresDBClient()
+    conn = db_client.get_raw_connection()
+    table = "session_table"
+    constraint = "session_table_pkey"
+
+    with conn.cursor(row_factory=rows.dict_row) as cur:  # type: ignore
+        create_number_table(cur, table, constraint)
+        conn.commit()
+
+        session = bulk_ops.BulkUpsertSession(cur, table, ["id", "num"], constraint)
+        for _ in range(3):
+            session.upsert([get_random_number_object() for i in range(10)])
+        conn.commit()
+
+        assert session.batch_count == 3
+        assert "temp_session_table" in bulk_ops._staging_tables[conn.driver_connection]
+        staging_table_oid = get_table_oid(cur, "temp_session_table")
+        assert staging_table_oid is not None
+
+        # A new session on the same connection uses the existing staging table
+        session = bulk_ops.BulkUpsertSession(cur, table, ["id", "num"], constraint)
+        session.upsert([get_random_number_object() for i in range(10)])
+        conn.commit()
+
+        assert get_table_oid(cur, "temp_session_table") == staging_table_oid
+        cur.execute(sql.SQL("SELECT count(*) FROM {table}").format(table=sql.Identifier(table)))
+        assert cur.fetchone()["count"] == 40
+
+
+@pytest.mark.parametrize("in_transaction", [False, True])
+def test_bulk_upsert_session_staging_table_dropped_by_reset(
+    db_session: db.Session, in_transaction: bool
+):
+    db_client = db.PostgresDBClient()
+    conn = db_client.get_raw_connection()
+    table = "reset_table"
+    constraint = "reset_table_pkey"
+
+    with conn.cursor(row_factory=rows.class_row(Number)) as cur:  # type: ignore
+        create_number_table(cur, table, constraint)
+        conn.commit()
+        session = bulk_ops.BulkUpsertSession(cur, table, ["id", "num"], constraint)
+        session.upsert([get_random_number_object() for i in range(10)])
+        conn.commit()
+        assert "temp_reset_table" in bulk_ops._staging_tables[conn.driver_connection]
+
+        # Drop the temp tables of the connection, as DISCARD ALL does when a pool
+        # resets a connection. The test table is a temp table too, so create it again.
+        cur.execute("DISCARD TEMP")
+        create_number_table(cur, table, constraint)
+        conn.commit()
+
+        earlier_object = get_random_number_object()
+        if in_transaction:
+            cur.execute(
+                sql.SQL("INSERT INTO {table} (id, num) VALUES (%s, %s)").format(
+                    table=sql.Identifier(table)
+                ),
+                [earlier_object.id, earlier_object.num],
+            )
+        objects = [get_random_number_object() for i in range(10)]
+        session = bulk_ops.BulkUpsertSession(cur, table, ["id", "num"], constraint)
+        result = session.upsert(objects)
+        conn.commit()
+
+        assert result.row_count == 10
+        # The caller's transaction is kept
+        assert (earlier_object in fetch_numbers(cur, table)) == in_transaction
+        assert ("temp_reset_table" in bulk_ops._staging_tables[conn.driver_connection]) != (
+            in_transaction
+        )
+
+
+def test_bulk_upsert_session_in_rolled_back_transaction(db_session: db.Session):
+    db_client = db.PostgresDBClient()
+    conn = db_client.get_raw_connection()
+    table = "rollback_table"
+    constraint = "rollback_table_pkey"
+
+    with conn.cursor(row_factory=rows.class_row(Number)) as cur:  # type: ignore
+        create_number_table(cur, table, constraint)
+        conn.commit()
+
+        # The staging table is created within an open transaction
+        # so it isn't tracked, because it is dropped by the rollback
+        cur.execute("SELECT 1")
+        session = bulk_ops.BulkUpsertSession(cur, table, ["id", "num"], constraint)
+        session.upsert([get_random_number_object() for i in range(10)])
+        assert "temp_rollback_table" not in bulk_ops._staging_tables[conn.driver_connection]
+        conn.rollback()
+
+        objects = [get_random_number_object() for i in range(10)]
+        session = bulk_ops.BulkUpsertSession(cur, table, ["id", "num"], constraint)
+        session.upsert(objects)
+        conn.commit()
+
+        objects.sort(key=operator.attrgetter("id"))
+        assert fetch_numbers(cur, table) == objects
+
+
+@pytest.mark.parametrize(
+    "to_input",
+    [
+        pytest.param(lambda objects: [(obj.id, obj.num) for obj in objects], id="tuples"),
+        pytest.param(lambda objects: [[obj.id, obj.num] for obj in objects], id="lists"),
+        pytest.param(
+            lambda objects: [{"num": obj.num, "id": obj.id} for obj in objects], id="dicts"
+        ),
+        pytest.param(
+            lambda objects: {
+                "id": [obj.id for obj in objects],
+                "num": [obj.num for obj in objects],
+            },
+            id="columnar",
+        ),
+    ],
+)
+def test_bulk_upsert_row_shapes(db_session: db.Session, to_input):
+    db_client = db.PostgresDBClient()
+    conn = db_client.get_raw_connection()
+
+    with conn.cursor(row_factory=rows.class_row(Number)) as cur:  # type: ignore
+        table = "shapes_table"
+        constraint = "shapes_table_pkey"
+        create_number_table(cur, table, constraint)
+
+        objects = [get_random_number_object() for i in range(25)]
+        bulk_ops.bulk_upsert(cur, table, ["id", "num"], to_input(objects), constraint)
+        conn.commit()
+        objects.sort(key=operator.attrgetter("id"))
+        assert fetch_numbers(cur, table) == objects
+
+        # Columnar input is also split into batches when streaming
+        for obj in objects:
+            obj.num = random.randint(1, 10000)
+        results = bulk_ops.bulk_upsert_stream(
+            cur, table, ["id", "num"], to_input(objects), constraint, batch_size=10
+        )
+        conn.commit()
+        assert [result.row_count for result in results] == [10, 10, 5]
+        assert fetch_numbers(cur, table) == objects
+
+
+def test_iter_rows_single_column():
+    assert list(bulk_ops._iter_rows([Number(id="1", num=1)], ["id"])) == [("1",)]
+    assert list(bulk_ops._iter_rows([{"id": "1"}], ["id"])) == [("1",)]
+    assert list(bulk_ops._iter_rows({"id": ["1", "2"]}, ["id"])) == [("1",), ("2",)]
+
+
+def test_iter_rows_invalid_columnar_data():
+    with pytest.raises(ValueError, match="Columnar data is missing columns: num"):
+        bulk_ops._iter_rows({"id": ["1"]}, ["id", "num"])
+
+    with pytest.raises(ValueError, match="Columnar data has columns of different lengths"):
+        bulk_ops._iter_rows({"id": ["1", "2"], "num": [1]}, ["id", "num"])
+
+
+def test_bulk_upsert_return_counts(db_session: db.Session):
+    db_client = db.PostgresDBClient()
+    conn = db_client.get_raw_connection()
+
+    with conn.cursor(row_factory=rows.class_row(Number)) as cur:  # type: ignore
+        table = "counts_table"
+        constraint = "counts_table_pkey"
+        create_number_table(cur, table, constraint)
+
+        objects = [get_random_number_object() for i in range(30)]
+        result = bulk_ops.bulk_upsert(
+            cur, table, ["id", "num"], objects, constraint, return_counts=True
+        )
+        conn.commit()
+        assert result.row_count == 30
+        assert result.inserted_count == 30
+        assert result.updated_count == 0
+        assert result.skipped_count == 0
+        assert result.inserted_keys is None
+
+        # Change 10 of the objects, leave 20 unchanged, and add 5 new objects.
+        # Only rows whose num changed are updated, the rest are skipped.
+        for obj in objects[:10]:
+            obj.num = -obj.num
+        new_objects = [get_random_number_object() for i in range(5)]
+        result = bulk_ops.bulk_upsert(
+            cur,
+            table,
+            ["id", "num"],
+            objects + new_objects,
+            constraint,
+            update_condition=sql.SQL("WHERE {table}.num IS DISTINCT FROM EXCLUDED.num").format(
+                table=sql.Identifier(table)
+            ),
+            return_keys=["id"],
+        )
+        conn.commit()
+        assert result.row_count == 35
+        assert result.inserted_count == 5
+        assert result.updated_count == 10
+        assert result.skipped_count == 20
+        assert sorted(result.inserted_keys) == sorted((obj.id,) for obj in new_objects)
+        assert sorted(result.updated_keys) == sorted((obj.id,) for obj in objects[:10])
+
+
+def test_bulk_upsert_stream_return_counts(db_session: db.Session):
+    db_client = db.PostgresDBClient()
+    conn = db_client.get_raw_connection()
+
+    with conn.cursor(row_factory=rows.class_row(Number)) as cur:  # type: ignore
+        table = "stream_counts_table"
+        constraint = "stream_counts_table_pkey"
+        create_number_table(cur, table, constraint)
+
+        objects = [get_random_number_object() for i in range(20)]
+        bulk_ops.bulk_upsert(cur, table, ["id", "num"], objects[:10], constraint)
+
+        results = bulk_ops.bulk_upsert_stream(
+            cur, table, ["id", "num"], objects, constraint, batch_size=10, return_counts=True
+        )
+        conn.commit()
+        assert [(r.inserted_count, r.updated_count) for r in results] == [(0, 10), (10, 0)]
+
+
+def test_bulk_delete(db_session: db.Session):
+    db_client = db.PostgresDBClient()
+    conn = db_client.get_raw_connection()
+
+    with conn.cursor(row_factory=rows.class_row(Number)) as cur:  # type: ignore
+        table = "delete_table"
+        constraint = "delete_table_pkey"
+        create_number_table(cur, table, constraint)
+
+        objects = [get_random_number_object() for i in range(30)]
+        bulk_ops.bulk_upsert(cur, table, ["id", "num"], objects, constraint)
+        conn.commit()
+
+        deleted_count = bulk_ops.bulk_delete(
+            cur, table, ["id"], [(obj.id,) for obj in objects[:10]] + [("not-an-id",)]
+        )
+        conn.commit()
+        assert deleted_count == 10
+
+        # Deleting again on the same connection reuses the key staging table
+        deleted_count = bulk_ops.bulk_delete(cur, table, ["id"], {"id": [objects[10].id]})
+        conn.commit()
+        assert deleted_count == 1
+
+        assert fetch_numbers(cur, table) == sorted(objects[11:], key=operator.attrgetter("id"))
+
+
+def test_bulk_sync(db_session: db.Session):
+    db_client = db.PostgresDBClient()
+    conn = db_client.get_raw_connection()
+
+    with conn.cursor(row_factory=rows.class_row(Number)) as cur:  # type: ignore
+        table = "sync_table"
+        constraint = "sync_table_pkey"
+        create_number_table(cur, table, constraint)
+
+        objects = [get_random_number_object() for i in range(30)]
+        bulk_ops.bulk_upsert(cur, table, ["id", "num"], objects, constraint)
+        conn.commit()
+
+        # The new snapshot drops 10 objects, changes 10 and adds 5
+        for obj in objects[10:20]:
+            obj.num = -obj.num
+        snapshot = objects[10:] + [get_random_number_object() for i in range(5)]
+        result = bulk_ops.bulk_sync(
+            cur, table, ["id", "num"], snapshot, constraint, ["id"], return_counts=True
+        )
+        conn.commit()
+
+        assert result.inserted_count == 5
+        assert result.updated_count == 20
+        assert result.deleted_count == 10
+        assert fetch_numbers(cur, table) == sorted(snapshot, key=operator.attrgetter("id"))
+
+        # Only rows matching the delete condition are removed when missing
+        result = bulk_ops.bulk_sync(
+            cur,
+            table,
+            ["id", "num"],
+            [],
+            constraint,
+            ["id"],
+            delete_condition=sql.SQL("num < 0"),
+        )
+        conn.commit()
+
+        assert result.deleted_count == 10
+        assert fetch_numbers(cur, table) == sorted(
+            [obj for obj in snapshot if obj.num >= 0], key=operator.attrgetter("id")
+        )
+
+
+def test_bulk_sync_key_columns_not_in_attributes():
+    with pytest.raises(ValueError, match="Key columns are missing from attributes: id"):
+        bulk_ops.bulk_sync(None, "table", ["num"], [], "constraint", ["id"])  # type: ignore
+
+
+def test_bulk_upsert_only_if_changed(db_session: db.Session):
+    db_client = db.PostgresDBClient()
+    conn = db_client.get_raw_connection()
+
+    with conn.cursor(row_factory=rows.class_row(Number)) as cur:  # type: ignore
+        table = "changed_table"
+        constraint = "changed_table_pkey"
+        create_number_table(cur, table, constraint)
+
+        objects = [get_random_number_object() for i in range(20)]
+        bulk_ops.bulk_upsert(cur, table, ["id", "num"], objects, constraint)
+        conn.commit()
+
+        for obj in objects[:5]:
+            obj.num = -obj.num
+        result = bulk_ops.bulk_upsert(
+            cur,
+            table,
+            ["id", "num"],
+            objects,
+            constraint,
+            only_if_changed=True,
+            return_keys=["id"],
+        )
+        conn.commit()
+
+        assert result.updated_count == 5
+        assert result.skipped_count == 15
+        assert sorted(result.updated_keys) == sorted((obj.id,) for obj in objects[:5])
+        assert fetch_numbers(cur, table) == sorted(objects, key=operator.attrgetter("id"))
+
+
+def test_bulk_upsert_immutable_columns(db_session: db.Session):
+    db_client = db.PostgresDBClient()
+    conn = db_client.get_raw_connection()
+
+    with conn.cursor(row_factory=rows.class_row(Number)) as cur:  # type: ignore
+        table = "immutable_table"
+        constraint = "immutable_table_pkey"
+        create_number_table(cur, table, constraint)
+
+        objects = [get_random_number_object() for i in range(10)]
+        bulk_ops.bulk_upsert(cur, table, ["id", "num"], objects, constraint)
+        conn.commit()
+        original_objects = sorted(objects, key=operator.attrgetter("id"))
+
+        # With every column immutable, conflicting rows are left as they are
+        changed_objects = [Number(id=obj.id, num=-obj.num) for obj in objects]
+        new_object = get_random_number_object()
+        result = bulk_ops.bulk_upsert(
+            cur,
+            table,
+            ["id", "num"],
+            changed_objects + [new_object],
+            constraint,
+            immutable_columns={"id", "num"},
+            return_counts=True,
+        )
+        conn.commit()
+
+        assert result.inserted_count == 1
+        assert result.updated_count == 0
+        assert result.skipped_count == 10
+        assert fetch_numbers(cur, table) == sorted(
+            original_objects + [new_object], key=operator.attrgetter("id")
+        )
+
+
+def test_bulk_upsert_only_if_changed_with_update_condition():
+    with pytest.raises(ValueError, match="Cannot use both only_if_changed and an update_condition"):
+        bulk_ops.BulkUpsertSession(
+            None,  # type: ignore
+            "table",
+            ["id", "num"],
+            "constraint",
+            update_condition=sql.SQL("WHERE num > 0"),
+            only_if_changed=True,
+        )
+
+
+@pytest.fixture
+def parallel_table(db_client: db.DBClient):
+    # The table is shared by every partition's connection, so it can't be a temp table
+    table = "parallel_table"
+    with db_client.get_connection() as conn, conn.begin():
+        conn.exec_driver_sql(
+            f"CREATE TABLE {table} (id TEXT NOT NULL, num INT CHECK (num >= 0),"
+            f" CONSTRAINT {table}_pkey PRIMARY KEY (id))"
+        )
+    yield table
+    with db_client.get_connection() as conn, conn.begin():
+        conn.exec_driver_sql(f"DROP TABLE {table}")
+
+
+def fetch_parallel_table(db_client: db.DBClient, table: str) -> list[Number]:
+    conn = db_client.get_raw_connection()
+    try:
+        with conn.cursor(row_factory=rows.class_row(Number)) as cur:  # type: ignore
+            return fetch_numbers(cur, table)
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("commit_mode", list(bulk_ops.CommitMode))
+def test_parallel_bulk_upsert(db_client, parallel_table, commit_mode):
+    objects = [get_random_number_object() for i in range(1000)]
+    results = bulk_ops.parallel_bulk_upsert(
+        db_client,
+        parallel_table,
+        ["id", "num"],
+        iter(objects),
+        f"{parallel_table}_pkey",
+        ["id"],
+        partition_count=4,
+        batch_size=100,
+        commit_mode=commit_mode,
+        return_counts=True,
+    )
+
+    assert {result.partition_number for result in results} == {0, 1, 2, 3}
+    assert sum(result.row_count for result in results) == 1000
+    assert sum(result.inserted_count for result in results) == 1000
+
+    assert fetch_parallel_table(db_client, parallel_table) == sorted(
+        objects, key=operator.attrgetter("id")
+    )
+
+
+def test_parallel_bulk_upsert_all_or_nothing_rolls_back(db_client, parallel_table):
+    objects = [get_random_number_object() for i in range(1000)]
+    objects[500].num = -1
+
+    with pytest.raises(psycopg.errors.CheckViolation):
+        bulk_ops.parallel_bulk_upsert(
+            db_client,
+            parallel_table,
+            ["id", "num"],
+            objects,
+            f"{parallel_table}_pkey",
+            ["id"],
+            partition_count=4,
+            batch_size=100,
+            commit_mode=bulk_ops.CommitMode.ALL_OR_NOTHING,
+        )
+
+    assert fetch_parallel_table(db_client, parallel_table) == []
+
+
+@pytest.mark.parametrize("commit_mode", list(bulk_ops.CommitMode))
+def test_parallel_bulk_upsert_invalid_input_rolls_back(db_client, parallel_table, commit_mode):
+    # No partition has all of its rows, so none of the rows read are committed
+    def generate_objects():
+        yield from [get_random_number_object() for i in range(100)]
+        raise RuntimeError("failed to read input")
+
+    with pytest.raises(RuntimeError, match="failed to read input"):
+        bulk_ops.parallel_bulk_upsert(
+            db_client,
+            parallel_table,
+            ["id", "num"],
+            generate_objects(),
+            f"{parallel_table}_pkey",
+            ["id"],
+            batch_size=10,
+            commit_mode=commit_mode,
+        )
+
+    assert fetch_parallel_table(db_client, parallel_table) == []
@@ -0,0 +1,249 @@
+"""Benchmarks for the bulk_ops module
+
+These are excluded from `make test`, run them with `make test-benchmark`.
+
+Each benchmark loads a number of rows into a table of a number of columns,
+for each combination of ROW_COUNTS and COLUMN_COUNTS, using each of the
+LOAD_METHODS. The tables are created in the isolated schema of the test
+session, so the benchmarks can be run against the local Postgres container.
+
+The timings are written as JSON to the file named by the
+BENCHMARK_RESULTS_FILE environment variable, which defaults to
+bulk_ops_benchmark_results.json, so that regressions can be tracked.
+"""
+import contextlib
+import json
+import logging
+import os
+import platform
+import time
+import uuid
+from typing import Any
+
+import pytest
+import sqlalchemy
+from psycopg import sql
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import DeclarativeBase
+
+import src.adapters.db as db
+from src.db import bulk_ops
+from src.util import datetime_util
+
+logger = logging.getLogger(__name__)
+
+ROW_COUNTS = [1_000, 10_000, 50_000]
+COLUMN_COUNTS = [4, 16, 64]
+LOAD_METHODS = [
+    "orm_add_all",
+    "executemany",
+    "copy_text",
+    "bulk_upsert_insert",
+    "bulk_upsert_insert_binary",
+    "bulk_upsert_update",
+]
+
+DEFAULT_RESULTS_FILE = "bulk_ops_benchmark_results.json"
+
+# The columns of the benchmark tables after the id column cycle through
+# these types, to mix fixed width and variable width values
+COLUMN_TYPES: list[tuple[sqlalchemy.types.TypeEngine, str]] = [
+    (sqlalchemy.Text(), "text"),
+    (sqlalchemy.BigInteger(), "int8"),
+    (sqlalchemy.TIMESTAMP(timezone=True), "timestamptz"),
+    (sqlalchemy.Boolean(), "bool"),
+]
+
+
+class BenchmarkBase(DeclarativeBase):
+    # Kept apart from the application metadata so that the benchmark tables
+    # are not part of the application schema
+    metadata = sqlalchemy.MetaData()
+
+
+def get_table_name(column_count: int) -> str:
+    return f"bulk_ops_benchmark_{column_count}"
+
+
+def get_column_names(column_count: int) -> list[str]:
+    return ["id"] + [f"col_{i}" for i in range(1, column_count)]
+
+
+def get_column_type_names(column_count: int) -> list[str]:
+    return ["uuid"] + [COLUMN_TYPES[i % len(COLUMN_TYPES)][1] for i in range(1, column_count)]
+
+
+def create_benchmark_model(column_count: int) -> type[BenchmarkBase]:
+    table = get_table_name(column_count)
+    return type(
+        f"BulkOpsBenchmark{column_count}",
+        (BenchmarkBase,),
+        {
+            "__table__": sqlalchemy.Table(
+                table,
+                BenchmarkBase.metadata,
+                sqlalchemy.Column("id", postgresql.UUID(as_uuid=True)),
+                *[
+                    sqlalchemy.Column(f"col_{i}", COLUMN_TYPES[i % len(COLUMN_TYPES)][0])
+                    for i in range(1, column_count)
+                ],
+                sqlalchemy.PrimaryKeyConstraint("id", name=f"{table}_pkey"),
+            )
+        },
+    )
+
+
+# A mapped class for each column count, for the ORM benchmarks
+BENCHMARK_MODELS = {
+    column_count: create_benchmark_model(column_count) for column_count in COLUMN_COUNTS
+}
+
+
+def make_rows(row_count: int, column_count: int) -> list[tuple[Any, ...]]:
+    now = datetime_util.utcnow()
+    return [
+        (
+            uuid.uuid4(),
+            *[
+                [f"a value of a text column {i}", i, now, i % 2 == 0][j % len(COLUMN_TYPES)]
+                for j in range(1, column_count)
+            ],
+        )
+        for i in range(row_count)
+    ]
+
+
+def load_orm_add_all(
+    db_client: db.DBClient, column_count: int, rows: list[tuple[Any, ...]]
+) -> None:
+    model = BENCHMARK_MODELS[column_count]
+    columns = get_column_names(column_count)
+    with db_client.get_session() as session, session.begin():
+        session.add_all(model(**dict(zip(columns, row))) for row in rows)
+
+
+def load_executemany(
+    db_client: db.DBClient, column_count: int, rows: list[tuple[Any, ...]]
+) -> None:
+    columns = get_column_names(column_count)
+    query = sql.SQL("INSERT INTO {table} ({columns}) VALUES ({values})").format(
+        table=sql.Identifier(get_table_name(column_count)),
+        columns=sql.SQL(",").join(map(sql.Identifier, columns)),
+        values=sql.SQL(",").join(sql.Placeholder() * len(columns)),
+    )
+    with contextlib.closing(db_client.get_raw_connection()) as conn, conn.cursor() as cur:
+        cur.executemany(query, rows)
+        conn.commit()
+
+
+def load_copy_text(db_client: db.DBClient, column_count: int, rows: list[tuple[Any, ...]]) -> None:
+    query = sql.SQL("COPY {table} ({columns}) FROM STDIN").format(
+        table=sql.Identifier(get_table_name(column_count)),
+        columns=sql.SQL(",").join(map(sql.Identifier, get_column_names(column_count))),
+    )
+    with contextlib.closing(db_client.get_raw_connection()) as conn, conn.cursor() as cur:
+        with cur.copy(query) as copy:
+            for row in rows:
+                copy.write_row(row)
+        conn.commit()
+
+
+def load_bulk_upsert(
+    db_client: db.DBClient, column_count: int, rows: list[tuple[Any, ...]], binary: bool = False
+) -> None:
+    table = get_table_name(column_count)
+    with contextlib.closing(db_client.get_raw_connection()) as conn, conn.cursor() as cur:
+        bulk_ops.bulk_upsert_stream(
+            cur,
+            table,
+            get_column_names(column_count),
+            rows,
+            f"{table}_pkey",
+            binary=binary,
+            column_types=get_column_type_names(column_count),
+        )
+        conn.commit()
+
+
+@pytest.fixture(scope="module")
+def benchmark_tables(db_client: db.DBClient):
+    with db_client.get_connection() as conn, conn.begin():
+        BenchmarkBase.metadata.create_all(bind=conn)
+    yield
+    with db_client.get_connection() as conn, conn.begin():
+        BenchmarkBase.metadata.drop_all(bind=conn)
+
+
+@pytest.fixture(scope="module")
+def benchmark_results(db_client: db.DBClient):
+    """Collect benchmark results and write them to a JSON file."""
+    results: list[dict[str, Any]] = []
+    yield results
+
+    with db_client.get_connection() as conn:
+        postgres_version = conn.exec_driver_sql("SHOW server_version").scalar()
+
+    results_file = os.environ.get("BENCHMARK_RESULTS_FILE", DEFAULT_RESULTS_FILE)
+    with open(results_file, "w") as f:
+        json.dump(
+            {
+                "benchmark": "bulk_ops",
+                "created_at": datetime_util.utcnow().isoformat(),
+                "python_version": platform.python_version(),
+                "postgres_version": postgres_version,
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+    logger.info("wrote benchmark results to %s", results_file)
+
+
+def truncate_table(db_client: db.DBClient, column_count: int) -> None:
+    with db_client.get_connection() as conn, conn.begin():
+        conn.exec_driver_sql(f"TRUNCATE {get_table_name(column_count)}")
+
+
+def count_rows(db_client: db.DBClient, column_count: int) -> int:
+    with db_client.get_connection() as conn:
+        return conn.exec_driver_sql(f"SELECT count(*) FROM {get_table_name(column_count)}").scalar()
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("column_count", COLUMN_COUNTS)
+@pytest.mark.parametrize("row_count", ROW_COUNTS)
+@pytest.mark.parametrize("method", LOAD_METHODS)
+def test_benchmark_bulk_load(
+    db_client: db.DBClient, benchmark_tables, benchmark_results, method, row_count, column_count
+):
+    truncate_table(db_client, column_count)
+    rows = make_rows(row_count, column_count)
+
+    if method == "bulk_upsert_update":
+        # Time updating every row, rather than inserting
+        load_copy_text(db_client, column_count, rows)
+
+    start_time = time.perf_counter()
+    if method == "orm_add_all":
+        load_orm_add_all(db_client, column_count, rows)
+    elif method == "executemany":
+        load_executemany(db_client, column_count, rows)
+    elif method == "copy_text":
+        load_copy_text(db_client, column_count, rows)
+    elif method == "bulk_upsert_insert_binary":
+        load_bulk_upsert(db_client, column_count, rows, binary=True)
+    else:
+        load_bulk_upsert(db_client, column_count, rows)
+    elapsed_seconds = time.perf_counter() - start_time
+
+    assert count_rows(db_client, column_count) == row_count
+
+    result = {
+        "method": method,
+        "row_count": row_count,
+        "column_count": column_count,
+        "elapsed_seconds": round(elapsed_seconds, 4),
+        "rows_per_second": round(row_count / elapsed_seconds),
+    }
+    benchmark_results.append(result)
+    logger.info("bulk load benchmark", extra=result)
@@ -1,9 +1,29 @@
+import pytest
+
 import src.adapters.db as db
+import src.api.healthcheck as healthcheck
+
+
+@pytest.fixture
+def enable_db_pool_stats(monkeypatch):
+    monkeypatch.setenv("HEALTHCHECK_INCLUDE_DB_POOL_STATS", "true")
+    healthcheck.get_healthcheck_config.cache_clear()
+    yield
+    healthcheck.get_healthcheck_config.cache_clear()
 
 
 def test_get_healthcheck_200(client):
     response = client.get("/health")
     assert response.status_code == 200
+    assert response.get_json()["data"] == {}
+
+
+def test_get_healthcheck_db_pool_stats(client, enable_db_pool_stats):
+    response = client.get("/health")
+    assert response.status_code == 200
+    db_pool = response.get_json()["data"]["db_pool"]
+    assert db_pool["checkouts"] >= 1
+    assert db_pool["checked_out"] == 0
 
 
 def test_get_healthcheck_503_db_bad_state(client, monkeypatch):
@@ -334,6 +334,102 @@ def test_search_user(
     assert resorted_users == searched_users
 
 
+@pytest.mark.parametrize("order_by", ["id", "created_at"])
+def test_search_user_with_cursor(client, api_auth_token, setup_search_user_test, order_by):
+    # This test relies on the users created in setup_search_user_test
+    search_request = get_search_request(page_size=2, order_by=order_by)
+    resp = client.post("/v1/users/search", json=search_request, headers={"X-Auth": api_auth_token})
+    offset_user_ids = [user["id"] for user in resp.get_json()["data"]]
+
+    searched_user_ids = []
+    cursor = None
+    while True:
+        search_request = get_search_request(page_size=2, order_by=order_by)
+        if cursor is not None:
+            del search_request["paging"]["page_offset"]
+            search_request["paging"]["cursor"] = cursor
+        resp = client.post(
+            "/v1/users/search", json=search_request, headers={"X-Auth": api_auth_token}
+        )
+        assert resp.status_code == 200
+
+        search_response = resp.get_json()
+        searched_user_ids.extend(user["id"] for user in search_response["data"])
+        assert search_response["pagination_info"]["total_records"] == 5
+        if cursor is not None:
+            assert search_response["pagination_info"]["page_offset"] is None
+
+        cursor = search_response["pagination_info"]["next_cursor"]
+        if cursor is None:
+            break
+
+    assert len(searched_user_ids) == 5
+    assert len(set(searched_user_ids)) == 5
+    assert searched_user_ids[:2] == offset_user_ids
+
+
+@pytest.mark.parametrize(
+    "total_records_mode,page_offset,expected_total_records,expected_approximate",
+    [
+        ("exact", 2, 5, False),
+        ("with_page", 2, 5, False),
+        ("with_page", 4, 5, False),
+        ("first_page", 1, 5, False),
+        ("first_page", 2, None, False),
+        ("none", 1, None, False),
+    ],
+)
+def test_search_user_total_records_mode(
+    client,
+    api_auth_token,
+    setup_search_user_test,
+    total_records_mode,
+    page_offset,
+    expected_total_records,
+    expected_approximate,
+):
+    search_request = get_search_request(page_size=2, page_offset=page_offset)
+    search_request["paging"]["total_records_mode"] = total_records_mode
+    resp = client.post("/v1/users/search", json=search_request, headers={"X-Auth": api_auth_token})
+    assert resp.status_code == 200
+
+    search_response = resp.get_json()
+    # 5 users in pages of 2
+    assert len(search_response["data"]) == min(2, max(0, 5 - 2 * (page_offset - 1)))
+    pagination_info = search_response["pagination_info"]
+    assert pagination_info["total_records"] == expected_total_records
+    assert pagination_info["total_records_approximate"] == expected_approximate
+
+
+def test_search_user_total_records_estimate(client, api_auth_token, setup_search_user_test):
+    search_request = get_search_request()
+    search_request["paging"]["total_records_mode"] = "estimate"
+    resp = client.post("/v1/users/search", json=search_request, headers={"X-Auth": api_auth_token})
+    assert resp.status_code == 200
+
+    pagination_info = resp.get_json()["pagination_info"]
+    assert pagination_info["total_records_approximate"] is True
+    assert isinstance(pagination_info["total_records"], int)
+
+
+def test_search_user_invalid_cursor(client, api_auth_token):
+    search_request = get_search_request()
+    del search_request["paging"]["page_offset"]
+    search_request["paging"]["cursor"] = "not a cursor"
+    resp = client.post("/v1/users/search", json=search_request, headers={"X-Auth": api_auth_token})
+
+    assert resp.status_code == 422
+    assert resp.get_json()["message"] == "Invalid cursor"
+
+
+def test_search_user_page_offset_and_cursor(client, api_auth_token):
+    search_request = get_search_request()
+    search_request["paging"]["cursor"] = "a cursor"
+    resp = client.post("/v1/users/search", json=search_request, headers={"X-Auth": api_auth_token})
+
+    assert resp.status_code == 422
+
+
 test_unauthorized_data = [
     pytest.param("post", "/v1/users", get_base_request(), id="post"),
     pytest.param("get", f"/v1/users/{uuid.uuid4()}", None, id="get"),